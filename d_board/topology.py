@@ -0,0 +1,31 @@
+""" Static layout of one player's half of the board.
+
+Each half is a triangle of three rows fanning out from the player's
+own node at (0, 0): row 0 has one node, row 1 has three and row 2 has
+five, with x running from -row to +row. The layout never changes, so
+the engine indexes nodes by position in NODES instead of building
+"row_x" strings. """
+
+
+ROWS = 3
+
+# every (row, x) on one half of the board, in the same row-major order
+# the engine has always walked the board in
+NODES = tuple([(row, x) for row in range(ROWS) for x in range(-row, row + 1)])
+
+NUM_NODES = len(NODES)
+
+# "row_x" keys used by the dict/JSON representation of a board
+NODE_KEYS = tuple(["%s_%s" % node for node in NODES])
+
+NODE_INDEX = dict([(node, i) for i, node in enumerate(NODES)])
+
+KEY_INDEX = dict([(key, i) for i, key in enumerate(NODE_KEYS)])
+
+
+def node_index(row, x):
+    return NODE_INDEX[(int(row), int(x))]
+
+
+def node_key(row, x):
+    return NODE_KEYS[node_index(row, x)]
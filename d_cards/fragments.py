@@ -0,0 +1,156 @@
+""" Card json, encoded once per card generation.
+
+The card library (get_all_cards_sorted) and Card.json() used to run
+every card through django's serializer on every request, and the
+library then encoded all of that a second time, as strings inside its
+own json. Cards only change when somebody edits one, and then the card
+generation (see d_cards.models) changes too, so here each card is
+serialized once per generation, and kept both as it is and as it looks
+inside a json string. Responses are put together by joining those up,
+and only the parts that differ from request to request get encoded.
+
+Like d_game.catalog, the fragments are kept in-process and in memcache,
+both tagged with the generation they were built from. """
+
+import time
+
+import simplejson
+
+from django.core import serializers
+from django.core.cache import cache
+
+
+# how long (in seconds) the in-process fragments trust their generation
+# before asking memcache again
+CHECK_INTERVAL = 5
+
+# they can always be rebuilt from the datastore
+CACHE_TIMEOUT = 60 * 60
+
+# the library's category for anything that isn't a basic summon
+EFFECTS = "effects"
+
+
+def category(card):
+    ''' where the library files card: basic summons by attack type, and
+    everything else together '''
+
+    if (card.defense > 0 and card.target_alignment == "friendly" and card.target_occupant == "empty"
+            and card.target_aiming == "chosen"):
+        return card.attack_type
+    return EFFECTS
+
+
+def serialize(card):
+    ''' the card as the serializer writes it inside a list, without the
+    brackets '''
+    return serializers.serialize("json", [card])[1:-1]
+
+
+class CardFragments(object):
+
+    def __init__(self, generation, rows):
+        self.generation = generation
+
+        # (pk, category, json, json as the inside of a json string), in
+        # datastore order
+        self.rows = rows
+
+        # pk -> json
+        self.json = {}
+        for pk, category, json, quoted in rows:
+            self.json[pk] = json
+
+    def get(self, pk):
+        return self.json.get(pk)
+
+    def sorted_json(self):
+        ''' what get_all_cards_sorted sends: a list of { category, cards },
+        where cards is the serializer's json for the category's cards, as
+        a string '''
+
+        organized = {}
+        for pk, category, json, quoted in self.rows:
+            try: organized[category]
+            except KeyError: organized[category] = []
+
+            organized[category].append(quoted)
+
+        return "[%s]" % ", ".join(['{"category": %s, "cards": "[%s]"}' % (simplejson.dumps(category), ", ".join(cards))
+                for category, cards in organized.items()])
+
+    def to_cache(self):
+        return self.rows
+
+    def from_cache(generation, rows):
+        return CardFragments(generation, rows)
+
+    from_cache = staticmethod(from_cache)
+
+    def from_models(generation, cards):
+
+        rows = []
+        for card in cards:
+            json = serialize(card)
+            rows.append((card.pk, category(card), json, simplejson.dumps(json)[1:-1]))
+
+        return CardFragments(generation, rows)
+
+    from_models = staticmethod(from_models)
+
+
+def cache_key(generation):
+    return "card_fragments_%s" % generation
+
+
+# the in-process tier
+_fragments = None
+_checked = 0
+
+
+def get_fragments():
+    ''' the current fragments, from whichever tier has them '''
+
+    global _fragments, _checked
+
+    now = time.time()
+    if _fragments is not None and now - _checked < CHECK_INTERVAL:
+        return _fragments
+
+    from d_cards.models import Card, card_generation
+
+    generation = card_generation()
+    _checked = now
+
+    if _fragments is not None and _fragments.generation == generation:
+        return _fragments
+
+    rows = cache.get(cache_key(generation))
+    if rows is not None:
+        _fragments = CardFragments.from_cache(generation, rows)
+    else:
+        _fragments = CardFragments.from_models(generation, Card.objects.all())
+        cache.set(cache_key(generation), _fragments.to_cache(), CACHE_TIMEOUT)
+
+    return _fragments
+
+
+def reset():
+    ''' forget the in-process fragments, e.g. after a card's saved '''
+
+    global _fragments, _checked
+    _fragments = None
+    _checked = 0
+
+
+def card_json(card):
+    ''' Card.json(): the serializer's json for a list of just card.
+    cards that haven't been saved, or have been changed since, are
+    serialized there and then '''
+
+    json = None
+    if card.pk is not None and not card.is_modified():
+        json = get_fragments().get(card.pk)
+    if json is None:
+        json = serialize(card)
+    return "[%s]" % json
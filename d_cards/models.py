@@ -4,11 +4,10 @@ import simplejson
 
 from django import forms
 from django.db import models
-from django.core import serializers
 from django.core.cache import cache
 from django.contrib import admin
 from djangotoolbox.fields import ListField, BlobField
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete, post_init
 
 from card_builder.models import CardImage
 
@@ -126,7 +125,16 @@ class Card(models.Model):
 
 
     def json(self):
-        return "%s" % serializers.serialize("json", [self])
+        # encoded once per card generation, see d_cards.fragments, unless
+        # this instance isn't the card as it's saved
+        from d_cards.fragments import card_json
+        return card_json(self)
+
+
+    def is_modified(self):
+        ''' whether this instance has been changed, or never saved,
+        since it came from the datastore '''
+        return self._state.adding or field_values(self) != self._saved_values
 
 
     def __unicode__(self):
@@ -226,6 +234,97 @@ def set_tooltip(sender, instance, raw, **kwargs):
 pre_save.connect(set_tooltip, sender=Card)
 
 
+# Anything derived from the card table (e.g. d_game.catalog) is tagged
+# with the card generation it was built from, and the generation
+# changes whenever a card does, which retires all of it at once.
+
+class Generation(models.Model):
+    """ A counter that only goes up, e.g. the card generation. It's
+    read through memcache, but kept here so that memcache letting it go
+    doesn't change it. """
+
+    name = models.CharField(max_length=100, primary_key=True)
+
+    value = models.IntegerField(default=0)
+
+
+def get_generation(name):
+
+    generation = cache.get(name)
+    if not generation:
+        # evicted or never set. the datastore has the last one handed out
+        generations = Generation.objects.filter(name=name)[:1]
+        if not generations:
+            return next_generation(name)
+
+        generation = generations[0].value
+        cache.set(name, generation, 0)
+    return generation
+
+
+def next_generation(name):
+
+    from utils.util import run_in_transaction
+
+    def increment():
+        generations = Generation.objects.filter(name=name)[:1]
+        value = 1
+        if generations:
+            value = generations[0].value + 1
+        Generation(name=name, value=value).save()
+        return value
+
+    generation = run_in_transaction(increment)
+
+    # anyone after the old one reads this one back from the datastore
+    cache.delete(name)
+    return generation
+
+
+CARD_GENERATION_KEY = "card_generation"
+
+
+def card_generation():
+    return get_generation(CARD_GENERATION_KEY)
+
+
+def new_card_generation():
+    return next_generation(CARD_GENERATION_KEY)
+
+
+def field_values(card):
+    ''' the card's fields, for telling if it's been changed '''
+
+    values = []
+    for field in card._meta.fields:
+        value = getattr(card, field.attname)
+        if isinstance(value, list):
+            value = tuple(value)
+        values.append(value)
+    return tuple(values)
+
+
+def on_card_loaded(sender, instance, **kwargs):
+    instance._saved_values = field_values(instance)
+
+
+def on_card_changed(sender, instance, **kwargs):
+
+    from d_cards import fragments
+
+    instance._saved_values = field_values(instance)
+    new_card_generation()
+
+    # other processes see the new generation within
+    # fragments.CHECK_INTERVAL, this one straight away
+    fragments.reset()
+
+
+post_init.connect(on_card_loaded, sender=Card)
+post_save.connect(on_card_changed, sender=Card)
+post_delete.connect(on_card_changed, sender=Card)
+
+
 class CardArt(models.Model):
 
     card = models.OneToOneField(Card, related_name='art')
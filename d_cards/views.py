@@ -1,44 +1,17 @@
 import logging
-import simplejson
 
-from django.core import serializers
 from django.http import HttpResponse
 
-from d_cards.models import PuzzleDeck, Deck, Card
+from d_cards import fragments
+from d_cards.models import PuzzleDeck, Deck
 from d_game.models import Puzzle
 
 
 def get_all_cards_sorted(request):
 
-    all_cards = Card.objects.all()
-
-    organized = {}
-
-    for card in all_cards:
-
-        if card.defense > 0 and card.target_alignment == "friendly" and card.target_occupant == "empty" and card.target_aiming == "chosen":
-
-            # basic summon, sort by attack type
-            try: organized[card.attack_type]
-            except: organized[card.attack_type] = []
-
-            organized[card.attack_type].append(card)
-
-        else:
-
-            # anything other than a basic summon, lump 'em all together
-            try: organized["effects"]
-            except: organized["effects"] = []
-
-            organized["effects"].append(card)
-
-    sorted_cards = []
-    for category in organized:
-        sorted_cards.append({'category': category, 'cards': serializers.serialize("json", organized[category])}) 
-
-    # json = serializers.serialize("json", all_cards)
-    # json = serializers.serialize("json", sorted_cards)
-    json = simplejson.dumps(sorted_cards)
+    # built from json fragments encoded once per card generation, see
+    # d_cards.fragments
+    json = fragments.get_fragments().sorted_json()
 
     return HttpResponse(json, "application/javascript")
 
@@ -7,13 +7,22 @@
 # robfitz play 123 ai 2 -1
 # robfitz tech 123
 # robfitz pass 
+#
+# that's on the wire, anyway. in here moves are d_game.moves.Move
+# tuples and a turn is a tuple of them
 
+import itertools
 import logging
+import time
 from datetime import datetime, timedelta
 
-from utils.util import deepish_copy as deepcopy
-from utils.util import one_level_deepcopy
-from d_game import game_master, cached 
+from d_game import game_master, cached, weights, clone
+from d_game.journal import Journal
+from d_game.moves import Move, PASS, TECH, PLAY
+
+# what winning or losing is worth to heuristic(), whose other weights
+# are in d_game.weights
+GAME_OVER = 1000
 
 example = { 
         'player': 'ai',
@@ -28,14 +37,67 @@ example = {
         }
     }
 
-def get_all_possible_turns(game, player, time_log):
+class Transpositions(object):
+    ''' Positions get_moves has already reached this turn.
 
-    turns = ["%s pass" % player]
-    boards = get_simple_board(game, player)
-    current_resources = game_master.get_player(game, player)['current_tech']
-    hand = game_master.get_player(game, player)['hand']
+    Playing the same cards on the same nodes in a different order ends
+    up in the same place, so each candidate is described canonically by
+    its (sorted) moves, and anything described the same way
+    as an earlier candidate isn't offered again. A play set only gets
+    expanded further once for each set of cards left to try after it. '''
+
+    def __init__(self):
+        self.turns = set()
+        self.expanded = set()
+        self.probes = 0
+        self.hits = 0
+
+    def add_turn(self, played):
+        ''' False if an equivalent turn has been seen already '''
+
+        self.probes += 1
+        key = tuple(sorted(played))
+        if key in self.turns:
+            self.hits += 1
+            return False
+        self.turns.add(key)
+        return True
+
+    def expand(self, played, hand):
+        ''' False if these plays have been followed up with this hand
+        already '''
+
+        key = (tuple(sorted(played)), tuple([card.pk for card in hand]))
+        if key in self.expanded:
+            return False
+        self.expanded.add(key)
+        return True
+
+    def hit_rate(self):
+        if not self.probes:
+            return 0.0
+        return float(self.hits) / self.probes
+
+
+def get_all_possible_turns(game, player, time_log=None, transpositions=None):
+    ''' every turn from iter_turns(), as a list '''
 
-    simple_board = one_level_deepcopy(boards)
+    return list(iter_turns(game, player, transpositions))
+
+
+def iter_turns(game, player, transpositions=None):
+    ''' Yields every turn player could take, each a tuple of Moves.
+    They're made as they're asked for, so nothing has to hold on to the
+    whole list. '''
+
+    if transpositions is None:
+        transpositions = Transpositions()
+
+    yield (Move(player, PASS),)
+
+    boards = get_simple_board(game, player)
+    current_resources = game_master.get_player(game, player).current_tech
+    hand = game_master.get_player(game, player).hand
 
     # sort cards so that anything with a positive immediate bonus
     # is at the beginning of the list. this allows us to go strictly
@@ -43,13 +105,13 @@ def get_all_possible_turns(game, player, time_log):
     cards_insta_bonus = []
     cards_regular = []
     for card in hand:
-        if card['fields']['resource_bonus']:
+        if card.resource_bonus:
             cards_insta_bonus.append(card)
         else:
             cards_regular.append(card)
 
-    cards_insta_bonus = sorted(cards_insta_bonus, key=lambda card: card['fields']['tech_level'])
-    cards_regular = sorted(cards_regular, key=lambda card: card['fields']['tech_level'])
+    cards_insta_bonus = sorted(cards_insta_bonus, key=lambda card: card.tech_level)
+    cards_regular = sorted(cards_regular, key=lambda card: card.tech_level)
 
     # bonus cards first, then others, sorted by cost in both cases (sorted so you can chain multiple
     # resource-granting abilities to get to a higher total level)
@@ -58,42 +120,40 @@ def get_all_possible_turns(game, player, time_log):
 
     str = ""
     for card in hand:
-        str = " ".join([str, card['fields']['name']]) 
+        str = " ".join([str, card.name]) 
     logging.info("**** AI hand for get all poss turns: %s" % str)
 
     # get possibilities if we don't tech at all
     simple_hand = hand[:]
-    for poss in get_moves(simple_hand, simple_board, current_resources):
-        turns.append("%s" % poss)
+    for turn in get_moves(simple_hand, boards, current_resources, transpositions):
+        yield turn
 
     # get possibilities if we begin the turn by teching
     i = 0
     teched_with_pks = []
     for card in hand:
 
-        if card['pk'] in teched_with_pks:
-            logging.info("***** already teched with %s" % card['pk'])
+        if card.pk in teched_with_pks:
+            logging.info("***** already teched with %s" % card.pk)
             # fruitless to create paths for teching w/ identical cards
             continue
 
-        teched_with_pks.append( card['pk'] )
+        teched_with_pks.append( card.pk )
 
         # hand without the discarded card
         without = hand[:i]
         without.extend( hand[i+1:] ) 
 
-        tech_turn = "%s tech %s" % (player, card['pk'])
-        turns.append(tech_turn)
+        tech_turn = (Move(player, TECH, card.pk),)
+        yield tech_turn
 
         simple_hand = without
-        simple_board = one_level_deepcopy(boards)
         
-        for poss in get_moves(simple_hand, simple_board, current_resources):
-            turns.append("%s\n%s" % (tech_turn, poss))
+        for turn in get_moves(simple_hand, boards, current_resources, transpositions, tech_turn):
+            yield turn
 
         i += 1
-    
-    return turns
+
 
 def get_moves_2(hand, boards, resources):
     ''' sort all cards, by whether it has an up-front effect
@@ -102,61 +162,67 @@ def get_moves_2(hand, boards, resources):
 
     pass
 
-# assumes teching is already done. given what's remaining,
-# returns an array of shorthand moves showing what's possible
-def get_moves(hand, boards, resources):
+# assumes teching is already done. given what's remaining, yields
+# every turn that can follow played (the moves made so far this turn,
+# which each turn starts with)
+def get_moves(hand, boards, resources, transpositions=None, played=()):
+
+    if transpositions is None:
+        transpositions = Transpositions()
 
-    turns = []
+    player = boards['friendly_name']
     card_i = 0
 
     played_card_pks = []
 
     for card in hand:
 
-        if card['pk'] in played_card_pks:
+        if card.pk in played_card_pks:
             # fruitless to create paths for playing identical cards at same point
-            logging.info("____ already played card %s" % card['pk'])
+            logging.info("____ already played card %s" % card.pk)
             card_i += 1
             continue
 
-        played_card_pks.append( card['pk'] )
+        played_card_pks.append( card.pk )
 
-        if resources >= card['fields']['tech_level']:
+        if resources >= card.tech_level:
             # we can afford to play it -- give it a shot
 
-            targets = get_simple_valid_targets(boards, boards['friendly_name'], card)
+            targets = get_simple_valid_targets(boards, player, card)
 
-            for node_str in targets:
+            for node_owner, row, x in targets:
 
-                # make some copies pointing at new data
-                boards_copy = one_level_deepcopy(boards)
+                # only summoning changes the simple board, and boards
+                # are never changed once made, so spells can share them
+                boards_copy = boards
+                if card.defense:
+                    boards_copy = clone.clone_boards(boards)
+                    simple_board_play(boards_copy, player, card, node_owner, row, x)
 
-                toks = node_str.split(" ")
-                simple_board_play(boards_copy, boards['friendly_name'], card, toks[0], int(toks[1]), int(toks[2]))
+                resources_copy = resources - card.tech_level
+                resources_copy += card.resource_bonus
 
-                resources_copy = resources - card['fields']['tech_level']
-                resources_copy += card['fields']['resource_bonus']
-
-                play_turn = "%s play %s %s" % (boards['friendly_name'], card['pk'], node_str)
-                turns.append(play_turn)
+                now_played = played + (Move(player, PLAY, card.pk, node_owner, row, x),)
+                if transpositions.add_turn(now_played):
+                    yield now_played
 
                 # try playing the rest of the hand cards
                 hand_copy = hand[card_i + 1 : ] 
-                for poss in get_moves(hand_copy, boards_copy, resources_copy):
-                    turns.append("%s\n%s" % (play_turn, poss))
+                if not transpositions.expand(now_played, hand_copy):
+                    continue
+                for turn in get_moves(hand_copy, boards_copy, resources_copy, transpositions, now_played):
+                    yield turn
 
         # try playing the rest of the hand cards after NOT PLAYING this one.
         # note that this is only necessary if we're throwing away the earlier index hand
         # cards on the assumption they are sorted.
         hand_copy = hand[card_i + 1 : ]
-        boards_copy = one_level_deepcopy(boards)
-        for poss in get_moves(hand_copy, boards_copy, resources):
-            turns.append(poss) 
+        if transpositions.expand(played, hand_copy):
+            for turn in get_moves(hand_copy, boards, resources, transpositions, played):
+                yield turn
     
         card_i += 1
 
-    return turns
-
 
 
 
@@ -188,11 +254,9 @@ def get_simple_node(game, player, row, col):
 
     node = game_master.get_node(game, player, row, col)
 
-    try:
-        node_type = node['type']
-        return node_type
-    except KeyError:
-        return 'empty' 
+    if node:
+        return node.type
+    return 'empty' 
 
 
 # given the current hand and resources, returns
@@ -205,35 +269,35 @@ def __dep__get_all_possible_turns(game, player, time_log):
     turns = ["%s pass" % player]
     best_turn = (heuristic(game, player), turns[0])
 
-    if len(game_master.get_player(game, player)['hand']) == 0:
+    if len(game_master.get_player(game, player).hand) == 0:
         # no cards left? we're done!
         return turns
 
     teched_this_step = False
 
     # try teching each card
-    if game_master.get_player(game, player)['tech_ups_remaining_this_turn'] > 0:
+    if game_master.get_player(game, player).tech_ups_remaining_this_turn > 0:
         # we're still allowed to tech up, so every card in
         # our hand is fair game for that
 
         teched_with_ids = []
 
-        for card in game_master.get_player(game, player)['hand']:
+        for card in game_master.get_player(game, player).hand:
 
-            if card['pk'] in teched_with_ids:
+            if card.pk in teched_with_ids:
                 # it's redundant to tech w/ multiple copies of the same card
                 continue
 
             # copy 
-            g = deepcopy(game)
-            game_master.discard(g, player, card['pk'])
+            g = clone.clone_game(game)
+            game_master.discard(g, player, card.pk)
             game_master.tech(g, player, 1)
-            game_master.get_player(g, player)['tech_ups_remaining_this_turn'] -= 1
+            game_master.get_player(g, player).tech_ups_remaining_this_turn -= 1
 
-            teched_with_ids.append(card['pk'])
+            teched_with_ids.append(card.pk)
             
             # record turn possibilities
-            tech_turn = "%s tech %s" % (player, card['pk'])
+            tech_turn = "%s tech %s" % (player, card.pk)
             for poss in get_all_possible_turns(g, player, time_log):
                 turns.append("%s\n%s" % (tech_turn, poss))
 
@@ -241,8 +305,8 @@ def __dep__get_all_possible_turns(game, player, time_log):
         # if they are going to tech, or to not do it at all. since teching later
         # in the turn is identical to teching at the beginning, it reduces the
         # number of redundant possibilities the AI is going to consider.
-        g = deepcopy(game)
-        game_master.get_player(g, player)['tech_ups_remaining_this_turn'] -= 1
+        g = clone.clone_game(game)
+        game_master.get_player(g, player).tech_ups_remaining_this_turn -= 1
         for poss in get_all_possible_turns(g, player, time_log):
             turns.append("%s\n%s" % (tech_turn, poss)) 
 
@@ -251,9 +315,9 @@ def __dep__get_all_possible_turns(game, player, time_log):
     if not teched_this_step:
 
         # try playing each card
-        for card in game_master.get_player(game, player)['hand']:
+        for card in game_master.get_player(game, player).hand:
 
-            if game_master.get_player(game, player)['current_tech'] >= card['fields']['tech_level']:
+            if game_master.get_player(game, player).current_tech >= card.tech_level:
 
                 temp = datetime.now()
                 targets = get_valid_targets(game, player, card)
@@ -263,16 +327,16 @@ def __dep__get_all_possible_turns(game, player, time_log):
 
                     # we can afford to play it and have a spot
                     temp = datetime.now()
-                    g = deepcopy(game)
+                    g = clone.clone_game(game)
                     time_log['deepcopy'] += datetime.now() - temp
 
                     # node_str = "player row x" 
                     temp = datetime.now()
                     toks = node_str.split(" ")
-                    game_master.play(g, player, card['pk'], toks[0], int(toks[1]), int(toks[2])) 
+                    game_master.play(g, player, card.pk, toks[0], int(toks[1]), int(toks[2])) 
                     time_log['play'] += datetime.now() - temp
 
-                    play_turn = "%s play %s %s" % (player, card['pk'], node_str)
+                    play_turn = "%s play %s %s" % (player, card.pk, node_str)
                     # play each card in each valid position
                     for poss in get_all_possible_turns(g, player, time_log):
                         turns.append("%s\n%s" % (play_turn, poss))
@@ -289,14 +353,14 @@ def simple_board_play(boards, player, card, node_owner, row, x):
     still on the board. Those are weeded out during the actual
     play/heuristic simulations. '''
 
-    if not card['fields']['defense']:
+    if not card.defense:
         return 
 
     nodes = []
-    if card['fields']['target_aiming'] == 'chosen': 
+    if card.target_aiming == 'chosen': 
         boards[node_owner]['%s_%s' % (row, x)] = 'unit'
 
-    elif card['fields']['target_aiming'] == 'all': 
+    elif card.target_aiming == 'all': 
         for row in range(3):
             for col in range(-row, row+1): 
                 if boards[node_owner]["%s_%s" % (row, col)] == "empty":
@@ -309,11 +373,11 @@ def get_simple_valid_targets(boards, player, card):
     nodes = []
     enemy = boards['enemy_name']
 
-    if card['fields']['target_alignment'] == 'any': 
+    if card.target_alignment == 'any': 
         target_players = [player, enemy]
-    elif card['fields']['target_alignment'] == 'friendly':
+    elif card.target_alignment == 'friendly':
         target_players = [ player ]
-    elif card['fields']['target_alignment'] == 'enemy':
+    elif card.target_alignment == 'enemy':
         target_players = [ enemy ]
 
     for target_player in target_players:
@@ -325,212 +389,279 @@ def get_simple_valid_targets(boards, player, card):
 
                 node = board["%s_%s" % (row, x)]
 
-                if card['fields']['target_occupant'] == node: 
-                    nodes.append("%s %s %s" % (target_player, row, x))
+                if card.target_occupant == node: 
+                    nodes.append((target_player, row, x))
 
     return nodes 
 
 
 
 
-# in shorthand node format:
-# ["player row x", "player row x"]
+# as (player, row, x) nodes
 def get_valid_targets(game, player, card):
 
     nodes = []
     target_players = []
 
-    if card['fields']['target_alignment'] == 'friendly' or card['fields']['target_alignment'] == 'any': 
+    if card.target_alignment == 'friendly' or card.target_alignment == 'any': 
         target_players.append(player)
-    if card['fields']['target_alignment'] == 'enemy' or card['fields']['target_alignment'] == 'any': 
+    if card.target_alignment == 'enemy' or card.target_alignment == 'any': 
         target_players.append(game_master.get_opponent_name(game, player))
 
     for target_player in target_players:
 
-        board = game_master.get_board(game, target_player) 
-
         for row in range(3):
             for x in range(-row, row+1): 
 
-                if card['fields']['target_occupant'] == 'unit': 
-                    node = board["%s_%s" % (row, x)]
-                    node_type = None
-                    try:
-                        if node['type'] == 'unit':
-                            nodes.append("%s %s %s" % (target_player, row, x))
-                    except KeyError:
-                        # blank nodes have no type
-                        continue
-
-                elif card['fields']['target_occupant'] == 'empty': 
-                    node = board["%s_%s" % (row, x)]
-                    is_empty = False
-                    if not node:
-                        is_empty = True
-                    else:
-                        try:
-                            if node['type'] == 'empty':
-                                is_empty = True
-                        except KeyError:
-                            # blank nodes have no type
-                            is_empty = True
-                    if is_empty:
-                        nodes.append("%s %s %s" % (target_player, row, x)) 
-
-    return nodes 
-
-
-def get_turn(game, player):
-
-    time_begin = datetime.now()
-
-    # get list of all possible first moves, including teching & passing
-
-    best = (-100000, "")
-
-    time_log_obj = {'get_valid_targets': timedelta(), 'deepcopy': timedelta(), 'play': timedelta()}
-    turns = get_all_possible_turns(game, player, time_log_obj)
-
-    time_log = """get_all_possible_turns(): %s  
-  get valid targets:  %s
-  deepcopy game:   %s 
-  simulate play: %s\n
-""" % (len(turns),
-        time_log_obj['get_valid_targets'],
-        time_log_obj['deepcopy'],
-        time_log_obj['play'])
+                node = game_master.get_node(game, target_player, row, x)
 
-    logging.info("**** ai deciding what to do, got __%s__ turns" % len(turns))
-    logging.info(turns)
+                if card.target_occupant == 'unit': 
+                    if node and node.type == 'unit':
+                        nodes.append((target_player, row, x))
 
-    from d_game.models import Match
-    match = Match.objects.get(id=game['pk'])
-    match.log = "".join([time_log, match.log])
-    match.save()
-
-    time_got_turns = datetime.now()
-
-    time_in_human_attacks = timedelta()
-    time_in_ai_attacks = timedelta()
-    time_heuristic = timedelta()
+                elif card.target_occupant == 'empty': 
+                    # blank nodes are None
+                    if not node:
+                        nodes.append((target_player, row, x)) 
 
-    time_deepcopy = timedelta()
-    time_do_turn_move = timedelta()
+    return nodes 
 
-    opponent = game_master.get_opponent_name(game, player)
 
-    for turn in turns:
-        temp_timer = datetime.now()
-        g_copy = deepcopy(game)
-        time_deepcopy += datetime.now() - temp_timer
-
-        temp_timer = datetime.now()
-        for move in turn.split('\n'):
-            game_master.do_turn_move(g_copy, player, move)
-        time_do_turn_move += datetime.now() - temp_timer
-
-        # do AI attack
-        temp_timer = datetime.now()
-        game_master.do_attack_phase(g_copy, player)
-        time_in_ai_attacks += datetime.now() - temp_timer
-
-        # remove [human] player summoning sickness and simulate attack
-        # to make the AI a bit more defensive
-        temp_timer = datetime.now()
-        game_master.heal(g_copy, opponent)
-        game_master.remove_summoning_sickness(game, opponent) 
-        game_master.do_attack_phase(g_copy, opponent) 
-        time_in_human_attacks += datetime.now() - temp_timer
-
-        temp_timer = datetime.now()
-        h = heuristic(g_copy, player) 
-        if h > best[0]:
-            best = (h, turn) 
-        time_heuristic += datetime.now() - temp_timer
-
-    # convert best pair into play array 
-    best_moves = best[1].split('\n') 
+def get_turn(game, player, timings=None, budget=None):
+    ''' Picks the best turn for player. If timings is a dict, it gets
+    how long each part took (in seconds) and how many candidate turns
+    there were, see d_game.benchmark.
+
+    With a budget (by default the one for the match type in
+    settings.AI_SEARCH_BUDGETS) this is an anytime beam search, see
+    d_game.search, or the two-ply search in d_game.minimax if the
+    budget says 'engine': 'alphabeta'. Without one, or with an empty
+    one, every candidate turn gets tried. '''
+
+    from d_game import search, parallel, batch, minimax, decisions, profiling
+
+    if timings is None:
+        timings = {}
+
+    if budget is None:
+        budget = search.get_budget(game.type)
+
+    time_begin = time.time()
+
+    # puzzle positions come up over and over, see d_game.decisions
+    known = decisions.get(game, player)
+
+    if known is not None:
+        best = (None, known)
+
+        timings['remembered'] = 1
+        timings['candidates'] = 0
+        for name in ('get_all_possible_turns', 'moves', 'attacks', 'heuristic', 'undo', 'evaluate'):
+            timings[name] = 0.0
+
+        if game.log is not None:
+            game.log.note("decided on this position before\n")
+
+    elif budget and budget.get('engine') == 'alphabeta':
+        best = minimax.alphabeta(game, player, budget, timings)
+
+        if game.log is not None:
+            game.log.note("alpha-beta: depth %s, %s of %s candidates searched, %s nodes, %s cutoffs%s\n" % (
+                    timings['depth'], timings['searched'], timings['candidates'], timings['nodes'],
+                    timings['cutoffs'], timings['budget_exhausted'] and ", out of budget" or ""))
+
+    elif budget:
+        best = search.beam_search(game, player, budget, timings)
+
+        if game.log is not None:
+            game.log.note("beam search: %s positions to depth %s%s\n" % (timings['candidates'],
+                    timings['depth'], timings['budget_exhausted'] and ", out of budget" or ""))
+
+    else:
+        # all possible turns, including teching & passing
+        transpositions = Transpositions()
+        turns = iter_turns(game, player, transpositions)
+
+        best = None
+        timings['get_all_possible_turns'] = 0.0
+
+        # the pool and the batch evaluator need to see the whole list
+        # before they start, and only help once it's long enough. so
+        # only that many turns get made up front, and the rest are
+        # listed if that turns out to be all of them
+        lengths = []
+        if parallel.get_workers() > 1:
+            lengths.append(parallel.get_min_candidates())
+        if batch.available():
+            lengths.append(batch.get_min_candidates())
+        lengths = [length for length in lengths if length is not None]
+
+        if lengths:
+            head = list(itertools.islice(turns, min(lengths)))
+            if len(head) < min(lengths):
+                turns = head
+            else:
+                turns = head + list(turns)
+            timings['get_all_possible_turns'] = time.time() - time_begin
+
+            # the pool goes first, if there's one in settings and the
+            # list is long enough for it, and its workers use numpy on
+            # their chunks themselves. anything shorter gets batched here
+            if len(turns) >= min(lengths):
+                best = parallel.evaluate_turns(game, player, turns, timings)
+                if best is None:
+                    best = batch.evaluate_turns(game, player, turns, timings)
+
+        if best is None:
+            # otherwise they get scored as they're made
+            best = evaluate_turns(game, player, turns, timings)
+
+        timings['transposition_probes'] = transpositions.probes
+        timings['transposition_hits'] = transpositions.hits
+
+    # an answer the budget cut short could be beaten next time, so it
+    # isn't handed on to everyone else
+    if known is None and not timings.get('budget_exhausted'):
+        decisions.put(game, player, best[1])
+
+    # convert best pair into play array, which is what the client gets
+    best_moves = list(best[1])
     turn = []
     for move in best_moves:
-        toks = move.split(' ')
         play = { 
-                'shorthand': move,
+                'shorthand': str(move),
                 'player': player,
-                'action': toks[1]
+                'action': move.action
                 }
 
-        if len(toks) > 2:
-            play['card'] = cached.get_card(toks[2])
+        if move.card is not None:
+            play['card'] = cached.get_card(move.card)
 
-        if len(toks) > 5:
+        if move.node_owner is not None:
             play['node'] = {
-                    'player': toks[3],
-                    'row': toks[4],
-                    'x': toks[5]
+                    'player': move.node_owner,
+                    'row': str(move.row),
+                    'x': str(move.x)
                 }
 
         turn.append(play)
 
+    timings['total'] = time.time() - time_begin
 
-    time_log = """Total ai.get_turn:    %s
-  Getting all turns:  %s (%s possibilities)
-  Doing turn moves:   %s 
-  Simulating attacks: %s
-  Finding heuristic:  %s
-  Deepcopying game:   %s\n
-""" % (datetime.now() - time_begin,
-        time_got_turns - time_begin, len(turns),
-        time_do_turn_move,
-        time_in_human_attacks + time_in_ai_attacks,
-        time_heuristic,
-        time_deepcopy)
-
-    from d_game.models import Match
-    match = Match.objects.get(id=game['pk'])
-    match.log = "".join([time_log, match.log])
-    match.save()
+    # timers and counters go to the sink in settings, not the match log
+    profiling.report(timings)
 
     logging.info("^^^^^ got best AI play: %s" % best_moves)
                 
     return (best_moves, turn)
 
 
-def heuristic(game, player):
+def evaluate_turns(game, player, turns, timings=None, scores=None):
+    ''' Plays each candidate turn out, scores it with heuristic() and
+    returns the best (score, turn). turns can be any iterable, e.g.
+    iter_turns(). timings gets how many candidates there were and the
+    time spent waiting for them, making moves, simulating attacks,
+    scoring and undoing. If scores is a list, every candidate's score
+    is appended to it. '''
 
-        h = 0
+    if timings is None:
+        timings = {}
 
-        opponent = game_master.get_opponent_name(game, player)
+    time_begin = time.time()
+    time_turns = time_moves = time_attacks = time_heuristic = time_undo = 0.0
+    candidates = 0
+
+    best = (-100000, ())
 
-        for unit in game_master.each_unit(game, player):
-            h += unit['fields']['unit_power_level']
+    opponent = game_master.get_opponent_name(game, player)
 
-        for unit in game_master.each_unit(game, opponent):
-            h -= 1.1 * unit['fields']['unit_power_level']
+    # each candidate is played out on the live game and then undone,
+    # rather than played on a copy. reuse the caller's journal if
+    # they're already recording.
+    journal = game.journal
+    own_journal = journal is None
+    if own_journal:
+        journal = game.journal = Journal()
 
-        h += 0.4 * game['players'][player]['life']
-        h -= 0.4 * game['players'][opponent]['life']
+    # candidates aren't real moves, so keep them out of the match log
+    log = game.log
+    game.log = None
 
-        for card in game['players'][player]['hand']:
-            card_tech = card['fields']['tech_level']
-            player_tech = game['players'][player]['tech']
+    turns = iter(turns)
 
-            # cards you can cast are worth a bit of potential
-            if card_tech <= player_tech:
-                h += 0.2 * card_tech
+    start = journal.mark()
+    try:
+        while True:
+            # when turns is a generator, this is where they get made
+            temp_timer = time.time()
+            try:
+                turn = turns.next()
+            except StopIteration:
+                break
+            time_turns += time.time() - temp_timer
+            candidates += 1
+
+            mark = journal.mark()
+
+            temp_timer = time.time()
+            for move in turn:
+                game_master.do_turn_move(game, player, move)
+            time_moves += time.time() - temp_timer
+
+            # do AI attack
+            temp_timer = time.time()
+            game_master.do_attack_phase(game, player)
+
+            # remove [human] player summoning sickness and simulate attack
+            # to make the AI a bit more defensive
+            game_master.heal(game, opponent)
+            game_master.remove_summoning_sickness(game, opponent) 
+            game_master.do_attack_phase(game, opponent) 
+            time_attacks += time.time() - temp_timer
+
+            temp_timer = time.time()
+            h = heuristic(game, player) 
+            if h > best[0]:
+                best = (h, turn) 
+            if scores is not None:
+                scores.append(h)
+            time_heuristic += time.time() - temp_timer
+
+            temp_timer = time.time()
+            journal.undo(mark)
+            time_undo += time.time() - temp_timer
+    finally:
+        # only does anything if a candidate blew up half way through
+        journal.undo(start)
+        if own_journal:
+            game.journal = None
+        game.log = log
+
+    timings['candidates'] = candidates
+    timings['get_all_possible_turns'] = timings.get('get_all_possible_turns', 0.0) + time_turns
+    timings['moves'] = time_moves
+    timings['attacks'] = time_attacks
+    timings['heuristic'] = time_heuristic
+    timings['undo'] = time_undo
+    timings['evaluate'] = time.time() - time_begin - time_turns
+
+    return best
 
-            # cards you can almost cast are worth a little less
-            elif card_tech == 1 + player_tech:
-                h += 0.1 * card_tech
 
-        for rubble in game_master.each_type(game, player, 'rubble'):
-            h -= 0.33
+def heuristic(game, player):
 
-        for rubble in game_master.each_type(game, opponent, 'rubble'):
-            h += 0.33 
+        opponent = game_master.get_opponent_name(game, player)
 
-        if game['players'][player]['life'] <= 0:
-            return h - 1000
-        elif game['players'][opponent]['life'] <= 0:
-            return h + 1000
+        # what the position looks like, times what each bit's worth,
+        # added up in the same order as d_game.batch does
+        w = weights.WEIGHTS
+        f = weights.features(game, player, opponent)
+        h = (0 + w[0] * f[0] + w[1] * f[1] + w[2] * f[2] + w[3] * f[3]
+                + w[4] * f[4] + w[5] * f[5] + w[6] * f[6] + w[7] * f[7])
+
+        if game.players[player].life <= 0:
+            return h - GAME_OVER
+        elif game.players[opponent].life <= 0:
+            return h + GAME_OVER
         else: 
             return h
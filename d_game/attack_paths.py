@@ -0,0 +1,91 @@
+""" Precomputed attack paths.
+
+A unit's attack walks forward up its own side of the board, crosses
+over at row 2 and walks back down the enemy's side until it runs into
+something or reaches the enemy player at (0, 0). The walk only depends
+on where the unit starts and how it attacks, never on who is attacking,
+so it's worked out once here for every node and attack type.
+
+Each path is the ordered list of nodes the attack has to check, as
+(side, node index) pairs where side is FRIENDLY or ENEMY relative to
+the attacker. Nodes the unit passes over without looking (the two in
+front of a flyer, friendly nodes under a ranged shot) are left out. The
+last entry is always the enemy's (0, 0), so an attack which gets to the
+end of its path without hitting a unit hits the enemy player. """
+
+from d_board.topology import ROWS, NODES, NODE_INDEX
+
+
+FRIENDLY = 0
+ENEMY = 1
+
+# attack types which don't do anything during an active attack
+PASSIVE_ATTACK_TYPES = ('na', 'counterattack')
+
+# attack types with their own rules; anything else (melee, wall)
+# walks forward and hits the first unit it meets
+ATTACK_TYPES = ('melee', 'ranged', 'flying')
+
+
+def walk(attack_type, row, x):
+    ''' The original step-by-step walk, returning the nodes it checks.
+    Only used to build the table. '''
+
+    if attack_type in PASSIVE_ATTACK_TYPES:
+        return ()
+
+    path = []
+
+    alignment = FRIENDLY
+    steps_taken = 0
+
+    while True:
+        if alignment != FRIENDLY:
+            d_row = -1
+        elif row == ROWS - 1:
+            d_row = 0
+            alignment = ENEMY
+        else:
+            d_row = 1
+
+        row += d_row
+
+        if x != 0 and abs(x) > row:
+            x = row * x / abs(x)
+
+        steps_taken += 1
+
+        if attack_type == "flying" and steps_taken < 3:
+            # flying units skip the 2 spots in front of them
+            continue
+
+        if alignment == FRIENDLY and attack_type == "ranged":
+            # ranged units always pass over friendly tiles, so
+            # don't even worry about checking collisions
+            continue
+
+        path.append((alignment, NODE_INDEX[(row, x)]))
+
+        if alignment == ENEMY and row == 0 and x == 0:
+            # reached the enemy player
+            return tuple(path)
+
+
+def build_attack_paths():
+
+    paths = {}
+    for attack_type in ATTACK_TYPES + PASSIVE_ATTACK_TYPES:
+        paths[attack_type] = tuple([walk(attack_type, row, x) for row, x in NODES])
+    return paths
+
+
+# attack_type -> one path per node index
+ATTACK_PATHS = build_attack_paths()
+
+
+def attack_path(attack_type, row, x):
+    try:
+        paths = ATTACK_PATHS[attack_type]
+    except KeyError:
+        paths = ATTACK_PATHS['melee']
+    return paths[NODE_INDEX[(int(row), int(x))]]
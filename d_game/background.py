@@ -0,0 +1,163 @@
+""" The AI's turn, worked out after end_turn has already answered.
+
+With a big hand the AI can take long enough to hold up the player's
+request, or run it into the deadline. With settings.AI_DEFERRED_TURNS
+on, end_turn only plays the player's turn (and the start of the AI's),
+saves the game and answers straight away with
+
+    { 'pending': true, 'base_version': n }
+
+The AI's turn is queued as a task, and the client asks /playing/ai_turn/
+for it while it animates its own attacks. Once the task's done that gets
+exactly what end_turn would have sent, with the deltas for both halves
+of the turn. Until then it's { 'pending': true }, and if the answer's
+been lost (it's only kept in memcache) but the game has moved on, it's
+{ 'resync': true }, so the client fetches the whole game.
+
+The half-played game goes into memcache, but the task doesn't rely on
+it still being there: it's handed the game itself, since if memcache
+dropped it the game would come back from the snapshot of the turn
+before, without the player's moves.
+
+Tasks go through google.appengine.ext.deferred (handled at
+/_ah/queue/deferred, see djangoappengine.deferred), or, without App
+Engine or with settings.AI_TASK_QUEUE = 'local', onto a queue in this
+process that run_local_tasks() works through. /playing/ai_turn/ does
+that itself, so the local queue works under runserver and in tests.
+Only the process that queued a task can run it, though, so the local
+queue is no good behind anything that spreads requests over several
+processes: a poll that lands somewhere else would wait forever. On App
+Engine it's only used if settings asks for it. """
+
+import logging
+import simplejson
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    from google.appengine.ext import deferred
+except ImportError:
+    deferred = None
+
+from d_game import cached, game_master, delta, digest, snapshots, match_log
+from d_game.journal import Journal
+from d_game.match_log import MatchLog
+
+
+# how long the AI's answer is kept for the client to pick up
+RESULT_TIMEOUT = 600
+
+
+def is_deferred():
+    return getattr(settings, 'AI_DEFERRED_TURNS', False)
+
+
+def result_key(match_id, base_version):
+    return "ai_turn_%s_%s" % (match_id, base_version)
+
+
+# tasks waiting in this process, as (function, args)
+local_tasks = []
+
+
+def is_remote():
+    ''' whether tasks go on App Engine's queue rather than the local one '''
+    return deferred is not None and getattr(settings, 'AI_TASK_QUEUE', 'deferred') != 'local'
+
+
+def defer(function, *args):
+
+    if is_remote():
+        deferred.defer(function, *args)
+    else:
+        local_tasks.append((function, args))
+
+
+def run_local_tasks():
+    ''' runs everything on the local queue, including anything those
+    tasks queue up, and returns how many ran '''
+
+    ran = 0
+    while local_tasks:
+        function, args = local_tasks.pop(0)
+        function(*args)
+        ran += 1
+    return ran
+
+
+def do_turns(game, player_moves):
+    ''' game_master.do_turns, leaving the AI's turn to a task. Returns
+    what end_turn sends back straight away. '''
+
+    base_version = game.version
+
+    game.log = MatchLog(game)
+    game.journal = Journal()
+    digest.get_digest(game)
+    try:
+        game_master.do_player_turn(game, player_moves)
+        deltas = delta.get_deltas(game, game.journal.entries, game.player)
+    finally:
+        game.journal = None
+        game.log.commit()
+        game.log = None
+
+    # the version only goes up once the whole turn's done, so the task
+    # can tell the game is still waiting on it. half a turn isn't worth
+    # a snapshot
+    cached.save(game, snapshot=False)
+
+    # memcache might lose that before the task gets to it, and the last
+    # snapshot is from before the player's turn, so the task gets the
+    # half-played game itself. whole cards, like a snapshot, in case
+    # they're edited in the meantime
+    if not game_master.is_game_over(game):
+        defer(ai_turn, game.pk, base_version, deltas, snapshots.encode(game))
+
+    return simplejson.dumps({ 'pending': True, 'base_version': base_version })
+
+
+def ai_turn(match_id, base_version, player_deltas, state):
+    ''' the task: the rest of do_turns, for the game as do_turns left
+    it (state, see snapshots.encode) '''
+
+    if cached.get_game(match_id).version != base_version:
+        # done already, or the game's been reset under us
+        logging.info("ai turn for match %s version %s already done" % (match_id, base_version))
+        return
+
+    # not whatever get_game found, which could be a snapshot from
+    # before the player's turn if memcache has let it go
+    game = snapshots.decode(state)
+
+    game.log = MatchLog(game, part=match_log.AI_PART)
+    game.journal = Journal()
+    digest.get_digest(game)
+    try:
+        turn, digest_before_ai, digest_after_ai = game_master.do_ai_turn(game)
+        deltas = player_deltas + delta.get_deltas(game, game.journal.entries, game.player)
+    finally:
+        game.journal = None
+        game.log.commit()
+        game.log = None
+
+    # the deltas are the current values of what changed, so the later
+    # ones can go on top of the player's
+    data = game_master.finish_turns(game, base_version, turn, deltas, digest_before_ai, digest_after_ai)
+    cache.set(result_key(match_id, base_version), data, RESULT_TIMEOUT)
+
+
+def get_result(match_id, base_version):
+    ''' what end_turn would have sent back for the turn from
+    base_version, None while the AI's still thinking, or '' if the
+    answer's gone missing '''
+
+    data = cache.get(result_key(match_id, base_version))
+    if data is not None:
+        return data
+
+    game = cached.get_game(match_id)
+    if game.version > base_version:
+        return ''
+    return None
@@ -0,0 +1,350 @@
+""" NumPy batch evaluator for AI candidate turns.
+
+Every candidate in ai.evaluate_turns ends the same way: both attack
+phases get simulated and heuristic() sums up what's left. Doing that one
+candidate at a time in python is most of the cost of a big search. Here
+the candidates are still played out one at a time (moves can do
+anything), but the board each one ends up with is read into arrays, one
+row per candidate:
+
+    unit, rubble          what's on each node (sides x nodes)
+    attack, defense,
+    damage, delay,
+    rubble_duration, kind the unit's values, kind being one of the
+                          attack type codes below
+    power                 its unit_power_level
+    life                  each side's life
+    hand                  castable and almost_castable, see weights
+
+(cards are looked up by index, so a node is only five numbers) and
+both attack phases are simulated on the whole batch at once. Units
+attack in node order, so the phase loops over the 9 nodes, and for each
+attack type follows the precomputed path (see d_game.attack_paths) for
+every candidate with that kind of unit there, stopping each one at the
+first unit in its way. Scoring is d_game.weights' features times the
+weights, added up column by column in the same order heuristic() adds
+them so every score comes out the same to the last bit, and the same
+turn gets picked.
+
+numpy is optional (App Engine doesn't have it): without it, or for
+fewer than AI_BATCH_MIN_CANDIDATES candidates, evaluate_turns() returns
+None and the caller scores them the usual way. """
+
+import time
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from d_game import game_master, ai, weights
+from d_game.journal import Journal
+from d_game.attack_paths import ATTACK_PATHS, FRIENDLY
+from d_board.topology import NUM_NODES
+
+
+# attack type codes. anything that isn't passive and doesn't have its
+# own rules attacks like melee, see attack_paths.attack_path
+MELEE = 0
+RANGED = 1
+FLYING = 2
+PASSIVE = 3
+COUNTERATTACK = 4
+
+KINDS = {
+    'melee': MELEE,
+    'ranged': RANGED,
+    'flying': FLYING,
+    'na': PASSIVE,
+    'counterattack': COUNTERATTACK,
+}
+
+PATHS = (
+    (MELEE, ATTACK_PATHS['melee']),
+    (RANGED, ATTACK_PATHS['ranged']),
+    (FLYING, ATTACK_PATHS['flying']),
+)
+
+# sides, relative to the player choosing a turn
+OWN = 0
+OPPONENT = 1
+
+
+def available():
+    return numpy is not None
+
+
+def get_min_candidates():
+    return getattr(settings, 'AI_BATCH_MIN_CANDIDATES', 200)
+
+
+def kind(attack_type):
+    return KINDS.get(attack_type, MELEE)
+
+
+# what's on a node
+EMPTY = 0
+UNIT = 1
+RUBBLE = 2
+
+# a node with nothing on it: (card, what, damage, attack_delay, rubble_duration)
+EMPTY_NODE = (0, EMPTY, 0, 0, 0)
+
+
+class Batch(object):
+    ''' End states of a list of candidate turns, as arrays. Build one
+    with add() for each candidate, then freeze() it. '''
+
+    def __init__(self, invulnerable=(False, False)):
+        # whether each side's life can't be touched, see do_attack
+        self.invulnerable = invulnerable
+
+        # nodes refer to cards by their index in here, 0 being no card
+        self.cards = [None]
+        self.card_index = {}
+
+        self.nodes = []
+        self.life = []
+        self.hands = []
+
+    def __len__(self):
+        return len(self.life)
+
+    def add(self, game, player, opponent):
+        ''' reads in the end state of one candidate '''
+
+        nodes = self.nodes.extend
+        card_index = self.card_index
+
+        for name in (player, opponent):
+            for node in game.players[name].board:
+                if node is None:
+                    nodes(EMPTY_NODE)
+                    continue
+
+                card = node.card
+                c = card_index.get(card.pk)
+                if c is None:
+                    c = card_index[card.pk] = len(self.cards)
+                    self.cards.append(card)
+
+                nodes((c, node.type == 'unit' and UNIT or RUBBLE,
+                        node.damage, node.attack_delay, node.rubble_duration or 0))
+
+        self.life.append((game.players[player].life, game.players[opponent].life))
+        self.hands.append(weights.hand_features(game.players[player]))
+
+    def freeze(self):
+        ''' turns what add() read in into arrays '''
+
+        n = len(self.life)
+        nodes = numpy.array(self.nodes, dtype=numpy.int64).reshape((n, 2, NUM_NODES, len(EMPTY_NODE)))
+
+        # the card's values, looked up for every node
+        cards = self.cards[1:]
+        c = nodes[:, :, :, 0]
+        self.attack = numpy.array([0] + [card.attack for card in cards])[c]
+        self.defense = numpy.array([0] + [card.defense for card in cards])[c]
+        self.kind = numpy.array([PASSIVE] + [kind(card.attack_type) for card in cards])[c]
+        self.power = numpy.array([0.0] + [card.unit_power_level for card in cards])[c]
+
+        self.unit = nodes[:, :, :, 1] == UNIT
+        self.rubble = nodes[:, :, :, 1] == RUBBLE
+        self.damage = nodes[:, :, :, 2].copy()
+        self.delay = nodes[:, :, :, 3].copy()
+        self.rubble_duration = nodes[:, :, :, 4].copy()
+
+        self.life = numpy.array(self.life, dtype=numpy.int64).reshape((n, 2))
+
+        self.hand = numpy.array(self.hands, dtype=numpy.int64).reshape((n, 2))
+
+        self.nodes = self.hands = None
+
+    def kill(self, mask, side, i):
+        ''' like game_master.kill_unit, for the candidates in mask '''
+
+        leaves_rubble = mask & (self.rubble_duration[:, side, i] > 0)
+        self.unit[:, side, i] &= ~mask
+        self.rubble[:, side, i] |= leaves_rubble
+
+    def hit(self, mask, side, i, target):
+        ''' the unit at (side, i) hits the enemy at target, for the
+        candidates in mask. like game_master.damage_unit '''
+
+        other = 1 - side
+
+        self.damage[:, other, target] += numpy.where(mask, self.attack[:, side, i], 0)
+
+        # counterattackers hit back at anything that doesn't fly
+        counter = (mask & (self.kind[:, other, target] == COUNTERATTACK)
+                & (self.kind[:, side, i] != FLYING))
+        if counter.any():
+            self.damage[:, side, i] += numpy.where(counter, self.attack[:, other, target], 0)
+            self.kill(counter & (self.damage[:, side, i] >= self.defense[:, side, i]), side, i)
+
+        self.kill(mask & (self.damage[:, other, target] >= self.defense[:, other, target]), other, target)
+
+    def attack_phase(self, side):
+        ''' game_master.do_attack_phase for every candidate '''
+
+        other = 1 - side
+
+        for i in range(NUM_NODES):
+            ready = self.unit[:, side, i] & (self.delay[:, side, i] <= 0)
+            if not ready.any():
+                continue
+
+            for code, paths in PATHS:
+                walking = ready & (self.kind[:, side, i] == code)
+                if not walking.any():
+                    continue
+
+                for path_side, j in paths[i]:
+                    if path_side == FRIENDLY:
+                        # bumped into a friendly unit
+                        walking &= ~self.unit[:, side, j]
+                    else:
+                        blocked = walking & self.unit[:, other, j]
+                        if blocked.any():
+                            self.hit(blocked, side, i, j)
+                            walking &= ~blocked
+
+                    if not walking.any():
+                        break
+
+                # made it all the way to the enemy player
+                if walking.any() and not self.invulnerable[other]:
+                    self.life[:, other] -= numpy.where(walking, self.attack[:, side, i], 0)
+
+    def heal(self, side):
+        self.damage[:, side, :] = numpy.where(self.unit[:, side, :], 0, self.damage[:, side, :])
+
+    def remove_summoning_sickness(self, side):
+        sick = self.unit[:, side, :] & (self.delay[:, side, :] > 0)
+        self.delay[:, side, :] -= sick
+
+    def simulate(self):
+        ''' the same attacks ai.evaluate_turns simulates '''
+
+        self.attack_phase(OWN)
+        self.heal(OPPONENT)
+        self.remove_summoning_sickness(OPPONENT)
+        self.attack_phase(OPPONENT)
+
+    def features(self):
+        ''' weights.features() for every candidate, a column each '''
+
+        # added up a node at a time, in the order features() goes
+        # through the board
+        def total(values):
+            t = numpy.zeros(len(self.life))
+            for i in range(NUM_NODES):
+                t += values[:, i]
+            return t
+
+        power = numpy.where(self.unit, self.power, 0.0)
+
+        return (total(power[:, OWN]), total(power[:, OPPONENT]),
+                self.life[:, OWN], self.life[:, OPPONENT],
+                self.hand[:, 0], self.hand[:, 1],
+                total(self.rubble[:, OWN].astype(numpy.int64)), total(self.rubble[:, OPPONENT].astype(numpy.int64)))
+
+    def scores(self):
+        ''' heuristic() for every candidate: the same sum of features
+        times weights, in the same order, so it rounds the same '''
+
+        h = numpy.zeros(len(self.life))
+        for w, column in zip(weights.WEIGHTS, self.features()):
+            h += w * column
+
+        return numpy.where(self.life[:, OWN] <= 0, h - ai.GAME_OVER,
+                numpy.where(self.life[:, OPPONENT] <= 0, h + ai.GAME_OVER, h))
+
+
+def evaluate_turns(game, player, turns, timings=None, scores=None, min_candidates=None):
+    ''' Same as ai.evaluate_turns, with the attacks and scoring done on
+    the whole batch at once. Returns None without numpy or with too few
+    turns to be worth it, in which case the caller should score them
+    itself. '''
+
+    if min_candidates is None:
+        min_candidates = get_min_candidates()
+
+    if numpy is None or min_candidates is None or len(turns) < min_candidates:
+        return None
+
+    if timings is None:
+        timings = {}
+
+    time_begin = time.time()
+    time_moves = time_attacks = time_undo = 0.0
+
+    opponent = game_master.get_opponent_name(game, player)
+
+    # in puzzle mode where trying to kill all units, AI is invulnerable
+    batch = Batch(invulnerable=tuple([name == 'ai' and game.goal == 'kill units'
+            for name in (player, opponent)]))
+
+    journal = game.journal
+    own_journal = journal is None
+    if own_journal:
+        journal = game.journal = Journal()
+
+    log = game.log
+    game.log = None
+
+    start = journal.mark()
+    try:
+        for turn in turns:
+            mark = journal.mark()
+
+            temp_timer = time.time()
+            for move in turn:
+                game_master.do_turn_move(game, player, move)
+            time_moves += time.time() - temp_timer
+
+            # reading the board in counts towards the attacks, it's what
+            # they cost now
+            temp_timer = time.time()
+            batch.add(game, player, opponent)
+            time_attacks += time.time() - temp_timer
+
+            temp_timer = time.time()
+            journal.undo(mark)
+            time_undo += time.time() - temp_timer
+    finally:
+        journal.undo(start)
+        if own_journal:
+            game.journal = None
+        game.log = log
+
+    temp_timer = time.time()
+    batch.freeze()
+    batch.simulate()
+    time_attacks += time.time() - temp_timer
+
+    temp_timer = time.time()
+    h = batch.scores()
+
+    # the first of the highest scores, like the serial loop
+    best = (-100000, ())
+    if len(turns):
+        i = int(h.argmax())
+        if h[i] > best[0]:
+            best = (float(h[i]), turns[i])
+
+    if scores is not None:
+        scores.extend(h.tolist())
+    time_heuristic = time.time() - temp_timer
+
+    timings['candidates'] = len(turns)
+    timings['moves'] = time_moves
+    timings['attacks'] = time_attacks
+    timings['heuristic'] = time_heuristic
+    timings['undo'] = time_undo
+    timings['evaluate'] = time.time() - time_begin
+    timings['batch'] = True
+
+    return best
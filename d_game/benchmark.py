@@ -0,0 +1,205 @@
+""" Benchmarks for ai.get_turn.
+
+Builds a grid of positions from the card fixtures, varying the AI's
+hand size (1-10), its tech level and how many units are already on each
+side of the board, and times the AI deciding on a turn in each one. The
+parts of get_turn are timed separately (see the timings argument to
+ai.get_turn): enumerating candidate turns, evaluating them, and within
+that the heuristic scoring.
+
+Positions only depend on their parameters and the seed, so results
+from two commits line up position by position. They're written as json,
+one position per line, so they diff nicely too:
+
+    python manage.py benchmark_ai --output before.json
+    (change things)
+    python manage.py benchmark_ai --output after.json --compare before.json
+
+time_copies() times copying a game, for benchmark_clone (see
+d_game.clone). """
+
+import random
+
+import simplejson
+
+from d_game import ai, catalog
+from d_game.state import GameState, PlayerState, Unit
+from d_board.topology import NODES, NUM_NODES
+
+
+HAND_SIZES = range(1, 11)
+TECH_LEVELS = (1, 3, 5)
+
+# units on each side of the board
+OCCUPANCIES = (0, 3, 6)
+
+LIFE = 10
+LIBRARY_SIZE = 10
+
+# the parts of get_turn that get reported, see ai.get_turn
+TIMINGS = ('total', 'get_all_possible_turns', 'evaluate', 'moves', 'attacks', 'heuristic', 'undo')
+
+
+def position_name(hand_size, tech, occupancy):
+    return "hand%s_tech%s_units%s" % (hand_size, tech, occupancy)
+
+
+def make_position(cards, hand_size, tech, occupancy, seed=0):
+    ''' a game with the AI to move, holding hand_size cards with tech
+    to spend and occupancy units on each side of the board '''
+
+    rng = random.Random(seed * 10000 + hand_size * 100 + tech * 10 + occupancy)
+
+    records = cards.records.values()
+    records.sort(key=lambda record: record.pk)
+    units = [record for record in records if record.defense > 0]
+
+    players = {}
+    for name in ('guest', 'ai'):
+        p = PlayerState(name, life=LIFE, tech=tech)
+        p.library = [rng.choice(records) for i in range(LIBRARY_SIZE)]
+
+        for i in rng.sample(range(NUM_NODES), occupancy):
+            row, x = NODES[i]
+            p.board[i] = Unit(rng.choice(units), name, row, x, attack_delay=0)
+
+        players[name] = p
+
+    players['ai'].hand = [rng.choice(records) for i in range(hand_size)]
+    players['guest'].hand = [rng.choice(records) for i in range(5)]
+
+    game = GameState(0, 'ai', 'kill player', 'guest', players)
+    game.current_player = 'ai'
+    return game
+
+
+def time_position(game, repeat=3, budget=None):
+    ''' the timings of the quickest of repeat runs of ai.get_turn. budget
+    is passed on to get_turn, so {} is the exhaustive search and None
+    is whatever settings has for the match type '''
+
+    best = None
+    for i in range(repeat):
+        timings = {}
+        ai.get_turn(game, 'ai', timings, budget)
+        if best is None or timings['total'] < best['total']:
+            best = timings
+    return best
+
+
+def run(fixture, repeat=3, seed=0, hand_sizes=HAND_SIZES, tech_levels=TECH_LEVELS, occupancies=OCCUPANCIES,
+        budget={}):
+    ''' a list of results, one per position '''
+
+    cards = catalog.load_fixture(fixture)
+    catalog.pin(cards)
+
+    results = []
+    for hand_size in hand_sizes:
+        for tech in tech_levels:
+            for occupancy in occupancies:
+                game = make_position(cards, hand_size, tech, occupancy, seed)
+                timings = time_position(game, repeat, budget)
+
+                result = {
+                        'position': position_name(hand_size, tech, occupancy),
+                        'hand_size': hand_size,
+                        'tech': tech,
+                        'units': occupancy,
+                        'candidates': timings['candidates'],
+                        'transposition_hits': timings['transposition_hits'],
+                    }
+                for name in TIMINGS:
+                    result[name] = timings[name]
+                results.append(result)
+
+    return results
+
+
+def dump(results, f):
+    ''' one json object per line, in a fixed order '''
+    for result in results:
+        f.write(simplejson.dumps(result, sort_keys=True))
+        f.write("\n")
+
+
+def load(f):
+    return [simplejson.loads(line) for line in f if line.strip()]
+
+
+def compare(old, new):
+    ''' lines of text comparing two runs position by position '''
+
+    old_results = dict([(result['position'], result) for result in old])
+
+    lines = []
+    for result in new:
+        before = old_results.get(result['position'])
+        if not before:
+            continue
+
+        change = ""
+        if before['candidates'] != result['candidates']:
+            change = " (candidates %s -> %s)" % (before['candidates'], result['candidates'])
+
+        ratio = result['total'] / max(before['total'], 1e-9)
+        lines.append("%-24s %9.2fms -> %9.2fms  x%.2f%s" % (result['position'],
+                before['total'] * 1000, result['total'] * 1000, ratio, change))
+
+    return lines
+
+
+# ways of copying a game, for time_copies
+COPIERS = ('clone', 'deepcopy', 'cpickle', 'memcache')
+
+
+def memcache_copy(game):
+    ''' the old utils.util.deepish_copy: a round trip through the cache.
+    that used the game as the key and only did the set when the get
+    missed, but timing the same game over and over would make every copy
+    a hit, and a GameState makes a key memcached won't take '''
+
+    from django.core.cache import cache
+
+    cache.set('benchmark_copy', game)
+    return cache.get('benchmark_copy')
+
+
+def get_copier(name):
+
+    if name == 'clone':
+        from d_game.clone import clone_game
+        return clone_game
+    if name == 'deepcopy':
+        from copy import deepcopy
+        return deepcopy
+    if name == 'cpickle':
+        import cPickle
+        return lambda game: cPickle.loads(cPickle.dumps(game, -1))
+    if name == 'memcache':
+        return memcache_copy
+    raise ValueError("no copier called %s" % name)
+
+
+def time_copies(game, number=1000, repeat=3, copiers=COPIERS):
+    ''' {copier name: seconds per copy of game}, the quickest of repeat
+    runs of number copies each '''
+
+    import time
+
+    results = {}
+    for name in copiers:
+        copy = get_copier(name)
+
+        best = None
+        for i in range(repeat):
+            time_begin = time.time()
+            for j in xrange(number):
+                copy(game)
+            elapsed = (time.time() - time_begin) / number
+            if best is None or elapsed < best:
+                best = elapsed
+
+        results[name] = best
+
+    return results
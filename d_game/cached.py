@@ -2,39 +2,59 @@ import logging
 
 from django.core.cache import cache
 
-from d_cards.models import Card
 from d_game.models import Match
+from d_game.state import GameState
+from d_game.catalog import get_catalog
+from d_game import snapshots, packing
 
 
-def save(game_object):
+# games are cached with cards as pks, see d_game.packing. the datastore
+# has a snapshot of each one too, for when memcache loses it, see
+# d_game.snapshots
 
-    cache.set("match_%s" % game_object['pk'], game_object)
+def save(game_object, snapshot=True):
+
+    cache.set("match_%s" % game_object.pk, packing.encode(game_object))
+
+    if snapshot:
+        snapshots.save(game_object)
 
 
 def get_game(match_id):
 
     from d_game.game_master import init_game
 
-    game = cache.get("match_%s" % match_id)
-    if not game:
-        match = Match.objects.get(id=match_id)
-        game = init_game(match)
-        cache.set("match_%s" % match.id, game)
+    game = from_cache(cache.get("match_%s" % match_id))
+    if game is None:
+        game = snapshots.restore(match_id)
+        if game is None:
+            match = Match.objects.get(id=match_id)
+            game = init_game(match)
+        else:
+            logging.info("match %s restored from its version %s snapshot" % (match_id, game.version))
+        cache.set("match_%s" % match_id, packing.encode(game))
     else:
         logging.info("12341234 got game from cache")
 
     return game 
 
 
-def all_cards():
+def from_cache(data):
+    ''' the GameState for a memcache entry, or None if it's no good '''
+
+    if not data:
+        return None
 
-    cards = cache.get("all_cards")
-    if cards:
-        return cards
+    # games cached before they were packed
+    if isinstance(data, dict):
+        return GameState.from_dict(data)
 
-    cards = Card.objects.all()
-    cache.set("all_cards", cards, 60 * 10)
-    return cards
+    try:
+        return packing.decode(data)
+    except (KeyError, ValueError):
+        # a card's gone, or it's an older format
+        logging.info("couldn't unpack cached game, restoring it instead")
+        return None
 
 
 def get_card(card_id):
@@ -45,20 +65,16 @@ def get_card(card_id):
 
 
 def get_cards(card_ids):
+    return [record.to_dict() for record in get_card_records(card_ids)]
 
-    from django.forms.models import model_to_dict
-
-    all = all_cards()
-    cards = []
 
-    for id in card_ids:
-        for card in all:
-            if card.id == int(id):
-                card_obj = { 'pk': card.pk,
-                        'fields': model_to_dict(card, fields=[], exclude=[]) 
-                    }
-                cards.append(card_obj)
-                break
+def get_card_record(card_id):
+    record = get_catalog().get(card_id)
+    if record is None:
+        logging.info("!@#$ exception: couldn't find card with id= %s" % card_id)
+    return record
 
-    return cards
 
+def get_card_records(card_ids):
+    # records come from the catalog, so they're shared already
+    return get_catalog().get_many(card_ids)
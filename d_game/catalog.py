@@ -0,0 +1,155 @@
+""" Card catalog.
+
+Every card the engine knows about, keyed by pk, as shared CardRecords
+with their client JSON already rendered. Looking a card up used to mean
+unpickling the whole Card queryset from memcache and scanning it for
+each id, then running model_to_dict on the match. Here a lookup is a
+dict access.
+
+There are two tiers: a catalog held in-process for as long as the
+instance lives, and a copy in memcache so a fresh instance doesn't have
+to go to the datastore. Both are tagged with the card generation from
+d_cards.models, which changes whenever a card is saved or deleted, so
+edits show up everywhere the next time the generation gets checked. """
+
+import time
+
+from django.core.cache import cache
+
+
+# how long (in seconds) the in-process catalog trusts its generation
+# before asking memcache again
+CHECK_INTERVAL = 5
+
+# the catalog isn't precious, it can always be rebuilt from the datastore
+CACHE_TIMEOUT = 60 * 60
+
+
+class CardCatalog(object):
+
+    def __init__(self, generation, records):
+        self.generation = generation
+
+        # pk -> CardRecord
+        self.records = {}
+        for record in records:
+            self.records[record.pk] = record
+
+    def get(self, pk):
+        ''' the CardRecord for pk, or None if there's no such card '''
+        try:
+            return self.records.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def get_many(self, pks):
+        ''' CardRecords for pks in order, repeats included. unknown pks
+        are skipped, like cached.get_cards always did '''
+
+        records = []
+        for pk in pks:
+            record = self.get(pk)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, pk):
+        return self.get(pk) is not None
+
+    def to_cache(self):
+        return [(r.pk, r.fields, r.to_json()) for r in self.records.values()]
+
+    def from_cache(generation, rows):
+        from d_game.state import CardRecord
+        return CardCatalog(generation, [CardRecord(*row) for row in rows])
+
+    from_cache = staticmethod(from_cache)
+
+    def from_models(generation, cards):
+
+        from django.forms.models import model_to_dict
+        from d_game.state import CardRecord
+
+        records = []
+        for card in cards:
+            record = CardRecord(card.pk, model_to_dict(card, fields=[], exclude=[]))
+            record.to_json()
+            records.append(record)
+
+        return CardCatalog(generation, records)
+
+    from_models = staticmethod(from_models)
+
+
+def cache_key(generation):
+    return "card_catalog_%s" % generation
+
+
+# the in-process tier
+_catalog = None
+_checked = 0
+
+# set by pin(), for running without memcache or the datastore
+_pinned = False
+
+
+def get_catalog():
+    ''' the current catalog, from whichever tier has it '''
+
+    global _catalog, _checked
+
+    now = time.time()
+    if _pinned or (_catalog is not None and now - _checked < CHECK_INTERVAL):
+        return _catalog
+
+    from d_cards.models import Card, card_generation
+
+    generation = card_generation()
+    _checked = now
+
+    if _catalog is not None and _catalog.generation == generation:
+        return _catalog
+
+    rows = cache.get(cache_key(generation))
+    if rows is not None:
+        _catalog = CardCatalog.from_cache(generation, rows)
+    else:
+        _catalog = CardCatalog.from_models(generation, Card.objects.all())
+        cache.set(cache_key(generation), _catalog.to_cache(), CACHE_TIMEOUT)
+
+    return _catalog
+
+
+def pin(catalog):
+    ''' use catalog from now on, whatever the card generation says '''
+
+    global _catalog, _pinned
+    _catalog = catalog
+    _pinned = True
+
+
+def reset():
+    ''' forget the in-process catalog, e.g. after editing cards in a test '''
+
+    global _catalog, _checked, _pinned
+    _catalog = None
+    _checked = 0
+    _pinned = False
+
+
+def load_fixture(path):
+    ''' a catalog of the cards in a fixture file like fixtures/cards.json,
+    without touching the datastore '''
+
+    import simplejson
+    from d_game.state import CardRecord
+
+    records = []
+    for obj in simplejson.load(open(path)):
+        if obj['model'] == 'd_cards.card':
+            records.append(CardRecord(obj['pk'], obj['fields']))
+
+    return CardCatalog(0, records)
@@ -0,0 +1,111 @@
+""" The game as one player is allowed to see it, as json.
+
+first_turn and resync send the client the whole game, minus what it
+shouldn't see: the opponent's hand and library, and the player's own
+library, which become { "length": n } stubs. That used to mean building
+the whole game as dicts with to_dict(), library cards and all, swapping
+the hidden parts for stubs and then encoding what was left. Here the
+json is written straight from the live GameState a piece at a time,
+hidden parts are never looked at beyond their length, and cards are
+spliced in from their already-encoded CardRecord.to_json(), so nothing
+gets copied or encoded twice.
+
+iter_censored() yields the pieces, for anything that wants to stream
+them, and censored_json() joins them up. splice() is for other
+responses with cards in, like end_turn's. Anything that shows a game to
+somebody (first turn, resync, and spectating or replays if they ever
+happen) should come through here, so the censoring is in one place. """
+
+import simplejson
+
+from d_board.topology import NUM_NODES, NODE_KEYS
+
+
+dumps = simplejson.dumps
+
+
+def iter_unit(unit):
+
+    card = unit.card
+    if unit.rubble_duration != card.rubble_duration:
+        # its fields differ from the card's, see Unit.to_dict
+        yield dumps(unit.to_dict())
+        return
+
+    # the card's json, with the unit's own values added on the end
+    yield card.to_json()[:-1]
+    yield ', '
+    yield dumps({ 'type': unit.type, 'player': unit.player, 'row': unit.row, 'x': unit.x,
+            'damage': unit.damage, 'attack_delay': unit.attack_delay })[1:]
+
+
+def iter_cards(cards):
+
+    yield '['
+    for i, card in enumerate(cards):
+        if i:
+            yield ', '
+        yield card.to_json()
+    yield ']'
+
+
+def iter_player(p, show_hand):
+
+    yield dumps({ 'life': p.life, 'tech': p.tech, 'current_tech': p.current_tech,
+            'tech_ups_remaining_this_turn': p.tech_ups_remaining_this_turn,
+            'num_to_draw': p.num_to_draw })[:-1]
+
+    yield ', "hand": '
+    if show_hand:
+        for piece in iter_cards(p.hand):
+            yield piece
+    else:
+        yield '{"length": %s}' % len(p.hand)
+
+    # nobody gets to look ahead in a library
+    yield ', "library": {"length": %s}' % len(p.library)
+
+    yield ', "board": {'
+    for i in range(NUM_NODES):
+        if i:
+            yield ', '
+        yield '"%s": ' % NODE_KEYS[i]
+
+        unit = p.board[i]
+        if unit:
+            for piece in iter_unit(unit):
+                yield piece
+        else:
+            yield '{}'
+    yield '}}'
+
+
+def iter_censored(game, viewer):
+    ''' the pieces of the json for the game as viewer sees it '''
+
+    yield dumps({ 'pk': game.pk, 'type': game.type, 'goal': game.goal,
+            'current_phase': game.current_phase, 'player': viewer,
+            'current_player': game.current_player, 'version': game.version })[:-1]
+
+    yield ', "players": {'
+    for i, (name, p) in enumerate(game.players.items()):
+        if i:
+            yield ', '
+        yield '%s: ' % dumps(name)
+        for piece in iter_player(p, name == viewer):
+            yield piece
+    yield '}}'
+
+
+def censored_json(game, viewer):
+    return "".join(iter_censored(game, viewer))
+
+
+def splice(fields, key, raw):
+    ''' json for the dict fields with key added, raw being key's value
+    already encoded. each value is encoded on its own, so this doesn't
+    depend on how dumps lays out a dict, and fields can be empty '''
+
+    pieces = ["%s: %s" % (dumps(name), dumps(value)) for name, value in fields.items()]
+    pieces.append("%s: %s" % (dumps(key), raw))
+    return "{%s}" % ", ".join(pieces)
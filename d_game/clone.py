@@ -0,0 +1,89 @@
+""" Quick copies of games.
+
+A GameState is mostly cards, and cards never change (see CardRecord), so
+a copy only needs new Units, new PlayerStates and new lists to put the
+cards in. The records themselves are shared between the copy and the
+original, the way every hand, library and unit in a game already shares
+them. copy.deepcopy and cPickle walk into every record, and the old
+utils.util.deepish_copy went through memcache with the whole game as
+the key, which took two round trips and was shared between every thread.
+
+    python manage.py benchmark_clone
+
+times all of them on the benchmark_ai positions (see
+d_game.benchmark.time_copies).
+
+The transient parts of a game (journal, log, see GameState.TRANSIENT)
+belong to whoever is looking at the original, so copies start without
+them. The digest is just a number, so it comes along. """
+
+from d_game.state import GameState, PlayerState, Unit
+
+
+def clone_unit(unit):
+
+    u = Unit.__new__(Unit)
+    u.card = unit.card
+    u.type = unit.type
+    u.player = unit.player
+    u.row = unit.row
+    u.x = unit.x
+    u.damage = unit.damage
+    u.attack_delay = unit.attack_delay
+    u.rubble_duration = unit.rubble_duration
+    return u
+
+
+def clone_player(p):
+
+    c = PlayerState.__new__(PlayerState)
+    c.name = p.name
+    c.life = p.life
+    c.tech = p.tech
+    c.current_tech = p.current_tech
+    c.tech_ups_remaining_this_turn = p.tech_ups_remaining_this_turn
+    c.num_to_draw = p.num_to_draw
+    c.hand = p.hand[:]
+    c.library = p.library[:]
+    c.board = [unit and clone_unit(unit) for unit in p.board]
+    return c
+
+
+def clone_game(game):
+    ''' a copy of game that can be changed without touching the original.
+    cards are shared, everything else is new '''
+
+    g = GameState.__new__(GameState)
+    g.pk = game.pk
+    g.type = game.type
+    g.goal = game.goal
+    g.current_phase = game.current_phase
+    g.player = game.player
+    g.current_player = game.current_player
+    g.version = game.version
+
+    players = {}
+    for name, p in game.players.items():
+        players[name] = clone_player(p)
+    g.players = players
+
+    # only ever read after __init__
+    g.opponents = game.opponents
+
+    g.journal = None
+    g.log = None
+    g.digest = game.digest
+    return g
+
+
+def clone_boards(boards):
+    ''' a copy of the AI's simple boards (see ai.get_simple_board):
+    the two player names and a dict of node key -> 'unit', 'rubble' or
+    'empty' for each side '''
+
+    c = {}
+    for key, value in boards.items():
+        if isinstance(value, dict):
+            value = value.copy()
+        c[key] = value
+    return c
@@ -0,0 +1,109 @@
+""" Cache of the AI's decisions for puzzle positions.
+
+Puzzles never get shuffled (see game_master.new_game) and always start
+from the same PuzzleStartingUnits, so everyone who plays one walks the
+AI into the same positions, and ai.get_turn would work out the same
+turn for each of them. Instead the first answer for a position is kept
+and handed straight back to everyone after, before any search runs.
+Only answers from searches that finished are kept, never ones a search
+budget cut short.
+
+A position is keyed by digest.position_key (the board, both players'
+values, the AI's own hand and how many cards everyone has), the match
+type and goal, and the card and puzzle generations, so editing a card
+or a puzzle moves everything on to fresh keys. VERSION is in there too,
+for when the AI itself changes, and so are the heuristic's weights.
+
+Answers live in memcache, and in the datastore as AIDecisions (keyed by
+the same key, so a position only ever has the one) for when memcache
+drops them. The generations are datastore counters too, so memcache
+dropping those doesn't move every position on to a new key. Moves are stored with node owners as sides rather
+than names, since whoever gets to the position next won't be called
+the same thing.
+
+settings.AI_DECISION_CACHE_TYPES says which match types get cached. """
+
+import simplejson
+from django.conf import settings
+from django.core.cache import cache
+
+from d_game import digest, weights
+from d_game.moves import Move
+
+
+# bump when a change to the AI should throw away everything it's decided
+VERSION = 1
+
+CACHE_TIMEOUT = 86400
+
+
+def cached_types():
+    return getattr(settings, 'AI_DECISION_CACHE_TYPES', ('puzzle',))
+
+
+def cache_key(game, player):
+
+    from d_cards.models import card_generation
+    from d_game.models import puzzle_generation
+
+    return "ai_decision_%s_%s_%s_%s_%s_%s_%s" % (VERSION, weights.WEIGHTS_KEY, card_generation(), puzzle_generation(),
+            game.type, game.goal.replace(' ', '_'), digest.to_hex(digest.position_key(game, player)))
+
+
+def encode(game, player, turn):
+
+    moves = []
+    for move in turn:
+        owner = None
+        if move.node_owner is not None:
+            owner = int(move.node_owner != player)
+        moves.append([move.action, move.card, owner, move.row, move.x])
+    return simplejson.dumps(moves)
+
+
+def decode(game, player, data):
+
+    names = (player, game.opponent(player))
+
+    turn = []
+    for action, card, owner, row, x in simplejson.loads(data):
+        if owner is not None:
+            owner = names[owner]
+        turn.append(Move(player, action, card, owner, row, x))
+    return tuple(turn)
+
+
+def get(game, player):
+    ''' the turn decided on last time somebody was here, or None '''
+
+    if game.type not in cached_types():
+        return None
+
+    key = cache_key(game, player)
+
+    data = cache.get(key)
+    if data is None:
+        from d_game.models import AIDecision
+
+        decisions = AIDecision.objects.filter(key=key)[:1]
+        if not decisions:
+            return None
+
+        data = decisions[0].turn
+        cache.set(key, data, CACHE_TIMEOUT)
+
+    return decode(game, player, data)
+
+
+def put(game, player, turn):
+
+    if game.type not in cached_types():
+        return
+
+    from d_game.models import AIDecision
+
+    key = cache_key(game, player)
+    data = encode(game, player, turn)
+
+    cache.set(key, data, CACHE_TIMEOUT)
+    AIDecision(key=key, turn=data).save()
@@ -0,0 +1,104 @@
+""" Compact updates for the client.
+
+end_turn used to send the whole game twice, before and after the AI's
+turn, which is mostly library cards the client isn't allowed to see
+anyway. Instead it now sends the list of things that changed, worked
+out from the journal game_master keeps while do_turns runs, and the
+game's version number. The client plays the turn out locally as before
+and then applies the deltas on top, so whatever the server says wins.
+
+The version goes up once per end_turn. If the version the client has
+isn't the one the deltas were made against, it asks /playing/resync/
+for the whole (censored) game instead.
+
+Deltas are short lists, like the match log's events:
+
+[PLAYER, name, field, value]     one of PLAYER_FIELDS
+[NODE, name, "row_x", node]      the node as in to_dict(), {} when empty
+[HAND, name, hand]               card dicts, or {'length': n} for the opponent
+[LIBRARY, name, {'length': n}]   libraries are always censored """
+
+from d_game.state import Unit
+from d_board.topology import NODE_KEYS, NODE_INDEX
+
+
+PLAYER = 'pl'
+NODE = 'no'
+HAND = 'ha'
+LIBRARY = 'li'
+
+PLAYER_FIELDS = ('life', 'tech', 'current_tech', 'tech_ups_remaining_this_turn', 'num_to_draw')
+
+
+def changed(game, entries):
+    ''' what the journal entries touched, as (kind, name, key) in the
+    order it was first touched '''
+
+    # journal entries only point at the objects they changed, so map
+    # those back to where they live
+    owners = {}
+    for name, p in game.players.items():
+        owners[id(p)] = (PLAYER, name)
+        owners[id(p.board)] = (NODE, name)
+        owners[id(p.hand)] = (HAND, name)
+        owners[id(p.library)] = (LIBRARY, name)
+
+    seen = set()
+    touched = []
+    for undo, args in entries:
+        target = args[0]
+
+        if isinstance(target, Unit):
+            # damage and the like. the unit might not be on the board
+            # any more, but then its node was journaled too
+            key = (NODE, target.player, NODE_INDEX[(int(target.row), int(target.x))])
+        else:
+            try:
+                kind, name = owners[id(target)]
+            except KeyError:
+                continue
+
+            if kind == PLAYER:
+                if args[1] not in PLAYER_FIELDS:
+                    continue
+                key = (kind, name, args[1])
+            elif kind == NODE:
+                key = (kind, name, args[1])
+            else:
+                key = (kind, name, None)
+
+        if key not in seen:
+            seen.add(key)
+            touched.append(key)
+
+    return touched
+
+
+def get_deltas(game, entries, viewer):
+    ''' the current value of everything the entries changed, censored
+    for viewer '''
+
+    deltas = []
+    for kind, name, key in changed(game, entries):
+        p = game.players[name]
+
+        if kind == PLAYER:
+            deltas.append([PLAYER, name, key, getattr(p, key)])
+
+        elif kind == NODE:
+            unit = p.board[key]
+            if unit:
+                deltas.append([NODE, name, NODE_KEYS[key], unit.to_dict()])
+            else:
+                deltas.append([NODE, name, NODE_KEYS[key], {}])
+
+        elif kind == HAND:
+            if name == viewer:
+                deltas.append([HAND, name, [card.to_dict() for card in p.hand]])
+            else:
+                deltas.append([HAND, name, { 'length': len(p.hand) }])
+
+        elif kind == LIBRARY:
+            deltas.append([LIBRARY, name, { 'length': len(p.library) }])
+
+    return deltas
@@ -0,0 +1,161 @@
+""" Incremental 64 bit digest of a game.
+
+Zobrist-style: every piece of the table (a player's life or tech, each
+occupied node) gets a pseudo-random 64 bit key and the digest is all of
+them XORed together. Changing one piece XORs its old key out and its
+new key in, so game_master keeps game.digest up to date as it goes for
+the cost of a couple of hashes per change, and undoing through the
+journal puts it back.
+
+Only what both sides can see goes in: life and tech for both players
+and the board. media/js/digest.js computes the same digest from the
+client's copy of the game, so end_turn only has to send two digests to
+check the client and server agree. position_key() mixes in what only
+one player knows (their hand) and the hand and library sizes, for
+keying AI caches.
+
+Keys aren't kept in a table since the values they cover are unbounded;
+instead they're hashed from the piece's description. hash32 is FNV-1a
+over 32 bit words finished off with murmur3's fmix32, run with two
+seeds for the high and low words, which is easy to get bit-for-bit the
+same in javascript. """
+
+from d_game.state import PlayerState, Unit
+from d_game.journal import record_attr
+from d_board.topology import NUM_NODES, NODE_INDEX
+
+
+MASK = 0xffffffff
+
+SEED_HI = 0x9e3779b9
+SEED_LO = 0x7f4a7c15
+
+# kinds of piece
+PLAYER = 1
+NODE = 2
+HAND_CARD = 3
+HAND_SIZE = 4
+LIBRARY_SIZE = 5
+DRAWS = 6
+
+PLAYER_FIELDS = ('life', 'tech', 'current_tech', 'tech_ups_remaining_this_turn')
+PLAYER_FIELD_INDEX = dict([(name, i) for i, name in enumerate(PLAYER_FIELDS)])
+
+NODE_TYPES = { 'unit': 1, 'rubble': 2 }
+
+
+def hash32(values, seed):
+
+    h = seed
+    for v in values:
+        h = ((h ^ (v & MASK)) * 0x01000193) & MASK
+
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & MASK
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & MASK
+    h ^= h >> 16
+    return h
+
+
+# pieces repeat a lot, so keys are remembered
+_keys = {}
+
+def piece_key(*values):
+    try:
+        return _keys[values]
+    except KeyError:
+        key = _keys[values] = (hash32(values, SEED_HI) << 32) | hash32(values, SEED_LO)
+        return key
+
+
+def side(game, player):
+    ''' 0 for game.player, 1 for their opponent, so the digest doesn't
+    depend on anyone's name '''
+    if player == game.player:
+        return 0
+    return 1
+
+
+def player_key(game, player, name, value):
+    return piece_key(PLAYER, side(game, player), PLAYER_FIELD_INDEX[name], int(value))
+
+
+def node_key(game, player, i, unit):
+    if not unit:
+        return 0
+    return piece_key(NODE, side(game, player), i, NODE_TYPES.get(unit.type, 0),
+            int(unit.card.pk), int(unit.damage), int(unit.attack_delay), int(unit.rubble_duration))
+
+
+def compute(game):
+    ''' the digest from scratch '''
+
+    digest = 0
+    for name, p in game.players.items():
+        for field in PLAYER_FIELDS:
+            digest ^= player_key(game, name, field, getattr(p, field))
+        for i in range(NUM_NODES):
+            digest ^= node_key(game, name, i, p.board[i])
+    return digest
+
+
+def get_digest(game):
+    ''' game.digest, working it out if nobody has asked before.
+    from then on game_master keeps it current '''
+
+    if game.digest is None:
+        game.digest = compute(game)
+    return game.digest
+
+
+def value_key(game, obj, name):
+    ''' the key of whatever piece setting obj.name would change, or None
+    if it isn't part of the digest '''
+
+    if isinstance(obj, PlayerState):
+        if name in PLAYER_FIELD_INDEX:
+            return player_key(game, obj.name, name, getattr(obj, name))
+
+    elif isinstance(obj, Unit):
+        i = NODE_INDEX[(int(obj.row), int(obj.x))]
+        if game.players[obj.player].board[i] is obj:
+            return node_key(game, obj.player, i, obj)
+
+    return None
+
+
+def update(game, old_key, new_key):
+
+    if old_key == new_key:
+        return
+
+    if game.journal is not None:
+        record_attr(game.journal, game, 'digest')
+    game.digest ^= old_key ^ new_key
+
+
+def position_key(game, player):
+    ''' the digest plus everything else an AI deciding for player
+    can see: their own hand, both hand and library sizes and draw
+    bonuses '''
+
+    key = get_digest(game) ^ piece_key(side(game, player))
+
+    counts = {}
+    for card in game.players[player].hand:
+        pk = int(card.pk)
+        counts[pk] = counts.get(pk, 0) + 1
+        key ^= piece_key(HAND_CARD, pk, counts[pk])
+
+    for name, p in game.players.items():
+        s = side(game, name)
+        key ^= piece_key(HAND_SIZE, s, len(p.hand))
+        key ^= piece_key(LIBRARY_SIZE, s, len(p.library))
+        key ^= piece_key(DRAWS, s, int(p.num_to_draw))
+
+    return key
+
+
+def to_hex(digest):
+    return "%016x" % digest
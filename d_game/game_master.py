@@ -1,9 +1,13 @@
-import random, logging, copy, simplejson
+import random, logging, simplejson
 
-from django.core import serializers
 from d_game import cached
-
-from django.core.cache import cache
+from d_game.state import GameState, PlayerState, Unit
+from d_game.attack_paths import attack_path, FRIENDLY
+from d_game import match_log, delta, digest
+from d_game.match_log import MatchLog
+from d_game.moves import parse_turn, PASS, TECH, PLAY, SURRENDER
+from d_game.journal import Journal, record_attr, record_item, record_delete, record_delete_slice, record_extend
+from d_board.topology import NODES, NUM_NODES, NODE_INDEX, node_index
 
 
 ANON_PLAYER_NAME = "guest"
@@ -11,52 +15,9 @@ ANON_PLAYER_NAME = "guest"
 
 def log_board(game, log_note):
 
-    player = game['player']
-    opp = get_opponent_name(game, game['player'])
-
-    opp_str = ""
-
-    for row in range(0, 3):
-        line = ""
-        for col in range(-2, row + 1):
-            id = ''
-            if col >= 0 or abs(col) <= row:
-                node = get_node(game, opp, row, col)
-                if node and node['type'] == 'unit':
-                    id = "%s[%s]" % (node['fields']['name'][:3], node['damage'])
-                elif node and node['type'] == 'rubble':
-                    id = 'rubble'
-                else:
-                    id = '------'
-            else:
-                id = '      '
-            line = "%s %s" % (line, id)
-        opp_str = "%s \n%s" % ( opp_str, line )
-
-    player_str = ""
-    for row in range(0, 3):
-        line = ""
-        for col in range(-2, row + 1):
-            id = ''
-            if col >= 0 or abs(col) <= row:
-                node = get_node(game, player, row, col)
-                if node and node['type'] == 'unit':
-                    id = "%s[%s]" % (node['fields']['name'][:3], node['damage'])
-                elif node and node['type'] == 'rubble':
-                    id = 'rubble'
-                else:
-                    id = '------'
-            else:
-                id = '      '
-            line = "%s %s" % (line, id)
-        player_str = "%s \n%s" % ( line, player_str )
-
-    board_str = "%s \n\n%s\n" % (opp_str, player_str)
-
-    from d_game.models import Match
-    match = Match.objects.get(id=game['pk'])
-    match.log = "".join([log_note, board_str, match.log])
-    match.save()
+    # only logged while a request has a MatchLog hanging off the game
+    if game.log is not None:
+        game.log.board(game, log_note)
 
 
 def init_game(match):
@@ -66,128 +27,156 @@ def init_game(match):
     else:
         player = ANON_PLAYER_NAME
 
-    game = {    
-            'pk': match.pk,
-            'type': match.type,
-            'goal': match.goal,
-            'current_phase': 0,
-            'player': player,
-            'current_player': player,
-            'players': {
-                player: {
-                    'life': match.friendly_life,
-                    'tech': match.friendly_tech,
-                    'current_tech': match.friendly_tech,
-                    'tech_ups_remaining_this_turn': 1,
-                    'hand': [],
-                    'num_to_draw': 1,
-                    'library': cached.get_cards(match.friendly_deck_cards),
-                    'board': { },
-                },
-                'ai': {
-                    'life': match.ai_life,
-                    'tech': match.ai_tech,
-                    'current_tech': match.ai_tech,
-                    'tech_ups_remaining_this_turn': 1,
-                    'hand': [],
-                    'num_to_draw': 1,
-                    'library': cached.get_cards(match.ai_deck_cards),
-                    'board': { },
-                }
-            }
-        }
-
-    # init board
-    for row in range(0, 3):
-        for col in range(-row, row + 1):
-            set_node(game, player, row, col, {})
-            set_node(game, 'ai', row, col, {})
-
-    # shuffle if appropriate
-    if game['type'] != "puzzle":
-        random.shuffle(get_player(game, player)['library'])
-        random.shuffle(get_player(game, 'ai')['library'])
+    game = new_game(match.pk, match.type, match.goal, player,
+            match.friendly_deck_cards, match.ai_deck_cards,
+            friendly_life=match.friendly_life,
+            ai_life=match.ai_life,
+            friendly_tech=match.friendly_tech,
+            ai_tech=match.ai_tech)
 
     draw_up_to(game, 'ai', 5)
 
     return game
 
 
-def get_censored(game, player):
+def new_game(pk, type, goal, player, deck, ai_deck, friendly_life=1, ai_life=1,
+        friendly_tech=1, ai_tech=1, rng=random):
+    ''' A fresh game between player and the AI from lists of card ids.
+    Doesn't need a Match, so the simulator can use it too. rng is
+    anything with a shuffle() '''
 
-    # avoid changing the old one
-    game = copy.deepcopy(game)
+    library_cards = cached.get_card_records(deck)
+    ai_library_cards = cached.get_card_records(ai_deck)
 
-    game['player'] = player
+    friendly = PlayerState(player,
+            life=friendly_life,
+            tech=friendly_tech,
+            library=library_cards)
+    ai = PlayerState('ai',
+            life=ai_life,
+            tech=ai_tech,
+            library=ai_library_cards)
 
-    opponent = game['players'][get_opponent_name(game, player)]
+    game = GameState(pk, type, goal, player,
+            { player: friendly, 'ai': ai })
 
-    # censor enemy hand
-    opponent['hand'] = { 'length': len(opponent['hand']) }
+    # shuffle if appropriate
+    if game.type != "puzzle":
+        rng.shuffle(get_player(game, player).library)
+        rng.shuffle(get_player(game, 'ai').library)
 
-    # censor enemy library
-    opponent['library'] = { 'length': len(opponent['library']) }
+    return game
 
-    # censor own library so can't look ahead
-    game['players'][player]['library'] = { 'length': len(game['players'][player]['library']) } 
 
-    return game
+def get_censored(game, player):
+
+    # as dicts, for anything that wants to look at it. views send
+    # censor.censored_json() as it is
+    from d_game import censor
+    return simplejson.loads(censor.censored_json(game, player))
 
 
 def do_turns(game, player_moves):
 
-    from d_game import ai 
+    # collect the turn's log and write it once at the end
+    game.log = MatchLog(game)
+    try:
+        return do_logged_turns(game, player_moves)
+    finally:
+        game.log.commit()
+        game.log = None
 
-    player_name = game['player']
-    opponent_name = get_opponent_name(game, player_name)
 
-    logging.info("XXX player hand: %s" % get_player(game, player_name)['hand'])
+def do_logged_turns(game, player_moves):
+
+    player_name = game.player
+
+    # journal everything up to the end of the AI's turn, which is what
+    # the client gets sent as deltas
+    base_version = game.version
+    game.journal = Journal()
+
+    # from here on the digest is kept up to date as the game changes
+    digest.get_digest(game)
+
+    try:
+        do_player_turn(game, player_moves)
+        ai_turn, digest_before_ai, digest_after_ai = do_ai_turn(game)
+
+        deltas = delta.get_deltas(game, game.journal.entries, player_name)
+    finally:
+        game.journal = None
+
+    return finish_turns(game, base_version, ai_turn, deltas, digest_before_ai, digest_after_ai)
+
+
+def do_player_turn(game, player_moves):
+    ''' the player's turn, and the start of the AI's '''
+
+    player_name = game.player
+    opponent_name = get_opponent_name(game, player_name)
 
     # turn init
     heal(game, player_name) 
     refill_tech(game, player_name)
     remove_summoning_sickness(game, player_name)
 
-    do_turn(game, player_name, player_moves)
+    # the only place the player's moves come in as text
+    do_turn(game, player_name, parse_turn(player_moves))
 
     # AI turn init
     heal(game, opponent_name) 
     refill_tech(game, opponent_name)
-    draw(game, opponent_name, get_player(game, opponent_name)['num_to_draw'])
+    draw(game, opponent_name, get_player(game, opponent_name).num_to_draw)
     remove_summoning_sickness(game, opponent_name)
 
+
+def do_ai_turn(game):
+    ''' the rest of the AI's turn: (the turn for the client, digest
+    before it, digest after it) '''
+
+    from d_game import ai 
+
+    opponent_name = get_opponent_name(game, game.player)
+
     # AI decides what to do (but doens't actually affect the 
     # game state yet
     ai_moves, ai_turn = ai.get_turn(game, opponent_name) 
 
-    # log the turn for client-server verification purposes
-    # and process its decisions.
-    game_before_ai = simplejson.dumps(game) 
+    # the client checks its own replay of the AI's turn against these
+    digest_before_ai = digest.to_hex(game.digest)
     do_turn(game, opponent_name, ai_moves) 
-    game_after_ai = simplejson.dumps(game) 
+    digest_after_ai = digest.to_hex(game.digest)
+
+    return ai_turn, digest_before_ai, digest_after_ai
+
+
+def finish_turns(game, base_version, ai_turn, deltas, digest_before_ai, digest_after_ai):
+    ''' draws the player's next cards, saves the game and returns what
+    end_turn sends back '''
+
+    player_name = game.player
 
     # get 2 new cards for player 
     # this is out of order because we're actually drawing
     # for the player's next turn, not the current one just processed
-    logging.info("XXX player is about to draw %s" % get_player(game, player_name)['num_to_draw'])
-
-    draw_cards = draw(game, player_name, get_player(game, player_name)['num_to_draw'])
+    draw_cards = draw(game, player_name, get_player(game, player_name).num_to_draw)
 
     # save turn changes on server
+    game.version = base_version + 1
     cached.save(game)
 
-    #serialize and ship it
-    hand_and_turn_json = """{
-            'player_draw': %s,
-            'ai_turn': %s,
-            'verify_board_state_before_ai': %s,
-            'verify_board_state_after_ai': %s,
-            }""" % (simplejson.dumps(draw_cards),
-                    simplejson.dumps(ai_turn),
-                    game_before_ai,
-                    game_after_ai)
-
-    return hand_and_turn_json
+    #serialize and ship it. the cards drawn are spliced in from their
+    # already-encoded json, so only the turn itself gets encoded here
+    from d_game import censor
+    return censor.splice({
+            'ai_turn': ai_turn,
+            'base_version': base_version,
+            'version': game.version,
+            'deltas': deltas,
+            'digest_before_ai': digest_before_ai,
+            'digest_after_ai': digest_after_ai,
+        }, 'player_draw', "".join(censor.iter_cards(draw_cards)))
 
 
 def do_turn(game, player, moves, is_ai=False):
@@ -224,46 +213,47 @@ def do_turn(game, player, moves, is_ai=False):
 
 
 def do_turn_move(game, player, move):
-
-    toks = move.split(' ')
+    ''' move is a Move, see d_game.moves '''
 
     if player == "robfitz":
         logging.info("YYY turn move: %s %s" % (player, move))
 
-    try:
-        action = toks[1]
-    except:
-        action = 'pass'
+    action = move.action
 
-    if action == 'pass':
+    if action == PASS:
         pass
 
-    elif action == "surrender":
+    elif action == SURRENDER:
         logging.info("TODO: %s surrender" % player)
 
-    elif action == 'tech':
-        card_id = toks[2]
-        if discard(game, player, card_id):
+    elif action == TECH:
+        card = discard(game, player, move.card)
+        if card:
+            if game.log is not None:
+                game.log.event(match_log.TECH, game.log.side(player), card.pk)
             tech(game, player, 1)
-            get_player(game, player)['tech_ups_remaining_this_turn'] -= 1
+            p = get_player(game, player)
+            set_value(game, p, 'tech_ups_remaining_this_turn', p.tech_ups_remaining_this_turn - 1)
 
-    elif action == 'play':
-        card_id = toks[2]
-        node_owner = toks[3]
-        row = toks[4]
-        x = toks[5]
-
-        play(game, player, card_id, node_owner, row, x) 
+    elif action == PLAY:
+        play(game, player, move.card, move.node_owner, move.row, move.x) 
 
 
 def refill_tech(game, player):
-    get_player(game, player)['current_tech'] = get_player(game, player)['tech'];
-    get_player(game, player)['tech_ups_remaining_this_turn'] = 1
+    p = get_player(game, player)
+    set_value(game, p, 'current_tech', p.tech)
+    set_value(game, p, 'tech_ups_remaining_this_turn', 1)
         
 
 # return False if was an illegal play
 def play(game, player, card_id, node_owner, row, x, ignore_constraints=False):
 
+    p = get_player(game, player)
+
+    if node_owner not in game.players:
+        # junk from the client, there's no board to play it on
+        return False
+
     if not ignore_constraints:
         # remove card from hand
         card = discard(game, player, card_id) 
@@ -272,116 +262,114 @@ def play(game, player, card_id, node_owner, row, x, ignore_constraints=False):
             # fail if requested card was not in hand
             return False 
 
-        if get_player(game, player)['current_tech'] >= card['fields']['tech_level']:
+        if p.current_tech >= card.tech_level:
             # remove casting cost from available tech resources
-            get_player(game, player)['current_tech'] -= card['fields']['tech_level']
+            set_value(game, p, 'current_tech', p.current_tech - card.tech_level)
         else:
             if player == 'robfitz': logging.info("XXX not enough resources")
             # didn't have enough resources to cast it
             return False
 
     else:
-        from d_cards.models import Card
-        card = Card.objects.get(id=card_id)
+        card = cached.get_card_record(card_id)
 
-        from django.forms.models import model_to_dict
-        card = { 'pk': card.pk,
-                'fields': model_to_dict(card, fields=[], exclude=[]) 
-            }
-
-    if player == "robfitz": logging.info("XXX robfitz playing")
-    
     if player == "robfitz":
-        logging.info("XXX playing card: %s" % card['pk'])
-        logging.info("dir: %s" % dir(card['fields']))
+        logging.info("XXX playing card: %s" % card.pk)
+
+    if game.log is not None:
+        game.log.event(match_log.PLAY, game.log.side(player), card.pk,
+                game.log.side(node_owner), int(row), int(x))
 
     # process 'on-cast' effects
-    if card['fields']['tech_change']:
-        tech(game, player, card['fields']['tech_change'])
-    if card['fields']['resource_bonus']:
-        get_player(game, player)['current_tech'] += card['fields']['resource_bonus']
+    if card.tech_change:
+        tech(game, player, card.tech_change)
+    if card.resource_bonus:
+        set_value(game, p, 'current_tech', p.current_tech + card.resource_bonus)
 
-    if card['fields']['draw_num']:
+    if card.draw_num:
         # bonus cards are added to player's next draw phase
-        get_player(game, player)['num_to_draw'] += card['fields']['draw_num']
+        set_value(game, p, 'num_to_draw', p.num_to_draw + card.draw_num)
 
     nodes = []
-    if card['fields']['target_aiming'] == 'chosen': 
-        nodes.append({ 'row': row, 'x': x})
+    if card.target_aiming == 'chosen': 
+        nodes.append((row, x))
 
-    elif card['fields']['target_aiming'] == 'all': 
-        for row in range(3):
-            for col in range(-row, row+1): 
-                if not get_board(game, node_owner)["%s_%s" % (row, col)]: 
-                    nodes.append({ 'row': row, 'x': col }); 
+    elif card.target_aiming == 'all': 
+        owner_board = get_board(game, node_owner)
+        for i in range(NUM_NODES):
+            if not owner_board[i]:
+                nodes.append(NODES[i])
 
-    for node in nodes:
+    for node_row, node_x in nodes:
         # loop to support 'all node' targetting as well as 'chosen'
 
-        if card['fields']['direct_damage']:
+        if card.direct_damage:
             # direct damage 
-            target = get_board(game, node_owner)["%s_%s" % (node["row"], node['x'])]
-            if target and target['type'] == "unit":
-                damage_unit(game, card['fields']['direct_damage'], target, card)
-
-        if card['fields']['defense']: 
-            # summon critter
+            target = get_node(game, node_owner, node_row, node_x)
+            if target and target.type == "unit":
+                damage_unit(game, card.direct_damage, target, card)
 
-            # add a few fields to the card to represent a unit
-            card['type'] = 'unit'
-            card['damage'] = 0
-            card['player'] = player
-            card['row'] = int(node['row'])
-            card['x'] = int(node['x'])
-            card['attack_delay'] = 1
-
-            # deep copy in case of multiple targets for same card
-            get_board(game, player)["%s_%s" % (node["row"], node["x"])] = copy.deepcopy(card)
+        if card.defense: 
+            # summon critter, with a fresh unit per target node
+            set_node(game, player, node_row, node_x,
+                    Unit(card, player, int(node_row), int(node_x)))
 
 
 def discard(game, player, card_id):
 
-    i = 0
-    for card in get_player(game, player)['hand']:
-        if int(card['pk']) == int(card_id):
-            card = get_player(game, player)['hand'][i]
-            del get_player(game, player)['hand'][i]
+    hand = get_player(game, player).hand
+    card_id = int(card_id)
+
+    for i in range(len(hand)):
+        if int(hand[i].pk) == card_id:
+            card = hand[i]
+            if game.journal is not None:
+                record_delete(game.journal, hand, i)
+            del hand[i]
             return card
-        i += 1
     return False
 
 
 def tech(game, player, amount):
     p = get_player(game, player)
-    p['tech'] += amount 
+    set_value(game, p, 'tech', p.tech + amount)
 
-    if amount < 0 and p['current_tech'] > p['tech']:
+    if amount < 0 and p.current_tech > p.tech:
         # if we teched down via a card downside, and if and if our maximum tech
         # is lower than our available tech, lop off a couple available tech so we
         # don't have more than our max allocation. 
         # This situation will rarely arise, however, since in casting something
         # with a negative tech drawback, you'll have already used some of your 
         # available tech.
-        p['current_tech'] = p['tech'] 
+        set_value(game, p, 'current_tech', p.tech)
 
 
 def draw_up_to(game, player, total):
 
-    num = total - len(get_player(game, player)['hand'])
+    num = total - len(get_player(game, player).hand)
     return draw(game, player, num)
 
 
 def draw(game, player, num):
 
+    p = get_player(game, player)
+
+    if game.journal is not None:
+        record_delete_slice(game.journal, p.library, 0, num)
+        record_extend(game.journal, p.hand)
+
     # remove from deck
-    drawn = get_player(game, player)['library'][:num]
-    del get_player(game, player)['library'][:num]
+    drawn = p.library[:num]
+    del p.library[:num]
 
     # add to hand
-    get_player(game, player)['hand'].extend(drawn)
+    p.hand.extend(drawn)
+
+    if game.log is not None and drawn:
+        game.log.event(match_log.DRAW, game.log.side(player), [card.pk for card in drawn])
 
     # reset draw bonus to normal levels
-    get_player(game, player)['num_to_draw'] = 1
+    set_value(game, p, 'num_to_draw', 1)
 
     # return the delta
     return drawn
@@ -394,117 +382,109 @@ def do_attack_phase(game, attacking_player):
 
 def do_attack(game, attacking_player, unit):
 
-
-    if unit['attack_delay'] > 0:
+    if unit.attack_delay > 0:
         # summoning sickness
         return
 
-    attacked_player = get_opponent_name(game, attacking_player)
-
-    row = int(unit['row'])
-    x = int(unit['x'])
-
-    alignment = attacking_player
-    is_searching = True 
-    steps_taken = 0 
+    card = unit.card
 
-    fields = unit['fields']
-
-    if fields['attack_type'] == "na" or fields['attack_type'] == "counterattack":
-        # some types of units don't do anything during an active attack
+    # some types of units don't do anything during an active attack,
+    # in which case there's no path to follow
+    path = attack_path(card.attack_type, unit.row, unit.x)
+    if not path:
         return
 
-    while is_searching:
-        if alignment != attacking_player:
-            d_row = -1
-        elif row == 2:
-            d_row = 0
-            alignment = attacked_player
-        else:
-            d_row = 1
-
-        row += d_row
-        old_x = x
-
-        if x != 0 and abs(x) > row:
-            x = row * x / abs(x)
-
-        steps_taken += 1
+    attacked_player = get_opponent_name(game, attacking_player)
 
-        if fields['attack_type'] == "flying" and steps_taken < 3:
-            # flying units skip the 2 spots in front of them
-            continue
+    # indexed by attack_paths.FRIENDLY/ENEMY
+    boards = (get_board(game, attacking_player), get_board(game, attacked_player))
 
-        if alignment == attacking_player and fields['attack_type'] == "ranged":
-            # ranged units always pass over friendly tiles, so
-            # don't even worry about checking collisions
-            continue
+    for side, i in path:
 
-        try:
-            next_node = get_board(game, alignment)["%s_%s" % (row, x)]
-        except KeyError:
-            next_node = None
+        next_node = boards[side][i]
 
-        if next_node and next_node['type'] == "unit":
-            if alignment == attacking_player:
+        if next_node and next_node.type == "unit":
+            if side == FRIENDLY:
                 # bumped into friendly
                 return
-            elif next_node and next_node['type'] == "unit":
+            else:
                 # bumped into enemy unit
-                is_dead = damage_unit(game, fields['attack'], next_node, unit)
+                if game.log is not None:
+                    game.log.event(match_log.ATTACK, game.log.side(attacking_player), card.pk,
+                            node_index(unit.row, unit.x), game.log.side(attacked_player), i)
+                damage_unit(game, card.attack, next_node, unit)
                 return
-                
-        elif row == 0 and x == 0:
-            # bumped into enemy player
 
+    # made it all the way to the enemy player
 
-            if attacked_player == "ai" and game['goal'] == 'kill units':
-                # in puzzle mode where trying to kill all units, AI is invulnerable
-                pass
-            else:
-                get_player(game, attacked_player)['life'] -= fields['attack']
+    if attacked_player == "ai" and game.goal == 'kill units':
+        # in puzzle mode where trying to kill all units, AI is invulnerable
+        pass
+    else:
+        p = get_player(game, attacked_player)
+        set_value(game, p, 'life', p.life - card.attack)
 
-            return 
+        if game.log is not None:
+            game.log.event(match_log.ATTACK, game.log.side(attacking_player), card.pk,
+                    node_index(unit.row, unit.x), game.log.side(attacked_player), None)
+            game.log.event(match_log.DAMAGE, game.log.side(attacked_player), None, None,
+                    card.attack, p.life)
 
 
 def get_player(game, player): 
-    return game['players'][player]
+    return game.players[player]
 
 
 def get_opponent_name(game, player): 
-    for player_name in game['players']:
-        if player_name != player:
-            return player_name 
+    return game.opponent(player)
 
 
 def get_board(game, player):
-    return get_player(game, player)['board']
+    return game.players[player].board
 
 
 def get_node(game, player, row, x):
-    return get_board(game, player)["%s_%s" % (row, x)]
+    return game.players[player].board[NODE_INDEX[(int(row), int(x))]]
 
 
 def set_node(game, player, row, x, val):
-    get_board(game, player)["%s_%s" % (row, x)] = val
+
+    board = game.players[player].board
+    i = NODE_INDEX[(int(row), int(x))]
+
+    if game.journal is not None:
+        record_item(game.journal, board, i)
+
+    if game.digest is not None:
+        digest.update(game, digest.node_key(game, player, i, board[i]), digest.node_key(game, player, i, val))
+
+    board[i] = val
+
+
+def set_value(game, obj, name, value):
+    ''' every change to a player's or unit's values goes through
+    here so that it can be journaled and digested '''
+
+    if game.journal is not None:
+        record_attr(game.journal, obj, name)
+
+    if game.digest is None:
+        setattr(obj, name, value)
+        return
+
+    old_key = digest.value_key(game, obj, name)
+    setattr(obj, name, value)
+    if old_key is not None:
+        digest.update(game, old_key, digest.value_key(game, obj, name))
 
 
 def each_type(game, player, type):
 
     types = []
 
-    board = get_board(game, player) 
-    for row in range(0, 3):
-        for col in range(-row, row + 1):
-            node = get_node(game, player, row, col)
-            node_type = None
-            try:
-                node_type = node['type']
-            except KeyError:
-                # blank nodes have no type
-                continue
-            if node and node_type == type: 
-                types.append(node)
+    for node in get_board(game, player):
+        if node and node.type == type: 
+            types.append(node)
 
     return types 
 
@@ -523,17 +503,11 @@ def for_each_unit(game, player, callback):
 def for_each_type(game, player, type, callback):
 
     board = get_board(game, player) 
-    for row in range(0, 3):
-        for col in range(-row, row + 1):
-            node = get_node(game, player, row, col)
-            node_type = None
-            try:
-                node_type = node['type']
-            except KeyError:
-                # blank nodes have no type
-                continue
-            if node and node_type == type: 
-                callback(game, player, node)
+    for i in range(NUM_NODES):
+        # look the node up fresh each time, since callbacks can clear nodes
+        node = board[i]
+        if node and node.type == type: 
+            callback(game, player, node)
 
 
 def remove_rubble(game, player):
@@ -544,11 +518,11 @@ def remove_rubble(game, player):
 def remove_rubble_from_node(game, player, node):
 
     # remove one rubble
-    node['fields']['rubble_duration'] -= 1
+    set_value(game, node, 'rubble_duration', node.rubble_duration - 1)
 
-    if node['fields']['rubble_duration'] <= 0: 
+    if node.rubble_duration <= 0: 
         # if all rubble is removed, clear from board
-        set_node(game, player, node['row'], node['x'], {})
+        set_node(game, player, node.row, node.x, None)
 
 
 def heal(game, player): 
@@ -556,57 +530,61 @@ def heal(game, player):
     for_each_unit(game, player, heal_unit)
 
 def heal_unit(game, player, unit):
-    unit['damage'] = 0
+    set_value(game, unit, 'damage', 0)
 
 def remove_summoning_sickness(game, player):
 
     for_each_unit(game, player, remove_unit_summoning_sickness)
 
 def remove_unit_summoning_sickness(game, player, unit):
-    if unit['attack_delay'] > 0:
-        unit['attack_delay'] -= 1
+    if unit.attack_delay > 0:
+        set_value(game, unit, 'attack_delay', unit.attack_delay - 1)
 
 
 def damage_unit(game, amount, target, source):
 
-    try:
-        target['damage'] += amount
-    except KeyError:
-        target['damage'] = amount 
+    set_value(game, target, 'damage', target.damage + amount)
+
+    if game.log is not None:
+        game.log.event(match_log.DAMAGE, game.log.side(target.player), target.card.pk,
+                node_index(target.row, target.x), amount, target.damage)
 
-    if target['fields']['attack_type'] == 'counterattack':
-        if source['fields']['attack_type'] != 'flying': 
+    if target.card.attack_type == 'counterattack' and isinstance(source, Unit):
+        # (spells can't be hit back, only units)
+        if source.card.attack_type != 'flying': 
             # retaliation from counterattackers to non-flying attackers
-            damage_unit(game, target['fields']['attack'], source, target)
+            damage_unit(game, target.card.attack, source, target)
 
-    if target['damage'] >= target['fields']['defense']:
+    if target.damage >= target.card.defense:
         kill_unit(game, target)
 
 
 def kill_unit(game, target):
 
-    if target['fields']['rubble_duration'] > 0:
+    if game.log is not None:
+        game.log.event(match_log.DEATH, game.log.side(target.player), target.card.pk,
+                node_index(target.row, target.x), target.rubble_duration > 0)
+
+    if target.rubble_duration > 0:
         # leave rubble
-        target['type'] = 'rubble'
+        set_value(game, target, 'type', 'rubble')
 
     else:
         # remove from game
-        board = get_board(game, player)
-        set_node(game, player, target['row'], target['x'], {})
+        set_node(game, target.player, target.row, target.x, None)
 
 # returns name of winner, or false if noone has won
 def is_game_over(game):
 
-    for player in game['players']:
-        if game['players'][player]['life'] <= 0:
+    for player in game.players:
+        if game.players[player].life <= 0:
             return get_opponent_name(game, player)
         
-    if game['goal'] == 'kill units':
-        opp = get_opponent_name(game, game['player'])
+    if game.goal == 'kill units':
+        opp = get_opponent_name(game, game.player)
         if len(each_unit(game, opp)) == 0:
-            return game['player']
+            return game.player
         else:
             pass
         
     return False
-
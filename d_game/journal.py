@@ -0,0 +1,60 @@
+""" Reversible record of changes to a GameState.
+
+While game.journal is set, every change game_master makes to the game
+(tech and life, damage and the other per-unit values, board nodes, hand
+and library edits) is appended here along with what it takes to put it
+back. That lets the AI try out a turn on the live game, score it and
+undo it, at a cost proportional to the number of changes instead of the
+size of the game.
+
+Entries are (undo function, args) pairs, e.g. (setattr, (unit, 'damage',
+0)), so undoing is just calling them in reverse order. """
+
+import operator
+
+
+class Journal(object):
+
+    __slots__ = ('entries',)
+
+    def __init__(self):
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def mark(self):
+        ''' a point to undo() back to later '''
+        return len(self.entries)
+
+    def record(self, undo, *args):
+        self.entries.append((undo, args))
+
+    def undo(self, mark=0):
+        ''' roll the game back to how it was at mark '''
+
+        entries = self.entries
+        while len(entries) > mark:
+            undo, args = entries.pop()
+            undo(*args)
+
+
+def record_attr(journal, obj, name):
+    journal.entries.append((setattr, (obj, name, getattr(obj, name))))
+
+
+def record_item(journal, items, i):
+    journal.entries.append((operator.setitem, (items, i, items[i])))
+
+
+def record_delete(journal, items, i):
+    journal.entries.append((list.insert, (items, i, items[i])))
+
+
+def record_delete_slice(journal, items, start, stop):
+    journal.entries.append((operator.setitem, (items, slice(start, start), items[start:stop])))
+
+
+def record_extend(journal, items):
+    journal.entries.append((operator.delitem, (items, slice(len(items), None))))
+
@@ -0,0 +1,60 @@
+import logging
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from d_game import benchmark, simulator, search
+
+
+class Command(BaseCommand):
+    help = "Times ai.get_turn over a grid of positions built from card fixtures."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=3,
+            help='runs per position, the quickest one counts'),
+        make_option('--seed', type='int', default=0,
+            help='seed for building positions'),
+        make_option('--hand', type='int', action='append', dest='hand_sizes',
+            help='only this hand size (can be given more than once)'),
+        make_option('--fixture', default=simulator.DEFAULT_FIXTURE,
+            help='card fixture to build positions from'),
+        make_option('--beam', action='store_true', default=False,
+            help='beam search with the budget settings has for AI games (or search.DEFAULT_BUDGET) instead of trying every candidate'),
+        make_option('--workers', type='int', default=None,
+            help='score candidates on this many processes'),
+        make_option('--output', default=None,
+            help='write results here instead of to stdout'),
+        make_option('--compare', default=None,
+            help='results from an earlier run to compare against'),
+    )
+
+    def handle(self, *args, **options):
+
+        # the AI logs every candidate at info
+        logging.getLogger().setLevel(logging.WARN)
+
+        if options['workers'] is not None:
+            settings.AI_PARALLEL_WORKERS = options['workers']
+
+        budget = {}
+        if options['beam']:
+            budget = search.get_budget('ai') or search.DEFAULT_BUDGET
+
+        results = benchmark.run(options['fixture'],
+                repeat=options['repeat'],
+                seed=options['seed'],
+                hand_sizes=options['hand_sizes'] or benchmark.HAND_SIZES,
+                budget=budget)
+
+        if options['output']:
+            f = open(options['output'], 'w')
+            benchmark.dump(results, f)
+            f.close()
+        else:
+            benchmark.dump(results, self.stdout)
+
+        if options['compare']:
+            old = benchmark.load(open(options['compare']))
+            for line in benchmark.compare(old, results):
+                self.stderr.write(line + "\n")
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from d_game import benchmark, catalog, simulator
+
+
+class Command(BaseCommand):
+    help = "Times copying a game with d_game.clone against copy.deepcopy, cPickle and a memcache round trip."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--number', type='int', default=1000,
+            help='copies per run'),
+        make_option('--repeat', type='int', default=3,
+            help='runs per position, the quickest one counts'),
+        make_option('--seed', type='int', default=0,
+            help='seed for building positions'),
+        make_option('--fixture', default=simulator.DEFAULT_FIXTURE,
+            help='card fixture to build positions from'),
+    )
+
+    def handle(self, *args, **options):
+
+        cards = catalog.load_fixture(options['fixture'])
+        catalog.pin(cards)
+
+        self.stdout.write("%-24s %s\n" % ("", " ".join(["%10s" % name for name in benchmark.COPIERS])))
+
+        for occupancy in benchmark.OCCUPANCIES:
+            hand_size = 5
+            tech = 3
+            game = benchmark.make_position(cards, hand_size, tech, occupancy, options['seed'])
+
+            results = benchmark.time_copies(game, options['number'], options['repeat'])
+
+            self.stdout.write("%-24s %s\n" % (benchmark.position_name(hand_size, tech, occupancy),
+                    " ".join(["%8.1fus" % (results[name] * 1000000) for name in benchmark.COPIERS])))
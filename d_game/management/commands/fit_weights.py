@@ -0,0 +1,74 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from d_game import simulator, catalog, weights, search
+
+
+class Command(BaseCommand):
+    help = "Fits the AI's heuristic weights to simulated matches and writes them to a json file (see d_game.weights)."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--games', type='int', default=100,
+            help='how many matches to learn from'),
+        make_option('--seed', type='int', default=0,
+            help='seed for the first match, the rest count up from it'),
+        make_option('--guest', default='ai', choices=['ai', 'random'],
+            help='how the non-AI side plays: ai or random'),
+        make_option('--turns', type='int', default=simulator.MAX_TURNS,
+            help='give up on a match after this many turns'),
+        make_option('--fixture', default=simulator.DEFAULT_FIXTURE,
+            help='card fixture to play with'),
+        make_option('--beam', action='store_true', default=False,
+            help='beam search with the budget settings has for AI games (or search.DEFAULT_BUDGET) instead of trying every candidate'),
+        make_option('--output', default=None,
+            help='where to write the weights, settings.AI_WEIGHTS_FILE by default'),
+        make_option('--force', action='store_true', default=False,
+            help='write the weights even if they point the wrong way (see weights.problems)'),
+    )
+
+    def handle(self, *args, **options):
+
+        # the engine logs a lot at info
+        logging.getLogger().setLevel(logging.WARN)
+
+        output = options['output'] or weights.get_path()
+        if not output:
+            raise CommandError("nowhere to write the weights, give --output or set AI_WEIGHTS_FILE")
+
+        budget = {}
+        if options['beam']:
+            budget = search.get_budget('ai') or search.DEFAULT_BUDGET
+
+        catalog.pin(catalog.load_fixture(options['fixture']))
+
+        rows, outcomes, unfinished = weights.self_play(games=options['games'],
+                seed=options['seed'],
+                guest=options['guest'],
+                budget=budget,
+                max_turns=options['turns'])
+
+        if not rows:
+            raise CommandError("nobody won any of the matches, so there's nothing to learn from")
+
+        fitted = weights.fit(rows, outcomes)
+
+        problems = weights.problems(fitted)
+        if problems and not options['force']:
+            raise CommandError("not writing weights that point the wrong way, play more games or give --force:\n%s"
+                    % "\n".join(problems))
+        for problem in problems:
+            self.stderr.write("WARNING: %s\n" % problem)
+
+        weights.save(output, fitted,
+                games=options['games'],
+                seed=options['seed'],
+                guest=options['guest'],
+                positions=len(rows),
+                unfinished=unfinished)
+
+        self.stdout.write("%s positions from %s games (%s unfinished)\n" % (len(rows), options['games'], unfinished))
+        for name, w in zip(weights.FEATURES, fitted):
+            self.stdout.write("%-16s %8.3f  (was %s)\n" % (name, w, weights.DEFAULTS[name]))
+        self.stdout.write("written to %s\n" % output)
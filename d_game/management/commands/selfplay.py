@@ -0,0 +1,54 @@
+import logging
+import simplejson
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from d_game import simulator
+
+
+class Command(BaseCommand):
+    help = "Plays matches against the AI from card fixtures, without the datastore, and reports how fast they went."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--games', type='int', default=10,
+            help='how many matches to play'),
+        make_option('--seed', type='int', default=0,
+            help='seed for the first match, the rest count up from it'),
+        make_option('--guest', default='ai', choices=['ai', 'random', 'pass'],
+            help='how the non-AI side plays: ai, random or pass'),
+        make_option('--turns', type='int', default=simulator.MAX_TURNS,
+            help='give up on a match after this many turns'),
+        make_option('--fixture', default=simulator.DEFAULT_FIXTURE,
+            help='card fixture to play with'),
+        make_option('--workers', type='int', default=None,
+            help='score AI candidates on this many processes'),
+        make_option('--json', action='store_true', default=False,
+            help='print the results as json'),
+    )
+
+    def handle(self, *args, **options):
+
+        # the engine logs a lot at info
+        logging.getLogger().setLevel(logging.WARN)
+
+        if options['workers'] is not None:
+            settings.AI_PARALLEL_WORKERS = options['workers']
+
+        results = simulator.run(games=options['games'],
+                seed=options['seed'],
+                guest=options['guest'],
+                fixture=options['fixture'],
+                max_turns=options['turns'])
+
+        if options['json']:
+            self.stdout.write(simplejson.dumps(results, sort_keys=True) + "\n")
+            return
+
+        self.stdout.write("%(games)s games, %(turns)s turns in %(seconds).2fs\n" % results)
+        self.stdout.write("%(games_per_second).2f games/s, %(turns_per_second).2f turns/s\n" % results)
+        self.stdout.write("wins: %s\n" % ", ".join(["%s %s" % (winner or "nobody", n) for winner, n in sorted(results['wins'].items())]))
+        latency = results['ai_latency_ms']
+        self.stdout.write("%s AI decisions, latency p50 %.1fms p90 %.1fms p99 %.1fms max %.1fms\n" % (
+                results['ai_decisions'], latency['p50'], latency['p90'], latency['p99'], latency['max']))
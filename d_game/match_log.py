@@ -0,0 +1,209 @@
+""" Structured, append-only match log.
+
+While do_turns is running, game.log holds a MatchLog and game_master
+adds a typed event to it for everything interesting that happens:
+draws, techs, plays, attacks, damage and deaths, plus the AI's notes
+and (sampled) board snapshots. At the end of the request the events
+are compressed and appended to the match as a single MatchLogChunk, so
+writing a turn costs the size of the turn rather than the size of the
+whole match history. The /log/ view turns the chunks back into text.
+
+Board snapshots are the bulky part, so MATCH_LOG_SNAPSHOT_RATE in
+settings controls what fraction of turns get them: 1 logs every turn,
+0 turns them off.
+
+Chunks are put in order by their sequence rather than their timestamp,
+since with the AI's turn deferred (see d_game.background) one turn
+writes two chunks, possibly on different instances and close enough
+together to tie. A chunk's sequence is the game's version when the log
+was started times PARTS, plus which part of the turn it is. """
+
+import random, zlib
+import simplejson
+
+from django.conf import settings
+
+from d_board.topology import ROWS, NODE_KEYS
+
+
+# event types. events are short lists starting with one of these,
+# and players are stored as sides: 0 for game.player, 1 for their
+# opponent.
+#
+# [DRAW, side, [card pks]]
+# [TECH, side, card pk]
+# [PLAY, side, card pk, node owner side, row, x]
+# [ATTACK, side, card pk, node, target side, target node or None for the player]
+# [DAMAGE, side, card pk, node, amount, total damage]
+# [DAMAGE, side, None, None, amount, life left]
+# [DEATH, side, card pk, node, left rubble]
+# [NOTE, text]
+# [BOARD, note, board labels]
+DRAW = 'dr'
+TECH = 'te'
+PLAY = 'pl'
+ATTACK = 'at'
+DAMAGE = 'da'
+DEATH = 'de'
+NOTE = 'no'
+BOARD = 'bo'
+
+
+# parts a turn's log can come in: the whole turn or the player's half,
+# then the AI's half when it's deferred
+PARTS = 2
+PLAYER_PART = 0
+AI_PART = 1
+
+
+def snapshot_rate():
+    return getattr(settings, 'MATCH_LOG_SNAPSHOT_RATE', 1.0)
+
+
+class MatchLog(object):
+
+    def __init__(self, game, rate=None, part=PLAYER_PART):
+        self.match_id = game.pk
+        self.players = [game.player, game.opponent(game.player)]
+        self.events = []
+        self.sequence = game.version * PARTS + part
+
+        if rate is None:
+            rate = snapshot_rate()
+
+        # sampled per request, so a logged turn is always complete
+        self.snapshots = rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def side(self, player):
+        return self.players.index(player)
+
+    def event(self, *event):
+        self.events.append(list(event))
+
+    def note(self, text):
+        self.events.append([NOTE, text])
+
+    def board(self, game, note):
+        if self.snapshots:
+            self.events.append([BOARD, note, board_labels(game)])
+
+    def commit(self):
+        ''' append everything collected so far to the match, then
+        start afresh '''
+
+        if not self.events:
+            return
+
+        from d_game.models import MatchLogChunk
+        chunk = MatchLogChunk(match_id=self.match_id, sequence=self.sequence,
+                data=encode(self.players, self.events))
+        chunk.save()
+
+        self.events = []
+
+
+def encode(players, events):
+    return zlib.compress(simplejson.dumps([players, events], separators=(',', ':')))
+
+
+def decode(data):
+    ''' returns (players, events) '''
+    players, events = simplejson.loads(zlib.decompress(data))
+    return players, events
+
+
+def board_labels(game):
+    ''' the opponent's and player's boards as rows of node labels,
+    which is all a snapshot needs to keep '''
+
+    from d_game.game_master import get_node, get_opponent_name
+
+    sides = []
+    for player in (get_opponent_name(game, game.player), game.player):
+        rows = []
+        for row in range(ROWS):
+            labels = []
+            for x in range(-row, row + 1):
+                node = get_node(game, player, row, x)
+                if node and node.type == 'unit':
+                    labels.append("%s[%s]" % (node.card.name[:3], node.damage))
+                elif node and node.type == 'rubble':
+                    labels.append('rubble')
+                else:
+                    labels.append('------')
+            rows.append(labels)
+        sides.append(rows)
+    return sides
+
+
+def render_board(sides):
+
+    opp_rows, player_rows = sides
+
+    # rows are indented so the triangles line up, with the opponent's
+    # row 0 at the top and the player's row 0 at the bottom
+    def line(labels):
+        padding = ['      '] * (ROWS - 1 - (len(labels) - 1) / 2)
+        return " ".join([''] + padding + labels)
+
+    opp_str = "".join([" \n%s" % line(labels) for labels in opp_rows])
+
+    player_str = ""
+    for labels in player_rows:
+        player_str = "%s \n%s" % (line(labels), player_str)
+
+    return "%s \n\n%s\n" % (opp_str, player_str)
+
+
+def render(players, events, card_name):
+    ''' Text for one chunk's events, oldest first. card_name(pk)
+    looks up names so the events don't need to carry them. '''
+
+    def unit(side, pk, node):
+        return "%s's %s at %s" % (players[side], card_name(pk), NODE_KEYS[node])
+
+    lines = []
+    for event in events:
+        kind = event[0]
+
+        if kind == DRAW:
+            side, pks = event[1:]
+            lines.append("%s draws %s" % (players[side], ", ".join([card_name(pk) for pk in pks])))
+
+        elif kind == TECH:
+            side, pk = event[1:]
+            lines.append("%s techs with %s" % (players[side], card_name(pk)))
+
+        elif kind == PLAY:
+            side, pk, owner, row, x = event[1:]
+            lines.append("%s plays %s on %s's %s_%s" % (players[side], card_name(pk), players[owner], row, x))
+
+        elif kind == ATTACK:
+            side, pk, node, target_side, target_node = event[1:]
+            if target_node is None:
+                target = players[target_side]
+            else:
+                target = "%s at %s" % (players[target_side], NODE_KEYS[target_node])
+            lines.append("%s attacks %s" % (unit(side, pk, node), target))
+
+        elif kind == DAMAGE:
+            side, pk, node, amount, total = event[1:]
+            if pk is None:
+                lines.append("%s takes %s damage, %s life left" % (players[side], amount, total))
+            else:
+                lines.append("%s takes %s damage (%s total)" % (unit(side, pk, node), amount, total))
+
+        elif kind == DEATH:
+            side, pk, node, rubble = event[1:]
+            if rubble:
+                lines.append("%s dies, leaving rubble" % unit(side, pk, node))
+            else:
+                lines.append("%s dies" % unit(side, pk, node))
+
+        elif kind == NOTE:
+            lines.append(event[1].rstrip())
+
+        elif kind == BOARD:
+            lines.append("%s%s" % (event[1], render_board(event[2])))
+
+    return "\n".join(lines)
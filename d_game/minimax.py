@@ -0,0 +1,265 @@
+""" Two-ply alpha-beta search for the AI's turn.
+
+The other searches look one turn ahead: they play each candidate out
+and, to be a bit defensive, let the opponent's units swing back once
+(see ai.evaluate_turns). This one gives the opponent a real reply. After
+each of the AI's candidates, the opponent starts their turn and tries
+every turn of their own, and the candidate is worth what's left after
+the opponent's best one. The AI picks the candidate whose worst case is
+best.
+
+The opponent's hand isn't something the AI should be looking at, so
+their replies are drawn from their visible board plus a hand sampled
+from their library, as many cards as they'll have once they've drawn.
+The hand itself never goes into the pool, not even when the library is
+nearly empty, so cards are drawn with replacement. What's left in the
+library stands in for what the deck holds, so the sample is only as
+good as that is, and with nothing left in the library the opponent is
+taken to have no cards at all. The sample is seeded from the game, so a
+position always gets the same one.
+
+It's affordable because of the ordering. Every candidate first gets the
+usual one-ply score, and only the best few (width) get searched, best
+first. Once one candidate's worst case is known, the next one can stop
+as soon as a reply makes it worse than that (a cutoff). Replies are
+tried roughly strongest first, starting with the one that refuted the
+last candidate, so those cutoffs come early.
+
+It's switched on per match type in settings.AI_SEARCH_BUDGETS:
+
+    'ai': { 'engine': 'alphabeta', 'width': 8, 'seconds': 3 },
+
+depth is 2 unless the budget says 1, which is just the one-ply ordering
+(the exhaustive search). Nothing deeper is implemented, so alphabeta()
+refuses any other depth. nodes/seconds limit the replies scored as in
+d_game.search. A candidate that runs out of budget half way through
+isn't trusted, so running out always leaves the best fully searched
+candidate, or the one-ply best if none got that far. timings gets
+nodes, cutoffs and the time taken. """
+
+import random
+import time
+
+from d_game import game_master, ai, search
+from d_game.journal import Journal
+from d_game.moves import PLAY
+
+
+WIDTH = 8
+
+# opponent hands tried
+SAMPLES = 3
+
+# the depths alphabeta() can search to
+DEPTHS = (1, 2)
+
+
+def sample_hand(game, player, rng):
+    ''' what player might be holding at the start of their next turn,
+    drawn from their library without looking at their hand '''
+
+    p = game.players[player]
+
+    if not p.library:
+        return []
+
+    return [rng.choice(p.library) for i in range(len(p.hand) + p.num_to_draw)]
+
+
+def one_ply_scores(game, player, turns, timings):
+    ''' ai.evaluate_turns' score for every turn, in order '''
+
+    from d_game import batch
+
+    scores = []
+    if batch.evaluate_turns(game, player, turns, timings, scores) is None:
+        ai.evaluate_turns(game, player, turns, timings, scores)
+    return scores
+
+
+def reply_order(hand):
+    ''' sort key putting the opponent's likeliest best replies first '''
+
+    promise = dict([(card.pk, search.promise(card)) for card in hand])
+
+    def key(turn):
+        return -sum([promise.get(move.card, 0) for move in turn if move.action == PLAY])
+    return key
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.nodes = 0
+        self.cutoffs = 0
+
+
+def worst_reply(game, player, hand, bound, killer, allowance, stats):
+    ''' The opponent's best reply to what player's just played, when
+    they're holding hand: (score, reply). Stops as soon as a reply
+    scores bound or less, since then it's already bad enough. score is
+    None if allowance ran out. '''
+
+    opponent = game_master.get_opponent_name(game, player)
+    journal = game.journal
+
+    # the start of the opponent's turn, with the hand they might have
+    game_master.heal(game, opponent)
+    game_master.refill_tech(game, opponent)
+    game_master.remove_summoning_sickness(game, opponent)
+    game_master.set_value(game, game.players[opponent], 'hand', list(hand))
+
+    replies = ai.get_all_possible_turns(game, opponent)
+    replies.sort(key=reply_order(hand))
+    if killer in replies:
+        replies.remove(killer)
+        replies.insert(0, killer)
+
+    worst = None
+    for reply in replies:
+        if not allowance.spend():
+            return None, None
+
+        mark = journal.mark()
+        for move in reply:
+            game_master.do_turn_move(game, opponent, move)
+        game_master.do_attack_phase(game, opponent)
+
+        # and player swings back, like the one-ply search does for the
+        # opponent
+        game_master.heal(game, player)
+        game_master.remove_summoning_sickness(game, player)
+        game_master.do_attack_phase(game, player)
+
+        h = ai.heuristic(game, player)
+        journal.undo(mark)
+        stats.nodes += 1
+
+        if worst is None or h < worst[0]:
+            worst = (h, reply)
+
+        if bound is not None and h <= bound:
+            stats.cutoffs += 1
+            break
+
+    return worst
+
+
+def alphabeta(game, player, budget, timings=None):
+    ''' the best (score, turn) for player, budget being a dict like the
+    ones in AI_SEARCH_BUDGETS. raises ValueError for a depth other than
+    1 or 2 '''
+
+    depth = budget.get('depth', 2)
+    if depth not in DEPTHS:
+        raise ValueError("alpha-beta only searches to depth 1 or 2, not %r" % (depth,))
+
+    if timings is None:
+        timings = {}
+
+    time_begin = time.time()
+
+    width = budget.get('width') or WIDTH
+    samples = budget.get('samples') or SAMPLES
+    allowance = search.Budget(budget.get('seconds'), budget.get('nodes'))
+
+    opponent = game_master.get_opponent_name(game, player)
+
+    # the one-ply search, which decides what's worth looking at twice
+    transpositions = ai.Transpositions()
+    turns = ai.get_all_possible_turns(game, player, transpositions=transpositions)
+    timings['get_all_possible_turns'] = time.time() - time_begin
+
+    scores = one_ply_scores(game, player, turns, timings)
+    ranked = range(len(turns))
+    ranked.sort(key=lambda i: scores[i], reverse=True)
+
+    one_ply = (scores[ranked[0]], turns[ranked[0]])
+    time_ordering = time.time() - time_begin
+
+    stats = Stats()
+    searched = 0
+    exhausted = False
+    best = None
+
+    if depth == 2:
+        journal = game.journal
+        own_journal = journal is None
+        if own_journal:
+            journal = game.journal = Journal()
+
+        log = game.log
+        game.log = None
+
+        rng = random.Random("%s %s" % (game.pk, game.version))
+        hands = [sample_hand(game, opponent, rng) for i in range(samples)]
+        killers = [None] * samples
+
+        start = journal.mark()
+        try:
+            for i in ranked[:width]:
+                turn = turns[i]
+                mark = journal.mark()
+
+                # the candidate's turn, as do_turn would play it
+                for move in turn:
+                    game_master.do_turn_move(game, player, move)
+                game_master.do_attack_phase(game, player)
+                game_master.remove_rubble(game, player)
+
+                if game_master.is_game_over(game):
+                    value = ai.heuristic(game, player)
+                    stats.nodes += 1
+
+                else:
+                    # the candidate's worth is the average over the
+                    # hands of the opponent's best reply
+                    total = 0
+                    for n, hand in enumerate(hands):
+
+                        # with one hand to go, it's known how bad that
+                        # one has to be for this candidate to lose out
+                        bound = None
+                        if best is not None and n == samples - 1:
+                            bound = best[0] * samples - total
+
+                        hand_mark = journal.mark()
+                        h, killers[n] = worst_reply(game, player, hand, bound, killers[n], allowance, stats)
+                        journal.undo(hand_mark)
+
+                        if h is None:
+                            exhausted = True
+                            break
+                        total += h
+
+                    value = total / float(samples)
+
+                journal.undo(mark)
+
+                if exhausted:
+                    break
+
+                searched += 1
+                if best is None or value > best[0]:
+                    best = (value, turn)
+        finally:
+            journal.undo(start)
+            if own_journal:
+                game.journal = None
+            game.log = log
+
+    if best is None:
+        best = one_ply
+
+    timings['candidates'] = len(turns)
+    timings['transposition_probes'] = transpositions.probes
+    timings['transposition_hits'] = transpositions.hits
+    timings['ordering'] = time_ordering
+    timings['nodes'] = stats.nodes
+    timings['cutoffs'] = stats.cutoffs
+    timings['searched'] = searched
+    timings['depth'] = depth
+    timings['budget_exhausted'] = exhausted
+    timings['evaluate'] = time.time() - time_begin - timings['get_all_possible_turns']
+
+    return best
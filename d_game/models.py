@@ -7,10 +7,11 @@ from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 from django.contrib.sessions.backends.db import SessionStore
-from django.db.models.signals import pre_save
-from djangotoolbox.fields import ListField 
+from django.core.cache import cache
+from django.db.models.signals import pre_save, post_save, post_delete
+from djangotoolbox.fields import ListField, BlobField
 
-from d_cards.models import Card, PuzzleDeck
+from d_cards.models import Card, PuzzleDeck, get_generation, next_generation
 from d_board.models import Node
 
 
@@ -180,6 +181,76 @@ class Match(models.Model):
             self.save() 
 
 
+class MatchLogChunk(models.Model):
+    """ One request's worth of match log events, appended as the match
+    goes along. See d_game.match_log for the format. """
+
+    match = models.ForeignKey(Match)
+
+    # where it goes in the match, see match_log.MatchLog
+    sequence = models.IntegerField(default=0)
+
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    # zlib-compressed json from match_log.encode()
+    data = BlobField()
+
+    class Meta:
+        ordering = ['-sequence', '-timestamp']
+
+
+class GameSnapshot(models.Model):
+    """ The latest copy of a match's game that's made it to the
+    datastore, for when memcache loses it. There's one per match, with
+    the same id as the match. See d_game.snapshots. """
+
+    match = models.ForeignKey(Match)
+
+    # the game's version when it was saved
+    version = models.IntegerField()
+
+    timestamp = models.DateTimeField(auto_now=True)
+
+    # zlib-compressed json from snapshots.encode()
+    data = BlobField()
+
+
+class AIDecision(models.Model):
+    """ A turn the AI worked out for a position, kept so that the next
+    player to get there doesn't have to wait for it again. See
+    d_game.decisions for the key and the format. """
+
+    # one decision per key, see decisions.put
+    key = models.CharField(max_length=200, primary_key=True)
+
+    # json list of the turn's moves
+    turn = models.TextField()
+
+    # when it was last decided
+    timestamp = models.DateTimeField(auto_now=True)
+
+
+PUZZLE_GENERATION_KEY = "puzzle_generation"
+
+
+def puzzle_generation():
+    # see d_cards.models.card_generation
+    return get_generation(PUZZLE_GENERATION_KEY)
+
+
+def new_puzzle_generation():
+    return next_generation(PUZZLE_GENERATION_KEY)
+
+
+def on_puzzle_changed(sender, instance, **kwargs):
+    new_puzzle_generation()
+
+
+for puzzle_model in (Puzzle, PuzzleStartingUnit, PuzzleDeck):
+    post_save.connect(on_puzzle_changed, sender=puzzle_model)
+    post_delete.connect(on_puzzle_changed, sender=puzzle_model)
+
+
 # auto-called whenever match is saved, to tell us if someone
 # has won based on current life totals
 def check_for_winner(sender, instance, raw, **kwargs):
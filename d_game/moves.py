@@ -0,0 +1,81 @@
+""" Moves, as the engine passes them around.
+
+On the wire (the client's end_turn, the AI's turn sent back to it,
+tests and scripts) a move is a line of text:
+
+    player play card_id node_owner row x
+    player tech card_id
+    player pass
+
+e.g. "robfitz play 123 ai 2 -1". Inside the engine it's a Move instead,
+parsed once on the way in and written out once on the way back, and a
+turn is a tuple of Moves. The AI goes through tens of thousands of
+candidate turns, so not formatting and re-splitting every move of every
+one of them adds up.
+
+A Move is a tuple underneath, (player, action, card, node_owner, row, x)
+with the unused parts None, so it's cheap to make, and compares, hashes
+and sorts like one, e.g. for spotting transpositions. That also means
+"%s" % move doesn't do what it looks like, use str(move). """
+
+from operator import itemgetter
+
+
+PASS = 'pass'
+TECH = 'tech'
+PLAY = 'play'
+SURRENDER = 'surrender'
+
+
+class Move(tuple):
+
+    __slots__ = ()
+
+    def __new__(cls, player, action, card=None, node_owner=None, row=None, x=None):
+        return tuple.__new__(cls, (player, action, card, node_owner, row, x))
+
+    player = property(itemgetter(0))
+    action = property(itemgetter(1))
+    card = property(itemgetter(2))
+    node_owner = property(itemgetter(3))
+    row = property(itemgetter(4))
+    x = property(itemgetter(5))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __str__(self):
+        if self.action == PLAY:
+            return "%s play %s %s %s %s" % (self.player, self.card, self.node_owner, self.row, self.x)
+        if self.action == TECH:
+            return "%s tech %s" % (self.player, self.card)
+        return "%s %s" % (self.player, self.action)
+
+    def __repr__(self):
+        return "Move(%r)" % str(self)
+
+    def parse(text):
+        ''' the Move for a line of text. a line with no action passes,
+        and actions nobody knows about are kept but don't do anything '''
+
+        toks = text.split(' ')
+
+        player = toks[0]
+        if len(toks) < 2:
+            return Move(player, PASS)
+
+        action = toks[1]
+        if action == TECH:
+            return Move(player, TECH, int(toks[2]))
+        if action == PLAY:
+            return Move(player, PLAY, int(toks[2]), toks[3], int(toks[4]), int(toks[5]))
+        return Move(player, action)
+    parse = staticmethod(parse)
+
+
+def parse_turn(lines):
+    return tuple([Move.parse(line) for line in lines])
+
+
+def format_turn(turn):
+    return "\n".join([str(move) for move in turn])
@@ -0,0 +1,153 @@
+""" Compact encoding of games for memcache.
+
+to_dict() carries a full copy of every card in both hands, libraries
+and boards, tooltips and all, and that's what used to go into memcache
+on every save and come back out on every request. Cards never change
+during a match, and the catalog (see d_game.catalog) has all of them
+already, so here a card is just its pk and only the things that do
+change are kept:
+
+    [FORMAT, pk, type, goal, current_phase, player, current_player,
+        version, [player, ...]]
+
+    player  [name, life, tech, current_tech, tech_ups_remaining_this_turn,
+                num_to_draw, hand, library, board]
+    hand, library
+            card pks
+    board   one entry per node in d_board.topology order, 0 for an
+            empty one, else [card pk, type, player, damage,
+            attack_delay, rubble_duration]
+
+On the way back in the pks are looked up in the catalog, so every game
+shares the same CardRecords. A card the catalog doesn't have, or has
+different fields for (it's been edited since the game dealt it), goes
+in whole as { 'pk', 'fields' } instead, and comes back just as it was.
+A card that's only edited after the game was packed isn't pinned like
+that, though: its pk picks up whatever the catalog has by then, so the
+edit shows up in the game from the next request on. The lot is json,
+zlib-compressed.
+
+Only memcache uses this. Snapshots (d_game.snapshots) outlive any
+catalog, so they keep whole cards. """
+
+import zlib
+import simplejson
+
+from d_game.state import GameState, PlayerState, CardRecord, Unit
+from d_board.topology import NODES, NUM_NODES
+
+
+# bump when the layout changes, so old entries read as misses
+FORMAT = 1
+
+UNIT_TYPES = ('unit', 'rubble')
+
+
+def pack_card(card, catalog):
+
+    known = catalog.get(card.pk)
+    if known is card or (known is not None and known.fields == card.fields):
+        return card.pk
+    return card.to_dict()
+
+
+def unpack_card(card, catalog, cards):
+
+    if isinstance(card, dict):
+        return CardRecord.from_dict(card, cards)
+
+    record = catalog.get(card)
+    if record is None:
+        raise KeyError("card %s isn't in the catalog" % card)
+    return record
+
+
+def pack(game, catalog=None):
+    ''' the game as plain lists, see above '''
+
+    if catalog is None:
+        from d_game.cached import get_catalog
+        catalog = get_catalog()
+
+    # a record per card pk, so a deck full of the same card only gets
+    # compared once
+    packed = {}
+
+    def card(record):
+        pk = packed.get(record)
+        if pk is None:
+            pk = packed[record] = pack_card(record, catalog)
+        return pk
+
+    players = []
+    for name, p in game.players.items():
+
+        board = []
+        for unit in p.board:
+            if unit is None:
+                board.append(0)
+            else:
+                board.append([card(unit.card), UNIT_TYPES.index(unit.type), unit.player,
+                        unit.damage, unit.attack_delay, unit.rubble_duration])
+
+        players.append([name, p.life, p.tech, p.current_tech, p.tech_ups_remaining_this_turn,
+                p.num_to_draw, [card(c) for c in p.hand], [card(c) for c in p.library], board])
+
+    return [FORMAT, game.pk, game.type, game.goal, game.current_phase,
+            game.player, game.current_player, game.version, players]
+
+
+def unpack(data, catalog=None):
+    ''' the GameState pack() made data from. raises KeyError if a card
+    has gone from the catalog since, and ValueError for an old FORMAT '''
+
+    if catalog is None:
+        from d_game.cached import get_catalog
+        catalog = get_catalog()
+
+    (format, pk, type, goal, current_phase,
+            player, current_player, version, packed_players) = data
+
+    if format != FORMAT:
+        raise ValueError("can't unpack format %s" % format)
+
+    # shared records for the cards that came whole
+    cards = {}
+
+    players = {}
+    for (name, life, tech, current_tech, tech_ups,
+            num_to_draw, hand, library, board) in packed_players:
+
+        p = PlayerState(name, life, tech)
+        p.current_tech = current_tech
+        p.tech_ups_remaining_this_turn = tech_ups
+        p.num_to_draw = num_to_draw
+        p.hand = [unpack_card(c, catalog, cards) for c in hand]
+        p.library = [unpack_card(c, catalog, cards) for c in library]
+
+        for i in range(NUM_NODES):
+            node = board[i]
+            if node:
+                c, unit_type, owner, damage, attack_delay, rubble_duration = node
+                row, x = NODES[i]
+                p.board[i] = Unit(unpack_card(c, catalog, cards), owner, row, x,
+                        type=UNIT_TYPES[unit_type],
+                        damage=damage,
+                        attack_delay=attack_delay,
+                        rubble_duration=rubble_duration)
+
+        players[name] = p
+
+    game = GameState(pk, type, goal, player, players)
+    game.current_phase = current_phase
+    game.current_player = current_player
+    game.version = version
+    return game
+
+
+def encode(game, catalog=None):
+    return zlib.compress(simplejson.dumps(pack(game, catalog), separators=(',', ':')))
+
+
+def decode(data, catalog=None):
+    return unpack(simplejson.loads(zlib.decompress(data)), catalog)
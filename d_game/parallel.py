@@ -0,0 +1,171 @@
+""" Optional process pool for scoring AI candidate turns.
+
+Scoring candidates is the same work over and over on the same game:
+play the turn out, simulate both attack phases, run the heuristic. Each
+candidate is independent of the others, so a long candidate list can be
+split into chunks and scored on several cores at once.
+
+App Engine doesn't allow extra processes, so this is off unless
+settings.AI_PARALLEL_WORKERS says how many to use, e.g. on our own
+servers or for the simulator and benchmarks. Starting processes costs
+far more than scoring most turns, so there's one pool per worker count,
+started the first time it's asked for and kept for the life of the
+process. Each chunk of candidate turns goes out with the pickled game
+and a number for the call it belongs to, and a worker only unpickles
+the game when that number changes. They send back every candidate's
+score and the results are put back together in candidate order, so the
+best turn is picked exactly as the serial loop in ai.evaluate_turns
+would.
+
+Where the workers have numpy, each one scores its chunks as a batch
+(see d_game.batch), which gives the same scores.
+
+Candidate lists shorter than AI_PARALLEL_MIN_CANDIDATES aren't worth
+starting a pool for. ai.get_turn leaves those to the batch evaluator,
+or to the serial loop without numpy. """
+
+import atexit
+import cPickle
+import itertools
+import logging
+import time
+
+from django.conf import settings
+
+
+# chunks per worker, so a worker with cheap candidates can pick up
+# another chunk instead of sitting idle
+CHUNKS_PER_WORKER = 4
+
+# worker count -> pool, in the process that hands out the turns
+_pools = {}
+
+# numbers the calls to evaluate_turns, so workers can tell a new game
+# from the one they already have
+_calls = itertools.count()
+
+# set in each worker by load_game()
+_call = None
+_game = None
+_player = None
+
+
+def get_workers():
+    return getattr(settings, 'AI_PARALLEL_WORKERS', 0)
+
+
+def get_min_candidates():
+    return getattr(settings, 'AI_PARALLEL_MIN_CANDIDATES', 2000)
+
+
+def get_pool(workers):
+    ''' the pool with workers processes, started if there isn't one
+    yet. None if processes can't be had here '''
+
+    pool = _pools.get(workers)
+    if pool is not None:
+        return pool
+
+    try:
+        import multiprocessing
+    except ImportError:
+        return None
+
+    try:
+        pool = multiprocessing.Pool(workers)
+    except (OSError, NotImplementedError), e:
+        logging.info("no process pool for the AI: %s" % e)
+        return None
+
+    _pools[workers] = pool
+    return pool
+
+
+def close_pools():
+
+    for workers, pool in _pools.items():
+        pool.close()
+        pool.join()
+    _pools.clear()
+
+atexit.register(close_pools)
+
+
+def load_game(call, state, player):
+    ''' runs in a worker: unpickles the game if it isn't the one this
+    worker already has '''
+
+    global _call, _game, _player
+    if call != _call:
+        _game = cPickle.loads(state)
+        _player = player
+        _call = call
+
+
+def score_chunk(task):
+    ''' runs in a worker: the scores of a chunk of turns and how long
+    they took. with numpy they're scored as a batch, see d_game.batch '''
+
+    from d_game import ai, batch
+
+    call, state, player, turns = task
+    load_game(call, state, player)
+
+    scores = []
+    timings = {}
+    if batch.evaluate_turns(_game, _player, turns, timings, scores, min_candidates=0) is None:
+        ai.evaluate_turns(_game, _player, turns, timings, scores)
+    return scores, timings
+
+
+def chunk(turns, size):
+    return [turns[i:i + size] for i in range(0, len(turns), size)]
+
+
+def evaluate_turns(game, player, turns, timings=None, workers=None):
+    ''' Same as ai.evaluate_turns, spread over a pool of processes.
+    Returns None if there's no pool to be had or the list is too short
+    to bother, in which case the caller should score them itself. '''
+
+    if workers is None:
+        workers = get_workers()
+
+    if workers < 2 or len(turns) < get_min_candidates():
+        return None
+
+    pool = get_pool(workers)
+    if pool is None:
+        return None
+
+    if timings is None:
+        timings = {}
+
+    time_begin = time.time()
+
+    # journal and log don't get pickled, see GameState.__getstate__
+    state = cPickle.dumps(game, cPickle.HIGHEST_PROTOCOL)
+
+    size = max(1, len(turns) / (workers * CHUNKS_PER_WORKER) + 1)
+
+    call = _calls.next()
+    results = pool.map(score_chunk, [(call, state, player, turns_chunk)
+            for turns_chunk in chunk(turns, size)])
+
+    # same choice as the serial loop: the first of the highest scores
+    best = (-100000, ())
+    i = 0
+    for scores, chunk_timings in results:
+        for h in scores:
+            if h > best[0]:
+                best = (h, turns[i])
+            i += 1
+
+        # time spent in the workers, added up
+        for name in ('moves', 'attacks', 'heuristic', 'undo'):
+            timings[name] = timings.get(name, 0.0) + chunk_timings[name]
+
+    timings['candidates'] = len(turns)
+    timings['evaluate'] = time.time() - time_begin
+    timings['workers'] = workers
+
+    return best
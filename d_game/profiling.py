@@ -0,0 +1,190 @@
+""" Where the AI's timers and counters go.
+
+ai.get_turn times its parts and counts its candidates in a plain dict
+(see the timings argument), and once it's picked a turn it hands them
+to report(), which passes them on to the sink named by
+settings.AI_PROFILE_SINK:
+
+    None or 'null'  throw them away (the default)
+    'logging'       one logging.info line per turn
+    'memory'        add them up in this process, see MemorySink
+    'cache'         add them up in memcache for everyone, which is what
+                    /admin/metrics/ai/ shows
+
+or the dotted path of a class of your own with the same methods. Floats
+are timers (seconds) and ints are counters, anything else is left out.
+
+None of these go near the datastore, and with the null sink report()
+returns straight away, so leaving it in costs nothing. """
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class NullSink(object):
+
+    enabled = False
+
+    def timing(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+class LoggingSink(NullSink):
+
+    enabled = True
+
+    def __init__(self):
+        self.parts = []
+
+    def timing(self, name, seconds):
+        self.parts.append("%s %.4fs" % (name, seconds))
+
+    def count(self, name, n=1):
+        self.parts.append("%s %s" % (name, n))
+
+    def flush(self):
+        logging.info("ai profile: %s" % ", ".join(self.parts))
+        self.parts = []
+
+
+class MemorySink(NullSink):
+    ''' Totals for this process: how many times each name was reported,
+    and the total, least and most of what was reported, in stats. '''
+
+    enabled = True
+
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, name, value):
+        stat = self.stats.get(name)
+        if stat is None:
+            self.stats[name] = [1, value, value, value]
+        else:
+            stat[0] += 1
+            stat[1] += value
+            stat[2] = min(stat[2], value)
+            stat[3] = max(stat[3], value)
+
+    def timing(self, name, seconds):
+        self.add(name, seconds)
+
+    def count(self, name, n=1):
+        self.add(name, n)
+
+    def summary(self):
+        ''' name: { count, total, mean, min, max } '''
+
+        summary = {}
+        for name, (n, total, least, most) in self.stats.items():
+            summary[name] = { 'count': n, 'total': total, 'mean': total / float(n),
+                    'min': least, 'max': most }
+        return summary
+
+    def reset(self):
+        self.stats = {}
+
+
+# memcache keys for CacheSink
+CACHE_PREFIX = "ai_profile_"
+CACHE_NAMES_KEY = "ai_profile_names"
+
+
+class CacheSink(NullSink):
+    ''' Totals in memcache, so every instance adds to the same ones.
+    Timers are kept as whole microseconds, since that's what incr()
+    can add. memcache can lose them whenever it likes, which is fine
+    for this. '''
+
+    enabled = True
+
+    def __init__(self):
+        # names this process has already put in the list of names
+        self.known = set()
+
+    def add(self, name, value):
+        for key, amount in ((CACHE_PREFIX + name + "_count", 1), (CACHE_PREFIX + name + "_total", value)):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.add(key, amount)
+
+        if name not in self.known:
+            names = cache.get(CACHE_NAMES_KEY) or []
+            if name not in names:
+                cache.set(CACHE_NAMES_KEY, names + [name])
+            self.known.add(name)
+
+    def timing(self, name, seconds):
+        self.add(name + "_us", int(seconds * 1000000))
+
+    def count(self, name, n=1):
+        self.add(name, n)
+
+    def summary(self):
+        ''' name: { count, total } for everything reported so far '''
+
+        names = cache.get(CACHE_NAMES_KEY) or []
+        keys = []
+        for name in names:
+            keys.extend([CACHE_PREFIX + name + "_count", CACHE_PREFIX + name + "_total"])
+        values = cache.get_many(keys)
+
+        summary = {}
+        for name in names:
+            summary[name] = { 'count': values.get(CACHE_PREFIX + name + "_count", 0),
+                    'total': values.get(CACHE_PREFIX + name + "_total", 0) }
+        return summary
+
+
+SINKS = {
+    None: NullSink,
+    'null': NullSink,
+    'logging': LoggingSink,
+    'memory': MemorySink,
+    'cache': CacheSink,
+}
+
+# one of each per process, so a MemorySink keeps adding up
+_sinks = {}
+
+
+def get_sink():
+
+    name = getattr(settings, 'AI_PROFILE_SINK', None)
+
+    sink = _sinks.get(name)
+    if sink is None:
+        cls = SINKS.get(name)
+        if cls is None:
+            from django.utils.importlib import import_module
+            module, attr = name.rsplit('.', 1)
+            cls = getattr(import_module(module), attr)
+        sink = _sinks[name] = cls()
+    return sink
+
+
+def report(timings, prefix="ai."):
+    ''' hands everything in timings to the sink '''
+
+    sink = get_sink()
+    if not sink.enabled:
+        return
+
+    for name, value in sorted(timings.items()):
+        # bools are ints too, but they're flags rather than counts
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, float):
+            sink.timing(prefix + name, value)
+        elif isinstance(value, (int, long)):
+            sink.count(prefix + name, value)
+
+    flush = getattr(sink, 'flush', None)
+    if flush is not None:
+        flush()
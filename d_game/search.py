@@ -0,0 +1,229 @@
+""" Anytime beam search for the AI's turn.
+
+The exhaustive search in ai.get_turn lists every candidate turn before
+scoring any of them, so a big enough hand can run past the request
+deadline with nothing to show for it. This search instead grows turns a
+move at a time. Every partial turn is already a turn the AI could stop
+at, so each one gets played out and scored as soon as it's made, and
+only the best few at each depth are followed any further. When the
+budget (wall-clock seconds and/or positions scored) runs out, the best
+turn seen so far is the answer.
+
+Budgets are set per match type in settings.AI_SEARCH_BUDGETS, e.g.
+
+    AI_SEARCH_BUDGETS = {
+        'puzzle': { 'seconds': 20, 'beam': None },
+        'ai': { 'seconds': 3, 'nodes': 20000, 'beam': 32 },
+    }
+
+where beam is how many partial turns to keep at each depth (None keeps
+them all, which makes this a breadth-first exhaustive search that stops
+on time). Match types without a budget use the exhaustive search, and
+none of them have one unless settings gives it them. """
+
+import time
+
+from django.conf import settings
+
+from d_game import game_master, ai
+from d_game.journal import Journal
+from d_game.moves import Move, PASS, TECH, PLAY
+
+
+# what the benchmark_ai and fit_weights commands use for --beam when
+# settings has no budget for AI games
+DEFAULT_BUDGET = { 'seconds': 3, 'nodes': 20000, 'beam': 64 }
+
+
+def get_budget(match_type):
+    ''' the search budget for match_type, or None for the exhaustive search '''
+
+    budgets = getattr(settings, 'AI_SEARCH_BUDGETS', {})
+    return budgets.get(match_type)
+
+
+class Budget(object):
+
+    def __init__(self, seconds=None, nodes=None):
+        self.deadline = None
+        if seconds:
+            self.deadline = time.time() + seconds
+        self.nodes = nodes
+        self.used = 0
+
+    def spend(self):
+        ''' False once there's nothing left to score another position with '''
+
+        if self.nodes is not None and self.used >= self.nodes:
+            return False
+        if self.deadline is not None and time.time() >= self.deadline:
+            return False
+
+        self.used += 1
+        return True
+
+
+def promise(card):
+    ''' rough guess at how much good a card does, for trying the
+    likeliest ones first '''
+    return card.unit_power_level + card.direct_damage + card.resource_bonus
+
+
+def next_moves(game, player, moves):
+    ''' moves which could follow moves (already played on game), most
+    promising first '''
+
+    p = game.players[player]
+
+    hand = []
+    seen = set()
+    for card in p.hand:
+        if card.pk not in seen:
+            seen.add(card.pk)
+            hand.append(card)
+    hand.sort(key=promise, reverse=True)
+
+    options = []
+    for card in hand:
+        if p.current_tech >= card.tech_level:
+            for node_owner, row, x in ai.get_valid_targets(game, player, card):
+                options.append(Move(player, PLAY, card.pk, node_owner, row, x))
+
+    # teching only ever happens first, like in the exhaustive search
+    if not moves and p.tech_ups_remaining_this_turn > 0:
+        for card in hand:
+            options.append(Move(player, TECH, card.pk))
+
+    return options
+
+
+def beam_search(game, player, budget, timings=None):
+    ''' the best (score, turn) found within budget, a dict like the
+    ones in AI_SEARCH_BUDGETS. timings gets the same keys as
+    ai.evaluate_turns fills in, plus how the search went. '''
+
+    if timings is None:
+        timings = {}
+
+    time_begin = time.time()
+    time_moves = time_attacks = time_heuristic = time_undo = 0.0
+
+    width = budget.get('beam')
+    allowance = Budget(budget.get('seconds'), budget.get('nodes'))
+
+    opponent = game_master.get_opponent_name(game, player)
+
+    journal = game.journal
+    own_journal = journal is None
+    if own_journal:
+        journal = game.journal = Journal()
+
+    # partial turns aren't real moves, so keep them out of the match log
+    log = game.log
+    game.log = None
+
+    def score():
+        ''' play out the attacks from here and score the result '''
+
+        temp_timer = time.time()
+        game_master.do_attack_phase(game, player)
+        game_master.heal(game, opponent)
+        game_master.remove_summoning_sickness(game, opponent)
+        game_master.do_attack_phase(game, opponent)
+        temp_heuristic = time.time()
+        h = ai.heuristic(game, player)
+        return h, temp_heuristic - temp_timer, time.time() - temp_heuristic
+
+    pass_turn = (Move(player, PASS),)
+    seen = set()
+    probes = hits = 0
+    depth = 0
+    exhausted = False
+
+    start = journal.mark()
+    try:
+        # doing nothing is always an option
+        allowance.spend()
+        mark = journal.mark()
+        h, t_attacks, t_heuristic = score()
+        journal.undo(mark)
+        time_attacks += t_attacks
+        time_heuristic += t_heuristic
+        best = (h, pass_turn)
+
+        beam = [()]
+        while beam and not exhausted:
+            scored = []
+
+            for moves in beam:
+                temp_timer = time.time()
+                mark = journal.mark()
+                for move in moves:
+                    game_master.do_turn_move(game, player, move)
+                time_moves += time.time() - temp_timer
+
+                for move in next_moves(game, player, moves):
+                    turn = moves + (move,)
+
+                    # different orders of the same moves end up in the
+                    # same place, see ai.Transpositions
+                    probes += 1
+                    key = tuple(sorted(turn))
+                    if key in seen:
+                        hits += 1
+                        continue
+                    seen.add(key)
+
+                    if not allowance.spend():
+                        exhausted = True
+                        break
+
+                    temp_timer = time.time()
+                    child_mark = journal.mark()
+                    game_master.do_turn_move(game, player, move)
+                    time_moves += time.time() - temp_timer
+
+                    h, t_attacks, t_heuristic = score()
+                    time_attacks += t_attacks
+                    time_heuristic += t_heuristic
+
+                    temp_timer = time.time()
+                    journal.undo(child_mark)
+                    time_undo += time.time() - temp_timer
+
+                    scored.append((h, turn))
+                    if h > best[0]:
+                        best = (h, turn)
+
+                temp_timer = time.time()
+                journal.undo(mark)
+                time_undo += time.time() - temp_timer
+
+                if exhausted:
+                    break
+
+            # best first, ties in the order they were found
+            scored.sort(key=lambda s: s[0], reverse=True)
+            if width:
+                scored = scored[:width]
+            beam = [turn for h, turn in scored]
+            depth += 1
+    finally:
+        journal.undo(start)
+        if own_journal:
+            game.journal = None
+        game.log = log
+
+    timings['get_all_possible_turns'] = 0.0
+    timings['candidates'] = allowance.used
+    timings['transposition_probes'] = probes
+    timings['transposition_hits'] = hits
+    timings['moves'] = time_moves
+    timings['attacks'] = time_attacks
+    timings['heuristic'] = time_heuristic
+    timings['undo'] = time_undo
+    timings['evaluate'] = time.time() - time_begin
+    timings['depth'] = depth
+    timings['budget_exhausted'] = exhausted
+
+    return best
@@ -0,0 +1,197 @@
+""" Headless match simulator.
+
+Plays whole matches straight through game_master, with no Match, no
+memcache and no datastore: cards come from a fixture file (pinned as the
+card catalog), decks are dealt from a seeded random.Random, and each side
+is driven by a policy, i.e. a function (game, player) -> list of Moves.
+Matches with the same seed and policies play out the same every time.
+
+Meant for measuring engine and AI changes and for running lots of games
+in one go, see the selfplay management command:
+
+    python manage.py selfplay --games 20 --seed 1 --guest random """
+
+import os
+import random
+import time
+
+from d_game import game_master, ai, catalog, weights
+from d_game.moves import Move, PASS
+
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'fixtures', 'cards.json')
+
+# a match nobody has won by now isn't going anywhere
+MAX_TURNS = 50
+
+HAND_SIZE = 5
+
+
+def ai_policy(latencies=None, budget=None):
+    ''' ai.get_turn, appending how long each decision took (in
+    seconds) to latencies. budget is passed on to get_turn, so None
+    uses the one in settings and {} searches exhaustively '''
+
+    def policy(game, player):
+        start = time.time()
+        moves, turn = ai.get_turn(game, player, budget=budget)
+        if latencies is not None:
+            latencies.append(time.time() - start)
+        return moves
+    return policy
+
+
+def pass_policy(game, player):
+    return [Move(player, PASS)]
+
+
+def random_policy(rng):
+    ''' picks any legal turn, for a scripted opponent that isn't just
+    standing there '''
+
+    def policy(game, player):
+        turns = ai.get_all_possible_turns(game, player)
+        return list(rng.choice(turns))
+    return policy
+
+
+def script_policy(turns):
+    ''' plays turns (lists of moves, with "%s" for the player's name) in
+    order, passing once they run out '''
+
+    turns = list(turns)
+
+    def policy(game, player):
+        if not turns:
+            return pass_policy(game, player)
+        return [Move.parse(move % player) for move in turns.pop(0)]
+    return policy
+
+
+def random_deck(cards, rng, max_points=40):
+    ''' like deckgenerator.create_deck, without saving a Deck '''
+
+    records = cards.records.values()
+    records.sort(key=lambda record: record.pk)
+
+    deck = []
+    total = 0
+    overshots = 5
+
+    while total < max_points and overshots > 0:
+        record = rng.choice(records)
+        points = record.fields.get('card_power_level', 1)
+        if points + total <= max_points:
+            total += points
+            deck.append(record.pk)
+        else:
+            overshots -= 1
+
+    return deck
+
+
+def play_match(policies, seed=0, cards=None, max_turns=MAX_TURNS, life=10, positions=None):
+    ''' Plays one match between 'guest' and 'ai', policies being a dict
+    of player name -> policy. Returns (winner or None, turns played).
+    If positions is a list, the position after every turn gets appended
+    to it as (player, weights.features()) for both players. '''
+
+    rng = random.Random(seed)
+
+    if cards is None:
+        cards = catalog.get_catalog()
+
+    game = game_master.new_game(seed, 'ai', 'kill player', game_master.ANON_PLAYER_NAME,
+            random_deck(cards, rng), random_deck(cards, rng),
+            friendly_life=life, ai_life=life, rng=rng)
+
+    game_master.draw_up_to(game, 'ai', HAND_SIZE)
+    game_master.draw_up_to(game, game.player, HAND_SIZE)
+
+    order = [game.player, 'ai']
+
+    turns = 0
+    while turns < max_turns:
+        for player in order:
+            # same steps as do_turns. the player's opening hand is
+            # all they get on their first turn
+            game_master.heal(game, player)
+            game_master.refill_tech(game, player)
+            if turns > 0:
+                game_master.draw(game, player, game_master.get_player(game, player).num_to_draw)
+            game_master.remove_summoning_sickness(game, player)
+
+            game_master.do_turn(game, player, policies[player](game, player))
+            turns += 1
+
+            if positions is not None:
+                for name in order:
+                    opponent = game_master.get_opponent_name(game, name)
+                    positions.append((name, weights.features(game, name, opponent)))
+
+            winner = game_master.is_game_over(game)
+            if winner:
+                return winner, turns
+
+    return None, turns
+
+
+def percentile(values, p):
+    ''' nearest-rank percentile of values, p in 0-100 '''
+
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    rank = int(round(p / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def run(games=10, seed=0, guest='ai', fixture=DEFAULT_FIXTURE, max_turns=MAX_TURNS):
+    ''' Plays games matches, the ith one seeded with seed + i, and
+    returns a dict of results and timings. guest is how the non-AI side
+    plays: 'ai', 'random' or 'pass'. '''
+
+    catalog.pin(catalog.load_fixture(fixture))
+
+    latencies = []
+    wins = {}
+    turns = 0
+
+    start = time.time()
+    for i in range(games):
+        rng = random.Random(seed + i)
+
+        if guest == 'ai':
+            guest_policy = ai_policy(latencies)
+        elif guest == 'random':
+            guest_policy = random_policy(rng)
+        else:
+            guest_policy = pass_policy
+
+        policies = {
+                game_master.ANON_PLAYER_NAME: guest_policy,
+                'ai': ai_policy(latencies),
+            }
+
+        winner, played = play_match(policies, seed + i, max_turns=max_turns)
+        wins[winner] = wins.get(winner, 0) + 1
+        turns += played
+    elapsed = time.time() - start
+
+    return {
+            'games': games,
+            'turns': turns,
+            'seconds': elapsed,
+            'games_per_second': games / elapsed,
+            'turns_per_second': turns / elapsed,
+            'wins': wins,
+            'ai_decisions': len(latencies),
+            'ai_latency_ms': {
+                'p50': percentile(latencies, 50) * 1000,
+                'p90': percentile(latencies, 90) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': percentile(latencies, 100) * 1000,
+            },
+        }
@@ -0,0 +1,101 @@
+""" Datastore snapshots of games, behind the memcache copy.
+
+Games live in memcache (see d_game.cached), and nothing else used to
+have them, so when memcache dropped one the match started over from
+init_game(). Now cached.save() also hands the game to save() here, which
+every GAME_SNAPSHOT_TURNS versions writes it to the match's GameSnapshot
+(1 is every turn, more than that loses up to that many turns to an
+eviction but writes less, and 0 or None turns snapshots off). When the
+game's not in memcache, cached.get_game() restore()s the latest
+snapshot, and only starts over if there isn't one.
+
+The write is behind the request, as a deferred task (see
+d_game.background), when there's an App Engine task queue to put it
+on, otherwise it's done there and then. Tasks can run out of order, so
+a snapshot never replaces a newer one, which is checked in the same
+datastore transaction as the write.
+
+A snapshot is the game's to_dict() as compressed json. How big they
+are and how long they take to write and restore goes to the profiling
+sink (see d_game.profiling) as snapshot.bytes, snapshot.encode,
+snapshot.write and snapshot.restore. """
+
+import time
+import zlib
+import simplejson
+
+from django.conf import settings
+
+from d_game import profiling
+from d_game.state import GameState
+
+
+def get_turns():
+    return getattr(settings, 'GAME_SNAPSHOT_TURNS', 1)
+
+
+def encode(game):
+    return zlib.compress(simplejson.dumps(game.to_dict(), separators=(',', ':')))
+
+
+def decode(data):
+    return GameState.from_dict(simplejson.loads(zlib.decompress(data)))
+
+
+def save(game):
+    ''' snapshots the game if it's due one '''
+
+    turns = get_turns()
+    if not turns or game.version % turns:
+        return
+
+    from d_game import background
+
+    time_begin = time.time()
+    data = encode(game)
+    profiling.report({ 'bytes': len(data), 'encode': time.time() - time_begin }, prefix="snapshot.")
+
+    if background.is_remote():
+        background.defer(write, game.pk, game.version, data)
+    else:
+        write(game.pk, game.version, data)
+
+
+def write(match_id, version, data):
+
+    from d_game.models import GameSnapshot
+    from utils.util import run_in_transaction
+
+    time_begin = time.time()
+
+    def replace():
+        # the compare and the put go together, or a task for an older
+        # version could get in between and undo a newer one
+        latest = GameSnapshot.objects.filter(id=match_id)[:1]
+        if latest and latest[0].version > version:
+            return False
+
+        GameSnapshot(id=match_id, match_id=match_id, version=version, data=data).save()
+        return True
+
+    if not run_in_transaction(replace):
+        return
+
+    profiling.report({ 'write': time.time() - time_begin }, prefix="snapshot.")
+
+
+def restore(match_id):
+    ''' the game as it was last snapshotted, or None '''
+
+    from d_game.models import GameSnapshot
+
+    time_begin = time.time()
+
+    snapshots = GameSnapshot.objects.filter(id=match_id)[:1]
+    if not snapshots:
+        return None
+
+    game = decode(snapshots[0].data)
+
+    profiling.report({ 'restore': time.time() - time_begin }, prefix="snapshot.")
+    return game
@@ -0,0 +1,322 @@
+""" Object model for a game in progress.
+
+The engine used to work on the nested dict that gets shipped to the
+client, which meant formatting a "row_x" string and doing three or four
+dict lookups for every node access, and carrying a full model_to_dict
+copy of a card around with every unit. Here each side of the board is a
+fixed list indexed by d_board.topology.node_index(row, x), and units
+point at a shared CardRecord instead of copying it.
+
+GameState.from_dict() and GameState.to_dict() convert to and from the
+old dict shape, which is still what goes over the wire, into memcache
+and to the javascript client. """
+
+import simplejson
+
+from d_board.topology import NUM_NODES, NODE_KEYS, KEY_INDEX
+
+
+# card fields the engine reads, with the defaults from d_cards.models.Card
+# for anything missing (e.g. cards loaded from an older fixture)
+CARD_FIELDS = (
+        ('name', ''),
+        ('unit_power_level', 0),
+        ('attack', 1),
+        ('defense', 1),
+        ('attack_type', 'na'),
+        ('tech_level', 1),
+        ('tech_change', 0),
+        ('resource_bonus', 0),
+        ('draw_num', 0),
+        ('rubble_duration', 1),
+        ('target_alignment', 'friendly'),
+        ('target_occupant', 'empty'),
+        ('target_aiming', 'chosen'),
+        ('direct_damage', 0),
+    )
+
+CARD_FIELD_NAMES = tuple([field[0] for field in CARD_FIELDS])
+
+
+class CardRecord(object):
+    ''' Read-only view of a card. One record is shared by every hand,
+    library and unit that refers to the same card, so nothing should
+    ever write to it (or to its fields dict). '''
+
+    __slots__ = ('pk', 'fields', 'json') + CARD_FIELD_NAMES
+
+    def __init__(self, pk, fields, json=None):
+        self.pk = pk
+        self.fields = fields
+        for name, default in CARD_FIELDS:
+            setattr(self, name, fields.get(name, default))
+
+        # serialized form of to_dict(), filled in by to_json()
+        self.json = json
+
+    def to_dict(self):
+        return { 'pk': self.pk, 'fields': self.fields }
+
+    def to_json(self):
+        if self.json is None:
+            self.json = simplejson.dumps(self.to_dict())
+        return self.json
+
+    def from_dict(card, cards=None):
+        ''' cards is an optional {pk: CardRecord} memo used to share
+        records between everything converted in one go '''
+
+        if cards is not None:
+            try:
+                return cards[card['pk']]
+            except KeyError:
+                pass
+
+        record = CardRecord(card['pk'], card['fields'])
+        if cards is not None:
+            cards[record.pk] = record
+        return record
+
+    from_dict = staticmethod(from_dict)
+
+    # records are immutable, so copies can share them
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        # the json is cheap to rebuild, so it isn't worth pickling
+        return (self.pk, self.fields)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "<CardRecord %s: %s>" % (self.pk, self.name)
+
+
+class Unit(object):
+    ''' Anything occupying a node: a living unit or the rubble it left
+    behind. Only the per-instance values live here, everything else is
+    read from the shared card. '''
+
+    __slots__ = ('card', 'type', 'player', 'row', 'x', 'damage', 'attack_delay', 'rubble_duration')
+
+    def __init__(self, card, player, row, x, type='unit', damage=0, attack_delay=1, rubble_duration=None):
+        self.card = card
+        self.type = type
+        self.player = player
+        self.row = row
+        self.x = x
+        self.damage = damage
+        self.attack_delay = attack_delay
+
+        if rubble_duration is None:
+            rubble_duration = card.rubble_duration
+        self.rubble_duration = rubble_duration
+
+    def to_dict(self):
+
+        fields = self.card.fields
+        if self.rubble_duration != self.card.rubble_duration:
+            # rubble counts down on the unit, not the card
+            fields = dict(fields)
+            fields['rubble_duration'] = self.rubble_duration
+
+        return {
+                'pk': self.card.pk,
+                'fields': fields,
+                'type': self.type,
+                'player': self.player,
+                'row': self.row,
+                'x': self.x,
+                'damage': self.damage,
+                'attack_delay': self.attack_delay,
+            }
+
+    def from_dict(node, cards=None):
+
+        if not node or node.get('type', 'empty') == 'empty':
+            # blank nodes are empty dicts
+            return None
+
+        card = CardRecord.from_dict(node, cards)
+
+        return Unit(card,
+                node.get('player'),
+                node.get('row'),
+                node.get('x'),
+                type=node['type'],
+                damage=node.get('damage', 0),
+                attack_delay=node.get('attack_delay', 0),
+                rubble_duration=node['fields'].get('rubble_duration', card.rubble_duration))
+
+    from_dict = staticmethod(from_dict)
+
+    def __getstate__(self):
+        return (self.card, self.type, self.player, self.row, self.x, self.damage, self.attack_delay, self.rubble_duration)
+
+    def __setstate__(self, state):
+        (self.card, self.type, self.player, self.row, self.x, self.damage, self.attack_delay, self.rubble_duration) = state
+
+    def __repr__(self):
+        return "<Unit %s %s %s_%s>" % (self.card.name, self.type, self.row, self.x)
+
+
+class PlayerState(object):
+
+    __slots__ = ('name', 'life', 'tech', 'current_tech', 'tech_ups_remaining_this_turn',
+            'num_to_draw', 'hand', 'library', 'board')
+
+    def __init__(self, name, life=1, tech=1, library=None):
+        self.name = name
+        self.life = life
+        self.tech = tech
+        self.current_tech = tech
+        self.tech_ups_remaining_this_turn = 1
+        self.num_to_draw = 1
+        self.hand = []
+        self.library = library or []
+
+        # one slot per node, None when it's empty
+        self.board = [None] * NUM_NODES
+
+    def to_dict(self):
+
+        board = {}
+        for i in range(NUM_NODES):
+            unit = self.board[i]
+            if unit:
+                board[NODE_KEYS[i]] = unit.to_dict()
+            else:
+                board[NODE_KEYS[i]] = {}
+
+        return {
+                'life': self.life,
+                'tech': self.tech,
+                'current_tech': self.current_tech,
+                'tech_ups_remaining_this_turn': self.tech_ups_remaining_this_turn,
+                'hand': [card.to_dict() for card in self.hand],
+                'num_to_draw': self.num_to_draw,
+                'library': [card.to_dict() for card in self.library],
+                'board': board,
+            }
+
+    def from_dict(name, player, cards=None):
+
+        p = PlayerState(name, player['life'], player['tech'])
+        p.current_tech = player['current_tech']
+        p.tech_ups_remaining_this_turn = player['tech_ups_remaining_this_turn']
+        p.num_to_draw = player['num_to_draw']
+        p.hand = [CardRecord.from_dict(card, cards) for card in player['hand']]
+        p.library = [CardRecord.from_dict(card, cards) for card in player['library']]
+
+        for key, node in player['board'].items():
+            p.board[KEY_INDEX[key]] = Unit.from_dict(node, cards)
+
+        return p
+
+    from_dict = staticmethod(from_dict)
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in PlayerState.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(PlayerState.__slots__, state):
+            setattr(self, name, value)
+
+
+class GameState(object):
+
+    __slots__ = ('pk', 'type', 'goal', 'current_phase', 'player', 'current_player',
+            'version', 'players', 'opponents', 'journal', 'log', 'digest')
+
+    # per-request helpers which aren't part of the game itself
+    TRANSIENT = ('journal', 'log', 'digest')
+
+    def __init__(self, pk, type, goal, player, players):
+        self.pk = pk
+        self.type = type
+        self.goal = goal
+        self.current_phase = 0
+        self.player = player
+        self.current_player = player
+
+        # goes up by one every end_turn, see d_game.delta
+        self.version = 0
+
+        # name -> PlayerState
+        self.players = players
+
+        # name -> opponent's name, so we don't need to search for it
+        self.opponents = {}
+        for name in players:
+            for other in players:
+                if other != name:
+                    self.opponents[name] = other
+
+        # d_game.journal.Journal recording changes, if anyone's listening
+        self.journal = None
+
+        # d_game.match_log.MatchLog for the current request, if any
+        self.log = None
+
+        # see d_game.digest, None until someone asks for it
+        self.digest = None
+
+    def opponent(self, player):
+        return self.opponents.get(player)
+
+    def to_dict(self):
+
+        players = {}
+        for name, p in self.players.items():
+            players[name] = p.to_dict()
+
+        return {
+                'pk': self.pk,
+                'type': self.type,
+                'goal': self.goal,
+                'current_phase': self.current_phase,
+                'player': self.player,
+                'current_player': self.current_player,
+                'version': self.version,
+                'players': players,
+            }
+
+    def from_dict(game):
+
+        # shared between both players so each card has a single record.
+        # hands and libraries go first since rubble on the board has
+        # already counted its rubble_duration down
+        cards = {}
+        for player in game['players'].values():
+            for card in player['hand'] + player['library']:
+                CardRecord.from_dict(card, cards)
+
+        players = {}
+        for name, player in game['players'].items():
+            players[name] = PlayerState.from_dict(name, player, cards)
+
+        g = GameState(game['pk'], game['type'], game['goal'], game['player'], players)
+        g.current_phase = game['current_phase']
+        g.current_player = game['current_player']
+        g.version = game.get('version', 0)
+        return g
+
+    from_dict = staticmethod(from_dict)
+
+    def __getstate__(self):
+        state = []
+        for name in GameState.__slots__:
+            if name in GameState.TRANSIENT:
+                state.append(None)
+            else:
+                state.append(getattr(self, name))
+        return state
+
+    def __setstate__(self, state):
+        for name, value in zip(GameState.__slots__, state):
+            setattr(self, name, value)
@@ -5,8 +5,27 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.conf import settings
+from django.core import serializers
 from django.test import TestCase
 
+import random
+import simplejson
+
+from d_game import game_master
+from d_game.state import GameState, CardRecord, Unit
+from d_game.attack_paths import ATTACK_PATHS
+from d_game.journal import Journal
+from d_game.moves import Move, parse_turn, format_turn
+from d_game.catalog import CardCatalog
+from d_game import catalog, simulator, search, minimax, decisions, profiling, background
+from d_game import cached, snapshots, packing, censor, clone
+from d_game import delta, digest, ai, parallel, batch, weights
+from d_board.topology import NODES
+from d_cards import fragments
+from d_cards.fragments import CardFragments
+from d_cards.models import Card
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +33,1101 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def card_dict(pk, **fields):
+    card = {
+            'name': 'Card %s' % pk,
+            'attack': 1,
+            'defense': 1,
+            'attack_type': 'melee',
+            'tech_level': 1,
+            'unit_power_level': 1,
+            'rubble_duration': 1,
+        }
+    card.update(fields)
+    return { 'pk': pk, 'fields': card }
+
+
+def game_dict():
+
+    game = {
+            'pk': 1,
+            'type': 'ai',
+            'goal': 'kill player',
+            'current_phase': 0,
+            'player': 'guest',
+            'current_player': 'guest',
+            'version': 0,
+            'players': {},
+        }
+
+    for name in ('guest', 'ai'):
+        board = {}
+        for row in range(3):
+            for x in range(-row, row + 1):
+                board["%s_%s" % (row, x)] = {}
+
+        game['players'][name] = {
+                'life': 10,
+                'tech': 2,
+                'current_tech': 2,
+                'tech_ups_remaining_this_turn': 1,
+                'hand': [card_dict(1), card_dict(2, tech_level=2)],
+                'num_to_draw': 1,
+                'library': [card_dict(1), card_dict(3, attack_type='ranged')],
+                'board': board,
+            }
+
+    unit = card_dict(1)
+    unit.update({ 'type': 'unit', 'damage': 1, 'player': 'ai', 'row': 1, 'x': -1, 'attack_delay': 0 })
+    game['players']['ai']['board']['1_-1'] = unit
+
+    rubble = card_dict(4, rubble_duration=0)
+    rubble.update({ 'type': 'rubble', 'damage': 2, 'player': 'guest', 'row': 2, 'x': 2, 'attack_delay': 0 })
+    game['players']['guest']['board']['2_2'] = rubble
+
+    return game
+
+
+class GameStateTest(TestCase):
+
+    def test_dict_round_trip(self):
+        game = game_dict()
+        self.assertEqual(GameState.from_dict(game).to_dict(), game)
+
+    def test_cards_are_shared(self):
+        state = GameState.from_dict(game_dict())
+        ai = state.players['ai']
+        self.assertTrue(ai.hand[0] is ai.library[0])
+        self.assertTrue(ai.board[1].card is ai.hand[0])
+
+
+class CloneTest(TestCase):
+
+    def test_same_game(self):
+        game = GameState.from_dict(game_dict())
+        self.assertEqual(clone.clone_game(game).to_dict(), game.to_dict())
+
+    def test_shares_only_cards(self):
+        game = GameState.from_dict(game_dict())
+        before = game.to_dict()
+
+        c = clone.clone_game(game)
+        self.assertTrue(c.players['ai'].hand[0] is game.players['ai'].hand[0])
+        self.assertTrue(c.players['ai'].board[1].card is game.players['ai'].board[1].card)
+
+        c.players['ai'].board[1].damage += 1
+        c.players['ai'].board[0] = None
+        c.players['ai'].hand.pop()
+        c.players['guest'].library.pop()
+        c.players['guest'].life -= 1
+        c.version += 1
+        self.assertEqual(game.to_dict(), before)
+
+
+def walking_attack(game, attacking_player, unit):
+    """ do_attack as it was before the attack path tables, for comparison """
+
+    if unit.attack_delay > 0:
+        return
+
+    attacked_player = game_master.get_opponent_name(game, attacking_player)
+
+    row = int(unit.row)
+    x = int(unit.x)
+
+    alignment = attacking_player
+    steps_taken = 0
+
+    card = unit.card
+
+    if card.attack_type == "na" or card.attack_type == "counterattack":
+        return
+
+    while True:
+        if alignment != attacking_player:
+            d_row = -1
+        elif row == 2:
+            d_row = 0
+            alignment = attacked_player
+        else:
+            d_row = 1
+
+        row += d_row
+
+        if x != 0 and abs(x) > row:
+            x = row * x / abs(x)
+
+        steps_taken += 1
+
+        if card.attack_type == "flying" and steps_taken < 3:
+            continue
+
+        if alignment == attacking_player and card.attack_type == "ranged":
+            continue
+
+        next_node = game_master.get_node(game, alignment, row, x)
+
+        if next_node and next_node.type == "unit":
+            if alignment != attacking_player:
+                game_master.damage_unit(game, card.attack, next_node, unit)
+            return
+
+        elif row == 0 and x == 0:
+            if not (attacked_player == "ai" and game.goal == 'kill units'):
+                game_master.get_player(game, attacked_player).life -= card.attack
+            return
+
+
+class AttackPathTest(TestCase):
+
+    ATTACK_TYPES = ('melee', 'ranged', 'flying', 'wall', 'na', 'counterattack')
+
+    def random_game(self, rnd, attacker_type, row, x):
+
+        cards = [
+                CardRecord(1, card_dict(1, defense=2)['fields']),
+                CardRecord(2, card_dict(2, attack_type='counterattack')['fields']),
+                CardRecord(3, card_dict(3, rubble_duration=0)['fields']),
+            ]
+
+        game = GameState.from_dict(game_dict())
+        for name in game.players:
+            board = game.players[name].board
+            for i in range(len(NODES)):
+                board[i] = None
+                roll = rnd.random()
+                if roll < 0.4:
+                    board[i] = Unit(rnd.choice(cards), name, NODES[i][0], NODES[i][1], attack_delay=0)
+                elif roll < 0.5:
+                    board[i] = Unit(cards[0], name, NODES[i][0], NODES[i][1], type='rubble')
+
+        attacker = Unit(CardRecord(9, card_dict(9, attack=2, attack_type=attacker_type)['fields']),
+                'guest', row, x, attack_delay=0)
+        game_master.set_node(game, 'guest', row, x, attacker)
+
+        return game, attacker
+
+    def test_table_covers_every_node(self):
+        for attack_type, paths in ATTACK_PATHS.items():
+            self.assertEqual(len(paths), len(NODES))
+
+    def test_matches_walking_attack(self):
+
+        rnd = random.Random(0)
+
+        for attack_type in self.ATTACK_TYPES:
+            for row, x in NODES:
+                for i in range(50):
+                    seed = rnd.random()
+
+                    walked, attacker = self.random_game(random.Random(seed), attack_type, row, x)
+                    walking_attack(walked, 'guest', attacker)
+
+                    tabled, attacker = self.random_game(random.Random(seed), attack_type, row, x)
+                    game_master.do_attack(tabled, 'guest', attacker)
+
+                    self.assertEqual(walked.to_dict(), tabled.to_dict())
+
+
+class JournalTest(TestCase):
+
+    def test_undo_restores_game(self):
+
+        game = GameState.from_dict(game_dict())
+        before = game.to_dict()
+
+        game.journal = Journal()
+        game_master.draw(game, 'guest', 1)
+        game_master.do_turn_move(game, 'guest', Move.parse('guest tech 2'))
+        game_master.do_turn_move(game, 'guest', Move.parse('guest play 1 guest 1 -1'))
+        game_master.remove_summoning_sickness(game, 'guest')
+        game_master.do_attack_phase(game, 'guest')
+        game_master.do_attack_phase(game, 'ai')
+        game_master.remove_rubble(game, 'guest')
+
+        self.assertNotEqual(game.to_dict(), before)
+
+        game.journal.undo()
+        self.assertEqual(game.to_dict(), before)
+        self.assertEqual(len(game.journal), 0)
+
+    def test_undo_to_mark(self):
+
+        game = GameState.from_dict(game_dict())
+        game.journal = Journal()
+
+        game_master.tech(game, 'ai', 1)
+        after_tech = game.to_dict()
+
+        mark = game.journal.mark()
+        game_master.heal(game, 'ai')
+        game_master.draw(game, 'ai', 2)
+        game.journal.undo(mark)
+
+        self.assertEqual(game.to_dict(), after_tech)
+
+
+class CardCatalogTest(TestCase):
+
+    def setUp(self):
+        cards = [card_dict(1), card_dict(2, attack_type='ranged')]
+        self.catalog = CardCatalog(1, [CardRecord(c['pk'], c['fields']) for c in cards])
+
+    def test_get(self):
+
+        self.assertEqual(self.catalog.get(2).attack_type, 'ranged')
+        self.assertTrue(self.catalog.get('1') is self.catalog.get(1))
+        self.assertEqual(self.catalog.get(3), None)
+
+    def test_get_many(self):
+
+        records = self.catalog.get_many([2, '1', 3, 2])
+        self.assertEqual([r.pk for r in records], [2, 1, 2])
+        self.assertTrue(records[0] is records[2])
+
+    def test_cache_round_trip(self):
+
+        catalog = CardCatalog.from_cache(1, self.catalog.to_cache())
+        for pk in (1, 2):
+            self.assertEqual(catalog.get(pk).to_dict(), self.catalog.get(pk).to_dict())
+            self.assertEqual(catalog.get(pk).json, self.catalog.get(pk).to_json())
+
+
+class CardFragmentsTest(TestCase):
+
+    def setUp(self):
+        self.cards = [Card(pk=1, name='Soldier', defense=2, attack_type='melee'),
+                Card(pk=2, name='Archer "the quick"', attack_type='ranged'),
+                Card(pk=3, name='Fireball', defense=0, direct_damage=2),
+                Card(pk=4, name='Squire', defense=1, attack_type='melee')]
+        self.fragments = CardFragments.from_models(1, self.cards)
+
+    def test_sorted_json(self):
+
+        # what get_all_cards_sorted used to build for every request
+        organized = {}
+        for card in self.cards:
+            organized.setdefault(fragments.category(card), []).append(card)
+        expected = simplejson.dumps([{ 'category': category, 'cards': serializers.serialize("json", cards) }
+                for category, cards in organized.items()])
+
+        self.assertEqual(self.fragments.sorted_json(), expected)
+
+        from_cache = CardFragments.from_cache(1, self.fragments.to_cache())
+        self.assertEqual(from_cache.sorted_json(), expected)
+
+    def test_card_json(self):
+        self.assertEqual("[%s]" % self.fragments.get(2), serializers.serialize("json", [self.cards[1]]))
+
+    def test_json_is_the_card_as_it_is(self):
+
+        from django.core.cache import cache
+        from d_cards.models import card_generation
+
+        # what memcache has for the cards' current generation
+        cache.set(fragments.cache_key(card_generation()), self.fragments.to_cache())
+        fragments.reset()
+
+        card = Card(pk=2, name='Archer "the quick"', attack_type='ranged', attack=4)
+        self.assertEqual(card.json(), serializers.serialize("json", [card]))
+
+        # as if it came from the datastore like that, changes after that
+        # don't get the card as it's saved either
+        card = self.cards[1]
+        card._state.adding = False
+        self.assertEqual(card.json(), "[%s]" % self.fragments.get(2))
+        card.attack = 4
+        self.assertEqual(card.json(), serializers.serialize("json", [card]))
+        fragments.reset()
+
+
+def apply_deltas(game, deltas):
+    ''' what game_master.js does with them '''
+
+    for d in deltas:
+        player = game['players'][d[1]]
+        if d[0] == delta.PLAYER:
+            player[d[2]] = d[3]
+        elif d[0] == delta.NODE:
+            player['board'][d[2]] = d[3]
+        elif d[0] == delta.HAND:
+            player['hand'] = d[2]
+        elif d[0] == delta.LIBRARY:
+            player['library'] = d[2]
+
+
+class DeltaTest(TestCase):
+
+    def test_deltas_bring_client_up_to_date(self):
+
+        game = GameState.from_dict(game_dict())
+        client = game_master.get_censored(game, 'guest')
+
+        game.journal = Journal()
+        game_master.heal(game, 'guest')
+        game_master.do_turn_move(game, 'guest', Move.parse('guest tech 2'))
+        game_master.do_turn_move(game, 'guest', Move.parse('guest play 1 guest 1 -1'))
+        game_master.remove_summoning_sickness(game, 'guest')
+        game_master.draw(game, 'ai', 1)
+        game_master.do_attack_phase(game, 'guest')
+        game_master.do_attack_phase(game, 'ai')
+        game_master.remove_rubble(game, 'guest')
+
+        apply_deltas(client, delta.get_deltas(game, game.journal.entries, 'guest'))
+        self.assertEqual(client, game_master.get_censored(game, 'guest'))
+
+    def test_opponent_hand_is_censored(self):
+
+        game = GameState.from_dict(game_dict())
+        game.journal = Journal()
+        game_master.draw(game, 'ai', 1)
+
+        for d in delta.get_deltas(game, game.journal.entries, 'guest'):
+            if d[0] == delta.HAND:
+                self.assertEqual(d[2], { 'length': 3 })
+
+
+class CensorTest(TestCase):
+
+    def expected(self, game, viewer):
+        ''' the whole game as dicts, with the hidden parts swapped out '''
+
+        censored = game.to_dict()
+        censored['player'] = viewer
+        for name, p in censored['players'].items():
+            if name != viewer:
+                p['hand'] = { 'length': len(p['hand']) }
+            p['library'] = { 'length': len(p['library']) }
+        return censored
+
+    def test_same_as_censoring_the_dicts(self):
+
+        game = GameState.from_dict(game_dict())
+
+        # rubble that's counted down, whose fields aren't the card's
+        game.players['guest'].board[NODES.index((2, 2))].rubble_duration = 3
+
+        for viewer in ('guest', 'ai', 'spectator'):
+            self.assertEqual(simplejson.loads(censor.censored_json(game, viewer)), self.expected(game, viewer))
+
+    def test_splice(self):
+
+        fields = { 'deltas': [['pl', 'ai', 'life', 3]], 'version': 2, 'digest_after_ai': None }
+        card = CardRecord(1, card_dict(1)['fields'])
+
+        for f in (fields, {}):
+            expected = dict(f)
+            expected['player_draw'] = [card.to_dict()]
+            self.assertEqual(simplejson.loads(censor.splice(f, 'player_draw', "[%s]" % card.to_json())), expected)
+
+    def test_finish_turns(self):
+
+        game = GameState.from_dict(game_dict())
+        game.pk = 9
+        guest = game.players['guest']
+        drawn = guest.library[:guest.num_to_draw]
+
+        # what it used to send, all encoded in one go
+        expected = simplejson.loads(simplejson.dumps({
+                'player_draw': [card.to_dict() for card in drawn],
+                'ai_turn': [],
+                'base_version': 0,
+                'version': 1,
+                'deltas': [],
+                'digest_before_ai': 'a',
+                'digest_after_ai': 'b',
+            }))
+
+        self.assertEqual(simplejson.loads(game_master.finish_turns(game, 0, [], [], 'a', 'b')), expected)
+
+
+class DigestTest(TestCase):
+
+    def play_a_turn(self, game):
+        game_master.heal(game, 'guest')
+        game_master.do_turn_move(game, 'guest', Move.parse('guest tech 2'))
+        game_master.do_turn_move(game, 'guest', Move.parse('guest play 1 guest 1 -1'))
+        game_master.remove_summoning_sickness(game, 'guest')
+        game_master.do_attack_phase(game, 'guest')
+        game_master.do_attack_phase(game, 'ai')
+        game_master.remove_rubble(game, 'guest')
+
+    def test_incremental_matches_full(self):
+
+        game = GameState.from_dict(game_dict())
+        before = digest.get_digest(game)
+
+        self.play_a_turn(game)
+
+        self.assertNotEqual(game.digest, before)
+        self.assertEqual(game.digest, digest.compute(game))
+
+    def test_undo_restores_digest(self):
+
+        game = GameState.from_dict(game_dict())
+        before = digest.get_digest(game)
+
+        game.journal = Journal()
+        self.play_a_turn(game)
+        game.journal.undo()
+
+        self.assertEqual(game.digest, before)
+
+    def test_same_position_same_key(self):
+
+        a = GameState.from_dict(game_dict())
+        b = GameState.from_dict(game_dict())
+        self.assertEqual(digest.position_key(a, 'ai'), digest.position_key(b, 'ai'))
+
+        game_master.draw(b, 'ai', 1)
+        self.assertEqual(digest.get_digest(a), digest.get_digest(b))
+        self.assertNotEqual(digest.position_key(a, 'ai'), digest.position_key(b, 'ai'))
+
+
+class SimulatorTest(TestCase):
+
+    def setUp(self):
+        catalog.pin(catalog.load_fixture(simulator.DEFAULT_FIXTURE))
+
+    def tearDown(self):
+        catalog.reset()
+
+    def test_same_seed_same_match(self):
+
+        def play(seed):
+            policies = {
+                    'guest': simulator.random_policy(random.Random(seed)),
+                    'ai': simulator.ai_policy(),
+                }
+            return simulator.play_match(policies, seed, max_turns=10)
+
+        self.assertEqual(play(3), play(3))
+
+    def test_scripted_player(self):
+
+        policies = {
+                'guest': simulator.script_policy([["%s pass"]] * 3),
+                'ai': simulator.pass_policy,
+            }
+        self.assertEqual(simulator.play_match(policies, max_turns=6), (None, 6))
+
+    def test_selfplay_command(self):
+
+        from StringIO import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('selfplay', games=1, guest='random', json=True, stdout=out)
+        self.assertEqual(simplejson.loads(out.getvalue())['games'], 1)
+
+
+class MoveTest(TestCase):
+
+    def test_text_round_trip(self):
+
+        lines = ['robfitz play 123 ai 2 -1', 'robfitz tech 123', 'robfitz pass']
+        turn = parse_turn(lines)
+
+        self.assertEqual(turn[0], Move('robfitz', 'play', 123, 'ai', 2, -1))
+        self.assertEqual(turn[0].x, -1)
+        self.assertEqual(format_turn(turn), "\n".join(lines))
+
+        # junk from the client doesn't do anything
+        self.assertEqual(Move.parse('robfitz').action, 'pass')
+        self.assertEqual(Move.parse('pass robfitz').card, None)
+
+    def test_turns_are_made_lazily(self):
+
+        game = GameState.from_dict(game_dict())
+        turns = ai.iter_turns(game, 'guest')
+
+        self.assertEqual(turns.next(), (Move('guest', 'pass'),))
+        self.assertEqual([turns.next()] + list(turns), ai.get_all_possible_turns(game, 'guest')[1:])
+
+
+class TranspositionTest(TestCase):
+
+    def test_no_equivalent_turns(self):
+
+        game = GameState.from_dict(game_dict())
+        hand = game.players['guest'].hand
+        hand.extend([hand[0], hand[0]])
+
+        transpositions = ai.Transpositions()
+        turns = ai.get_all_possible_turns(game, 'guest', transpositions=transpositions)
+
+        def plays(turn):
+            return tuple(sorted(turn))
+
+        self.assertEqual(len(set(map(plays, turns))), len(turns))
+        self.assertTrue(transpositions.hits > 0)
+
+
+class BeamSearchTest(TestCase):
+
+    def test_out_of_budget_still_answers(self):
+
+        game = GameState.from_dict(game_dict())
+        before = game.to_dict()
+
+        timings = {}
+        h, turn = search.beam_search(game, 'guest', { 'nodes': 1 }, timings)
+
+        self.assertEqual(turn, (Move('guest', 'pass'),))
+        self.assertTrue(timings['budget_exhausted'])
+        self.assertEqual(game.to_dict(), before)
+
+    def test_unpruned_search_finds_the_best_turn(self):
+
+        game = GameState.from_dict(game_dict())
+        best = ai.evaluate_turns(game, 'guest', ai.get_all_possible_turns(game, 'guest'))
+
+        h, turn = search.beam_search(game, 'guest', { 'beam': None })
+        self.assertTrue(h >= best[0])
+
+    def test_opt_in(self):
+        # the exhaustive search is the default, puzzles especially
+        for match_type in ('ai', 'puzzle'):
+            self.assertEqual(search.get_budget(match_type), None)
+
+
+class AlphaBetaTest(TestCase):
+
+    def test_depth_one_is_the_exhaustive_search(self):
+
+        game = GameState.from_dict(game_dict())
+        best = ai.evaluate_turns(game, 'guest', ai.get_all_possible_turns(game, 'guest'))
+
+        self.assertEqual(minimax.alphabeta(game, 'guest', { 'depth': 1 }), best)
+
+    def test_two_ply_leaves_the_game_alone(self):
+
+        game = GameState.from_dict(game_dict())
+        before = game.to_dict()
+
+        timings = {}
+        h, turn = minimax.alphabeta(game, 'guest', { 'depth': 2, 'width': 4 }, timings)
+
+        self.assertEqual(game.to_dict(), before)
+        self.assertTrue(timings['nodes'] > 0)
+        self.assertTrue(timings['searched'] <= 4)
+        self.assertTrue(turn in ai.get_all_possible_turns(game, 'guest'))
+
+    def test_no_deeper_than_two(self):
+        game = GameState.from_dict(game_dict())
+        self.assertRaises(ValueError, minimax.alphabeta, game, 'guest', { 'depth': 3 })
+
+    def test_sample_hand_doesnt_peek(self):
+
+        game = GameState.from_dict(game_dict())
+        guest = game.players['guest']
+
+        # card 2 is only in the hand
+        for seed in range(20):
+            hand = minimax.sample_hand(game, 'guest', random.Random(seed))
+            self.assertEqual(len(hand), len(guest.hand) + guest.num_to_draw)
+            self.assertFalse(2 in [card.pk for card in hand])
+
+        guest.library = []
+        self.assertEqual(minimax.sample_hand(game, 'guest', random.Random(0)), [])
+
+
+class DecisionCacheTest(TestCase):
+
+    def puzzle(self, player='guest'):
+        ''' the test game as a puzzle, with the human called player '''
+
+        data = simplejson.loads(simplejson.dumps(game_dict()).replace('"guest"', '"%s"' % player))
+        data['type'] = 'puzzle'
+        return GameState.from_dict(data)
+
+    def test_repeat_positions_are_remembered(self):
+
+        game = self.puzzle()
+        moves, turn = ai.get_turn(game, 'ai', budget={})
+
+        # somebody else gets to the same place
+        timings = {}
+        game = self.puzzle('robfitz')
+        again, turn = ai.get_turn(game, 'ai', timings, budget={})
+
+        self.assertEqual(timings['candidates'], 0)
+        self.assertEqual([str(move).replace('robfitz', 'guest') for move in again], map(str, moves))
+
+    def test_card_edits_start_afresh(self):
+
+        from d_cards.models import new_card_generation
+
+        game = self.puzzle()
+        moves, turn = ai.get_turn(game, 'ai', budget={})
+        self.assertNotEqual(decisions.get(game, 'ai'), None)
+
+        new_card_generation()
+        self.assertEqual(decisions.get(game, 'ai'), None)
+
+    def test_memcache_losing_everything(self):
+
+        from django.core.cache import cache
+        from d_cards.models import CARD_GENERATION_KEY
+        from d_game.models import AIDecision, PUZZLE_GENERATION_KEY
+
+        game = self.puzzle()
+        moves, turn = ai.get_turn(game, 'ai', budget={})
+        key = decisions.cache_key(game, 'ai')
+
+        # the generations come back from the datastore, and so does the turn
+        cache.delete(CARD_GENERATION_KEY)
+        cache.delete(PUZZLE_GENERATION_KEY)
+        cache.delete(key)
+        self.assertEqual(decisions.cache_key(game, 'ai'), key)
+        self.assertEqual(list(decisions.get(game, 'ai')), list(moves))
+
+        # and deciding again doesn't add another row
+        decisions.put(game, 'ai', moves)
+        self.assertEqual(AIDecision.objects.filter(key=key).count(), 1)
+
+    def test_cut_short_answers_are_forgotten(self):
+
+        from d_cards.models import new_card_generation
+
+        # nothing left over from the other tests
+        new_card_generation()
+
+        game = self.puzzle()
+        timings = {}
+        ai.get_turn(game, 'ai', timings, budget={ 'nodes': 1 })
+
+        self.assertTrue(timings['budget_exhausted'])
+        self.assertEqual(decisions.get(game, 'ai'), None)
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        self.sink = getattr(settings, 'AI_PROFILE_SINK', None)
+
+    def tearDown(self):
+        settings.AI_PROFILE_SINK = self.sink
+
+    def test_memory_sink_adds_up(self):
+
+        settings.AI_PROFILE_SINK = 'memory'
+        sink = profiling.get_sink()
+        sink.reset()
+
+        timings = {}
+        game = GameState.from_dict(game_dict())
+        ai.get_turn(game, 'ai', timings, budget={})
+        ai.get_turn(game, 'ai', budget={})
+
+        stats = sink.summary()
+        self.assertEqual(stats['ai.candidates']['count'], 2)
+        self.assertEqual(stats['ai.candidates']['total'], 2 * timings['candidates'])
+        self.assertTrue(stats['ai.total']['max'] >= stats['ai.total']['min'] > 0)
+
+    def test_nothing_in_the_match_log(self):
+
+        from d_game.match_log import MatchLog, NOTE
+
+        settings.AI_PROFILE_SINK = None
+        game = GameState.from_dict(game_dict())
+        game.log = MatchLog(game)
+        ai.get_turn(game, 'ai', budget={})
+
+        self.assertEqual([event for event in game.log.events if event[0] == NOTE], [])
+
+    def test_cache_sink(self):
+
+        sink = profiling.CacheSink()
+        sink.count('test.thing', 3)
+        sink.count('test.thing', 4)
+        sink.timing('test.time', 0.5)
+
+        summary = sink.summary()
+        self.assertEqual(summary['test.thing'], { 'count': 2, 'total': 7 })
+        self.assertEqual(summary['test.time_us'], { 'count': 1, 'total': 500000 })
+
+
+class BackgroundTest(TestCase):
+
+    def setUp(self):
+        self.queue = getattr(settings, 'AI_TASK_QUEUE', 'deferred')
+        settings.AI_TASK_QUEUE = 'local'
+
+    def tearDown(self):
+        settings.AI_TASK_QUEUE = self.queue
+
+    def test_same_turn_as_end_turn(self):
+
+        from django.core.cache import cache
+
+        moves = ["guest pass", "guest pass"]
+
+        game = GameState.from_dict(game_dict())
+        expected = simplejson.loads(game_master.do_turns(game, moves))
+        expected_game = cached.get_game(1).to_dict()
+
+        game = GameState.from_dict(game_dict())
+        ack = simplejson.loads(background.do_turns(game, moves))
+        self.assertEqual(ack, { 'pending': True, 'base_version': 0 })
+        self.assertEqual(background.get_result(1, 0), None)
+
+        function, args = background.local_tasks[0]
+        self.assertEqual(background.run_local_tasks(), 1)
+
+        got = simplejson.loads(background.get_result(1, 0))
+        for name in ('ai_turn', 'player_draw', 'version', 'digest_before_ai', 'digest_after_ai'):
+            self.assertEqual(got[name], expected[name])
+        self.assertEqual(cached.get_game(1).to_dict(), expected_game)
+
+        # running it again doesn't play the AI's turn twice
+        function(*args)
+        self.assertEqual(cached.get_game(1).to_dict(), expected_game)
+
+    def test_cache_lost_before_the_task(self):
+
+        from django.core.cache import cache
+
+        moves = ["guest pass", "guest pass"]
+
+        game = GameState.from_dict(game_dict())
+        game.pk = 8
+        expected = simplejson.loads(game_master.do_turns(game, moves))
+        expected_game = cached.get_game(8).to_dict()
+        expected_game['pk'] = 7
+
+        # the snapshot from before the turn is all the datastore has
+        game = GameState.from_dict(game_dict())
+        game.pk = 7
+        cached.save(game)
+
+        background.do_turns(game, moves)
+        cache.delete("match_7")
+        self.assertEqual(background.run_local_tasks(), 1)
+
+        got = simplejson.loads(background.get_result(7, 0))
+        for name in ('ai_turn', 'player_draw', 'version', 'digest_before_ai', 'digest_after_ai'):
+            self.assertEqual(got[name], expected[name])
+        self.assertEqual(cached.get_game(7).to_dict(), expected_game)
+
+    def test_log_chunks_in_turn_order(self):
+
+        from d_game.models import MatchLogChunk
+
+        game = GameState.from_dict(game_dict())
+        game.pk = 6
+        background.do_turns(game, ["guest pass", "guest pass"])
+        background.run_local_tasks()
+
+        # both halves of the turn can land in the same instant, newest first
+        chunks = list(MatchLogChunk.objects.filter(match=6))
+        self.assertEqual([chunk.sequence for chunk in chunks], [1, 0])
+
+    def test_play_on_nobodys_board(self):
+
+        from d_game.match_log import MatchLog
+
+        game = GameState.from_dict(game_dict())
+        game.log = MatchLog(game)
+
+        self.assertEqual(game_master.play(game, 'guest', 1, 'nobody', 0, 0), False)
+        self.assertEqual(game.log.events, [])
+        self.assertEqual(game.to_dict(), GameState.from_dict(game_dict()).to_dict())
+
+
+class PackingTest(TestCase):
+
+    def catalog(self, edits={}):
+        ''' a catalog with the test game's cards in it, except the
+        rubble's. edits is pk -> changed fields '''
+
+        game = GameState.from_dict(game_dict())
+
+        records = {}
+        for card in game.players['guest'].hand + game.players['guest'].library:
+            fields = dict(card.fields)
+            fields.update(edits.get(card.pk, {}))
+            records[card.pk] = CardRecord(card.pk, fields)
+        return CardCatalog(0, records.values())
+
+    def test_round_trip(self):
+
+        game = GameState.from_dict(game_dict())
+        catalog = self.catalog()
+
+        data = packing.pack(game, catalog)
+        again = packing.unpack(simplejson.loads(simplejson.dumps(data)), catalog)
+
+        self.assertEqual(again.to_dict(), game.to_dict())
+        self.assertTrue(again.players['guest'].hand[0] is catalog.get(1))
+
+        # only the rubble's card isn't in the catalog
+        self.assertEqual(simplejson.dumps(data).count('"fields"'), 1)
+
+    def test_edited_cards_stay_as_they_were(self):
+
+        game = GameState.from_dict(game_dict())
+
+        data = packing.pack(game, self.catalog({ 2: { 'attack': 5 } }))
+        again = packing.unpack(data, self.catalog())
+
+        self.assertEqual(again.to_dict(), game.to_dict())
+
+    def test_edits_after_packing_show_up(self):
+
+        game = GameState.from_dict(game_dict())
+        data = packing.pack(game, self.catalog())
+
+        again = packing.unpack(data, self.catalog({ 2: { 'attack': 5 } }))
+        self.assertEqual(again.players['guest'].hand[1].attack, 5)
+        self.assertNotEqual(again.to_dict(), game.to_dict())
+
+    def test_missing_cards(self):
+
+        game = GameState.from_dict(game_dict())
+        catalog = self.catalog()
+        data = packing.pack(game, catalog)
+
+        del catalog.records[3]
+        self.assertRaises(KeyError, packing.unpack, data, catalog)
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        from d_game.models import GameSnapshot
+        GameSnapshot.objects.all().delete()
+
+        self.turns = snapshots.get_turns()
+        self.queue = getattr(settings, 'AI_TASK_QUEUE', 'deferred')
+        settings.AI_TASK_QUEUE = 'local'
+
+    def tearDown(self):
+        settings.GAME_SNAPSHOT_TURNS = self.turns
+        settings.AI_TASK_QUEUE = self.queue
+
+    def test_restored_after_eviction(self):
+
+        from django.core.cache import cache
+
+        settings.GAME_SNAPSHOT_TURNS = 1
+
+        game = GameState.from_dict(game_dict())
+        game.version = 3
+        cached.save(game)
+
+        cache.delete("match_1")
+        self.assertEqual(cached.get_game(1).to_dict(), game.to_dict())
+
+    def test_every_few_turns(self):
+
+        settings.GAME_SNAPSHOT_TURNS = 2
+
+        game = GameState.from_dict(game_dict())
+        for version in (2, 3):
+            game.version = version
+            cached.save(game)
+
+        self.assertEqual(snapshots.restore(1).version, 2)
+
+    def test_never_goes_back(self):
+
+        game = GameState.from_dict(game_dict())
+        game.version = 5
+        snapshots.write(1, 5, snapshots.encode(game))
+
+        game.version = 4
+        snapshots.write(1, 4, snapshots.encode(game))
+
+        self.assertEqual(snapshots.restore(1).version, 5)
+
+
+class ParallelTest(TestCase):
+
+    def setUp(self):
+        self.min_candidates = parallel.get_min_candidates()
+        settings.AI_PARALLEL_MIN_CANDIDATES = 1
+
+    def tearDown(self):
+        settings.AI_PARALLEL_MIN_CANDIDATES = self.min_candidates
+
+    def test_same_as_serial(self):
+
+        game = GameState.from_dict(game_dict())
+        turns = ai.get_all_possible_turns(game, 'guest')
+
+        best = parallel.evaluate_turns(game, 'guest', turns, workers=2)
+        self.assertEqual(best, ai.evaluate_turns(game, 'guest', turns))
+
+    def test_pool_is_kept(self):
+
+        game = GameState.from_dict(game_dict())
+        turns = ai.get_all_possible_turns(game, 'guest')
+        parallel.evaluate_turns(game, 'guest', turns, workers=2)
+        pool = parallel.get_pool(2)
+
+        # the same workers score a different game next time
+        game.players['ai'].life = 5
+        turns = ai.get_all_possible_turns(game, 'guest')
+        best = parallel.evaluate_turns(game, 'guest', turns, workers=2)
+        self.assertEqual(best, ai.evaluate_turns(game, 'guest', turns))
+        self.assertTrue(parallel.get_pool(2) is pool)
+
+    def test_serial_without_workers(self):
+
+        game = GameState.from_dict(game_dict())
+        turns = ai.get_all_possible_turns(game, 'guest')
+        self.assertEqual(parallel.evaluate_turns(game, 'guest', turns, workers=0), None)
+
+    def test_pool_before_batch(self):
+
+        workers = parallel.get_workers()
+        batch_min_candidates = batch.get_min_candidates()
+        settings.AI_BATCH_MIN_CANDIDATES = 1
+        try:
+            game = GameState.from_dict(game_dict())
+            expected = ai.evaluate_turns(game, 'guest', ai.get_all_possible_turns(game, 'guest'))
+
+            settings.AI_PARALLEL_WORKERS = 2
+            timings = {}
+            self.assertEqual(list(ai.get_turn(game, 'guest', timings, {})[0]), list(expected[1]))
+            self.assertEqual(timings['workers'], 2)
+            self.assertFalse('batch' in timings)
+
+            # without a pool, batch gets them if there's numpy
+            settings.AI_PARALLEL_WORKERS = 0
+            timings = {}
+            self.assertEqual(list(ai.get_turn(game, 'guest', timings, {})[0]), list(expected[1]))
+            self.assertFalse('workers' in timings)
+            self.assertEqual(timings.get('batch', False), batch.available())
+        finally:
+            settings.AI_PARALLEL_WORKERS = workers
+            settings.AI_BATCH_MIN_CANDIDATES = batch_min_candidates
+
+
+class WeightsTest(TestCase):
+
+    def test_features(self):
+
+        game = GameState.from_dict(game_dict())
+
+        # the AI has a power 1 unit, the guest has some rubble, and
+        # both cards in the guest's hand can be cast
+        self.assertEqual(weights.features(game, 'guest', 'ai'), (0, 1, 10, 10, 3, 0, 1, 0))
+
+    def test_file_round_trip(self):
+
+        import os, tempfile
+
+        fitted = (1, -1.5, 0.25, -0.25, 0.5, 0.125, -1, 1)
+        path = tempfile.mktemp(suffix='.json')
+        try:
+            weights.save(path, fitted, games=3)
+            self.assertEqual(weights.load(path), fitted)
+        finally:
+            os.remove(path)
+
+        # no file, no change
+        self.assertEqual(weights.load(path), weights.load(''))
+
+    def test_fit(self):
+
+        if not batch.available():
+            self.skipTest("numpy is optional")
+
+        rng = random.Random(0)
+        truth = (2, -2, 1, -1, 0.5, 0.25, -1, 1)
+
+        rows = [[rng.randint(0, 10) for name in weights.FEATURES] for i in range(50)]
+        outcomes = [sum([w * x for w, x in zip(truth, row)]) for row in rows]
+
+        # scaled so unit's weight is 1, and whose turn it is doesn't count
+        for w, expected in zip(weights.fit(rows, [outcome + 3 for outcome in outcomes]), truth):
+            self.assertAlmostEqual(w, expected / 2.0)
+
+    def test_problems(self):
+
+        self.assertEqual(weights.problems(weights.load('')), [])
+
+        # a fit from too few games
+        flipped = [-w for w in weights.load('')]
+        found = weights.problems(flipped)
+        self.assertEqual(len(found), len(weights.FEATURES))
+        self.assertTrue(found[0].startswith("unit is -1"))
+
+
+class BatchTest(TestCase):
+
+    ATTACK_TYPES = ('melee', 'ranged', 'flying', 'wall', 'na', 'counterattack')
+
+    def crowded_game(self, rnd):
+        ''' game_dict() with both boards filled in at random, with every
+        attack type, rubble and damaged units '''
+
+        cards = [CardRecord(10 + i, card_dict(10 + i, attack=rnd.randint(0, 3), defense=rnd.randint(1, 3),
+                attack_type=attack_type, rubble_duration=rnd.randint(0, 2))['fields'])
+                for i, attack_type in enumerate(self.ATTACK_TYPES)]
+
+        game = GameState.from_dict(game_dict())
+        for name in game.players:
+            p = game.players[name]
+            p.life = rnd.randint(1, 5)
+            p.hand.extend([rnd.choice(cards) for i in range(2)])
+            for i in range(len(NODES)):
+                p.board[i] = None
+                roll = rnd.random()
+                if roll < 0.5:
+                    card = rnd.choice(cards)
+                    p.board[i] = Unit(card, name, NODES[i][0], NODES[i][1],
+                            damage=rnd.randint(0, card.defense - 1), attack_delay=rnd.randint(0, 1))
+                elif roll < 0.65:
+                    p.board[i] = Unit(rnd.choice(cards), name, NODES[i][0], NODES[i][1], type='rubble')
+
+        return game
+
+    def test_same_scores_as_serial(self):
+
+        if not batch.available():
+            self.skipTest("numpy is optional")
+
+        rnd = random.Random(0)
+        games = [GameState.from_dict(game_dict())] + [self.crowded_game(rnd) for i in range(20)]
+
+        for game in games:
+            for goal in ('kill player', 'kill units'):
+                game.goal = goal
+                turns = ai.get_all_possible_turns(game, 'guest')
+
+                serial = []
+                best = ai.evaluate_turns(game, 'guest', turns, scores=serial)
+
+                batched = []
+                self.assertEqual(batch.evaluate_turns(game, 'guest', turns, scores=batched, min_candidates=0), best)
+                self.assertEqual(batched, serial)
+
+    def test_only_as_many_turns_as_it_takes(self):
+
+        if not batch.available():
+            self.skipTest("numpy is optional")
+
+        game = GameState.from_dict(game_dict())
+        candidates = len(ai.get_all_possible_turns(game, 'guest'))
+
+        min_candidates = batch.get_min_candidates()
+        try:
+            # just long enough for a batch, and one short
+            settings.AI_BATCH_MIN_CANDIDATES = candidates
+            timings = {}
+            ai.get_turn(game, 'guest', timings, {})
+            self.assertTrue(timings.get('batch'))
+            self.assertEqual(timings['candidates'], candidates)
+
+            settings.AI_BATCH_MIN_CANDIDATES = candidates + 1
+            timings = {}
+            ai.get_turn(game, 'guest', timings, {})
+            self.assertFalse('batch' in timings)
+            self.assertEqual(timings['candidates'], candidates)
+        finally:
+            settings.AI_BATCH_MIN_CANDIDATES = min_candidates
@@ -2,7 +2,7 @@ import logging
 import simplejson
 from random import random
 
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
 from django.shortcuts import render_to_response
 from django.core import serializers
 from django.template import RequestContext
@@ -11,7 +11,7 @@ from django.contrib.sessions.backends.db import SessionStore
 
 from d_board.models import Node
 from d_cards.models import Card, Deck
-from d_game.models import Match, Puzzle, PuzzleStartingUnit
+from d_game.models import Match, MatchLogChunk, Puzzle, PuzzleStartingUnit
 from d_game.util import daily_activity
 from d_cards.util import get_deck_from
 from d_feedback.models import PuzzleFeedbackForm
@@ -20,7 +20,11 @@ from d_metrics.models import UserMetrics
 from d_users.util import has_permissions_for
 
 from d_game import cached
-from d_game import game_master, ai, deckgenerator
+from d_game import game_master, ai, deckgenerator, match_log, background, censor
+
+
+# how many requests' worth of match log to show at once
+LOG_CHUNKS_PER_PAGE = 20
 
 
 def log(request, match_id=None):
@@ -29,6 +33,42 @@ def log(request, match_id=None):
         match = Match.objects.get(id=match_id)
     else:
         match = Match.objects.all()[Match.objects.count()-1]
+
+    try:
+        page = int(request.GET.get('page', 0))
+    except ValueError:
+        page = 0
+
+    # newest first, grabbing one extra to see if there's another page
+    start = page * LOG_CHUNKS_PER_PAGE
+    chunks = list(MatchLogChunk.objects.filter(match=match)[start:start + LOG_CHUNKS_PER_PAGE + 1])
+    has_next = len(chunks) > LOG_CHUNKS_PER_PAGE
+    chunks = chunks[:LOG_CHUNKS_PER_PAGE]
+
+    names = {}
+    def card_name(pk):
+        if pk not in names:
+            card = cached.get_card_record(pk)
+            if card:
+                names[pk] = card.name
+            else:
+                names[pk] = "#%s" % pk
+        return names[pk]
+
+    texts = []
+    for chunk in chunks:
+        players, events = match_log.decode(chunk.data)
+        texts.append("---- %s ----\n%s\n" % (chunk.timestamp, match_log.render(players, events, card_name)))
+    log_text = "\n".join(texts)
+
+    # matches from before the event log only have the old text log,
+    # which goes after the oldest events
+    if not has_next:
+        log_text = "".join([log_text, match.log])
+
+    previous_page = page - 1
+    next_page = page + 1
+
     return render_to_response("match_log.html", locals()) 
 
 
@@ -143,28 +183,75 @@ def end_turn(request):
     # get player's actions from requests
     player_moves = request.POST.get("player_turn").strip().split('\n')
     if not player_moves:
-        player_moves = ["pass %s" % game['player'], "pass %s" % game['player']] 
+        player_moves = ["pass %s" % game.player, "pass %s" % game.player] 
 
-    # process the game turn and get data to give back to client
-    hand_and_turn_json = game_master.do_turns(game, player_moves) 
+    # process the game turn and get data to give back to client. the
+    # AI's half can be left to a task, see d_game.background
+    if background.is_deferred():
+        hand_and_turn_json = background.do_turns(game, player_moves)
+    else:
+        hand_and_turn_json = game_master.do_turns(game, player_moves) 
 
     # did the game end this turn?
     winner = game_master.is_game_over(game)
     if winner:
-        match = Match.objects.get(id=match_id)
-        logging.info("))))) trying to set winner: %s for %s" % (winner, match.puzzle))
-        if match.puzzle:
-            if request.user.is_authenticated():
-                request.user.get_profile().beaten_puzzle_ids.append(match.puzzle.id)
-                request.user.get_profile().save()
-        match.winner = winner 
-
-        return HttpResponse("game over, winner: %s" % winner)
+        return game_over(request, match_id, winner)
 
     # send appropriate hand & AI info back to client
     return HttpResponse(hand_and_turn_json, "application/javascript")
 
 
+def ai_turn(request):
+
+    # what end_turn would have sent back, once the AI's task is done.
+    # answers straight away either way, and the client waits a little
+    # longer each time before asking again
+    match_id = request.session.get('match')
+    try:
+        base_version = int(request.GET['base_version'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("base_version should be the version end_turn sent back")
+    if match_id is None:
+        return HttpResponseBadRequest("no match in progress")
+
+    background.run_local_tasks()
+
+    data = background.get_result(match_id, base_version)
+    if data is None:
+        return HttpResponse(simplejson.dumps({ 'pending': True }), "application/javascript")
+    if not data:
+        return HttpResponse(simplejson.dumps({ 'resync': True }), "application/javascript")
+
+    game = cached.get_game(match_id)
+    winner = game_master.is_game_over(game)
+    if winner:
+        return game_over(request, match_id, winner)
+
+    return HttpResponse(data, "application/javascript")
+
+
+def game_over(request, match_id, winner):
+
+    match = Match.objects.get(id=match_id)
+    logging.info("))))) trying to set winner: %s for %s" % (winner, match.puzzle))
+    if match.puzzle:
+        if request.user.is_authenticated():
+            request.user.get_profile().beaten_puzzle_ids.append(match.puzzle.id)
+            request.user.get_profile().save()
+    match.winner = winner 
+
+    return HttpResponse("game over, winner: %s" % winner)
+
+
+def resync(request):
+
+    # the whole game, for a client whose version doesn't match the
+    # deltas it was sent
+    game = cached.get_game(request.session['match'])
+
+    return HttpResponse(censor.censored_json(game, game.player), "application/javascript")
+
+
 
 
 def first_turn(request):
@@ -191,10 +278,8 @@ def begin_ai_game(request):
     hand = game_master.draw_up_to(game, player_name, 5)
 
     cached.save(game)
-    censored = game_master.get_censored(game, player_name)
-    game = cached.get_game(match.id)
 
-    return HttpResponse(simplejson.dumps(censored), "application/javascript")
+    return HttpResponse(censor.censored_json(game, player_name), "application/javascript")
 
 
 def begin_puzzle_game(request):
@@ -210,15 +295,14 @@ def begin_puzzle_game(request):
     hand = game_master.draw_up_to(game, player_name, 5)
 
     # init puzzle life
-    game['players'][player_name]['life'] = match.puzzle.player_life
+    game_master.get_player(game, player_name).life = match.puzzle.player_life
 
     # puzzle starting units
     starting_units = PuzzleStartingUnit.objects.filter(puzzle=match.puzzle)
 
     for starting_unit in starting_units:
-        game_master.play(game, 'ai', starting_unit.unit_card.pk, 'ai', starting_unit.location.row, starting_unit.location.x, ignore_hand=True)
+        game_master.play(game, 'ai', starting_unit.unit_card.pk, 'ai', starting_unit.location.row, starting_unit.location.x, ignore_constraints=True)
 
     cached.save(game) 
-    censored = game_master.get_censored(game, player_name)
 
-    return HttpResponse(simplejson.dumps(censored), "application/javascript")
+    return HttpResponse(censor.censored_json(game, player_name), "application/javascript")
@@ -0,0 +1,223 @@
+""" The weights ai.heuristic() puts on what it sees.
+
+heuristic() boils a position down to a few numbers, from the point of
+view of the player choosing a turn (see features()):
+
+    unit              total unit_power_level of their units
+    opponent_unit     and of the opponent's
+    life              their life
+    opponent_life     the opponent's
+    castable          total tech level of the cards in hand they can cast
+    almost_castable   and of the ones that need one more tech
+    rubble            how many of their nodes are rubble
+    opponent_rubble   how many of the opponent's are
+
+and the score is those times the weights, plus or minus ai.GAME_OVER
+if somebody's dead. The weights used to be picked by hand (DEFAULTS).
+Better ones can be fitted from self-play with
+
+    python manage.py fit_weights --games 200
+
+which plays matches with the simulator, records every position along
+the way with how the match turned out for whoever's turn it was, and
+fits the weights to that by least squares (see fit()). A short run can
+fit nonsense, e.g. units counting against you, so weights that disagree
+with DEFAULTS about which way any feature points (see problems()) aren't
+written unless you insist. Otherwise it writes them to a json file, and settings.AI_WEIGHTS_FILE says which file, if any,
+the AI loads when it starts up. Without one it uses DEFAULTS. """
+
+import os
+import zlib
+import simplejson
+
+from django.conf import settings
+
+
+# ai.heuristic() spells these out one by one, so it needs to know about
+# any new ones
+FEATURES = ('unit', 'opponent_unit', 'life', 'opponent_life',
+        'castable', 'almost_castable', 'rubble', 'opponent_rubble')
+
+# the hand-picked weights
+DEFAULTS = {
+    'unit': 1,
+    'opponent_unit': -1.1,
+    'life': 0.4,
+    'opponent_life': -0.4,
+    'castable': 0.2,
+    'almost_castable': 0.1,
+    'rubble': -0.33,
+    'opponent_rubble': 0.33,
+}
+
+
+def features(game, player, opponent):
+    ''' the numbers heuristic() weighs up, in FEATURES order. one pass
+    over each board, rather than looking for each kind of thing '''
+
+    p = game.players[player]
+    o = game.players[opponent]
+
+    unit = rubble = 0
+    for node in p.board:
+        if node is not None:
+            if node.type == 'unit':
+                unit += node.card.unit_power_level
+            else:
+                rubble += 1
+
+    opponent_unit = opponent_rubble = 0
+    for node in o.board:
+        if node is not None:
+            if node.type == 'unit':
+                opponent_unit += node.card.unit_power_level
+            else:
+                opponent_rubble += 1
+
+    castable, almost_castable = hand_features(p)
+
+    return (unit, opponent_unit, p.life, o.life,
+            castable, almost_castable, rubble, opponent_rubble)
+
+
+def hand_features(p):
+    ''' castable and almost_castable for a PlayerState '''
+
+    # cards you can cast are worth a bit of potential, and cards you
+    # can almost cast a little less
+    castable = almost_castable = 0
+    tech = p.tech
+    for card in p.hand:
+        card_tech = card.tech_level
+        if card_tech <= tech:
+            castable += card_tech
+        elif card_tech == 1 + tech:
+            almost_castable += card_tech
+
+    return castable, almost_castable
+
+
+def get_path():
+    return getattr(settings, 'AI_WEIGHTS_FILE', None)
+
+
+def load(path=None):
+    ''' the weights in path (or settings.AI_WEIGHTS_FILE), in FEATURES
+    order. anything the file doesn't mention keeps its default '''
+
+    if path is None:
+        path = get_path()
+
+    weights = dict(DEFAULTS)
+    if path and os.path.exists(path):
+        f = open(path)
+        try:
+            weights.update(simplejson.load(f)['weights'])
+        finally:
+            f.close()
+
+    return tuple([weights[name] for name in FEATURES])
+
+
+def save(path, weights, **info):
+    ''' writes weights (in FEATURES order) to path, along with anything
+    in info, e.g. how they were fitted '''
+
+    data = dict(info)
+    data['weights'] = dict(zip(FEATURES, [float(w) for w in weights]))
+
+    f = open(path, 'w')
+    try:
+        simplejson.dump(data, f, sort_keys=True, indent=4)
+    finally:
+        f.close()
+
+
+def key(weights):
+    ''' short text that changes when the weights do, for cache keys '''
+    return "%08x" % (zlib.crc32(repr(tuple(weights))) & 0xffffffff)
+
+
+def fit(rows, outcomes, anchor='unit'):
+    ''' Least squares weights for rows of features against outcomes (1
+    for a position the player went on to win, -1 for one they lost).
+    There's a constant term in the fit, for anything that's down to
+    whose turn it is rather than the position, but it's left out of the
+    weights since heuristic() only ever compares positions for the same
+    player. The fitted weights are only right up to scale, so they're
+    scaled to put anchor's weight where it is in DEFAULTS, keeping them
+    in proportion to ai.GAME_OVER. If anchor's weight comes out 0 or
+    less they're left as they are, and problems() says so. Needs
+    numpy. '''
+
+    import numpy
+
+    x = numpy.array(rows, dtype=float)
+    y = numpy.array(outcomes, dtype=float)
+
+    x = numpy.hstack([x, numpy.ones((len(x), 1))])
+    weights = numpy.linalg.lstsq(x, y, rcond=None)[0][:-1]
+
+    i = FEATURES.index(anchor)
+    if weights[i] > 0:
+        weights = weights * (DEFAULTS[anchor] / weights[i])
+
+    return tuple([float(w) for w in weights])
+
+
+def problems(weights, anchor='unit'):
+    ''' what's wrong with weights (in FEATURES order), as a list of
+    text: anchor's weight isn't positive, or a feature's weight has the
+    opposite sign to its default '''
+
+    found = []
+    for name, w in zip(FEATURES, weights):
+        if name == anchor and w <= 0:
+            found.append("%s is %s, it should be more than 0" % (name, w))
+        elif w * DEFAULTS[name] < 0:
+            found.append("%s is %s, but its default is %s" % (name, w, DEFAULTS[name]))
+    return found
+
+
+def self_play(games=100, seed=0, guest='ai', budget=None, max_turns=None):
+    ''' Training data from games simulated matches (see
+    d_game.simulator, whose catalog needs pinning first): (rows of
+    features, outcomes, matches nobody won). guest is 'ai' or 'random',
+    like the selfplay command, and budget goes to ai.get_turn. '''
+
+    import random
+    from d_game import simulator, game_master
+
+    if max_turns is None:
+        max_turns = simulator.MAX_TURNS
+
+    rows = []
+    outcomes = []
+    unfinished = 0
+
+    for i in range(games):
+        if guest == 'random':
+            guest_policy = simulator.random_policy(random.Random(seed + i))
+        else:
+            guest_policy = simulator.ai_policy(budget=budget)
+
+        policies = {
+                game_master.ANON_PLAYER_NAME: guest_policy,
+                'ai': simulator.ai_policy(budget=budget),
+            }
+
+        positions = []
+        winner, played = simulator.play_match(policies, seed + i, max_turns=max_turns, positions=positions)
+        if winner is None:
+            unfinished += 1
+            continue
+
+        for player, row in positions:
+            rows.append(row)
+            outcomes.append(player == winner and 1 or -1)
+
+    return rows, outcomes, unfinished
+
+
+WEIGHTS = load()
+WEIGHTS_KEY = key(WEIGHTS)
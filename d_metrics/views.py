@@ -1,8 +1,9 @@
 import logging
+import simplejson
 
 from django.shortcuts import render_to_response
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 
 from settings import VERSION
 
@@ -27,6 +28,20 @@ def user_metrics(request):
     return render_to_response("metrics/users.html", locals())
 
 
+def ai_metrics(request):
+
+    # the AI's timers and counters, when settings.AI_PROFILE_SINK is
+    # 'cache' (see d_game.profiling)
+    if not request.user.is_staff:
+        return HttpResponseRedirect("/")
+
+    from d_game import profiling
+
+    summary = profiling.CacheSink().summary()
+
+    return HttpResponse(simplejson.dumps(summary, sort_keys=True, indent=2), "application/javascript")
+
+
 def cache_user_metrics(request): 
 
     for metrics in UserMetrics.objects.all():
@@ -0,0 +1,83 @@
+// The same 64 bit digest of the game as d_game/digest.py, worked out
+// from scratch from our copy of the game. It's kept as two 32 bit
+// halves since javascript can't do 64 bit integers, and compared as
+// the same 16 character hex string the server sends.
+
+var DIGEST_SEED_HI = 0x9e3779b9;
+var DIGEST_SEED_LO = 0x7f4a7c15;
+
+var DIGEST_PLAYER = 1;
+var DIGEST_NODE = 2;
+
+var DIGEST_PLAYER_FIELDS = ['life', 'tech', 'current_tech', 'tech_ups_remaining_this_turn'];
+var DIGEST_NODE_TYPES = { 'unit': 1, 'rubble': 2 };
+
+// 32 bit multiply, which plain * gets wrong once the product
+// goes past 2^53
+function mul32(a, b) {
+    var a_lo = a & 0xffff;
+    var a_hi = a >>> 16;
+    return ((a_lo * b) + (((a_hi * b) & 0xffff) << 16)) >>> 0;
+}
+
+function hash32(values, seed) {
+
+    var h = seed >>> 0;
+    for (var i = 0; i < values.length; i ++) {
+        h = mul32((h ^ values[i]) >>> 0, 0x01000193);
+    }
+
+    h = (h ^ (h >>> 16)) >>> 0;
+    h = mul32(h, 0x85ebca6b);
+    h = (h ^ (h >>> 13)) >>> 0;
+    h = mul32(h, 0xc2b2ae35);
+    h = (h ^ (h >>> 16)) >>> 0;
+    return h;
+}
+
+function hex32(n) {
+    var s = n.toString(16);
+    while (s.length < 8) {
+        s = "0" + s;
+    }
+    return s;
+}
+
+function game_digest(game) {
+
+    var hi = 0;
+    var lo = 0;
+
+    function add(values) {
+        hi = (hi ^ hash32(values, DIGEST_SEED_HI)) >>> 0;
+        lo = (lo ^ hash32(values, DIGEST_SEED_LO)) >>> 0;
+    }
+
+    for (var player in game['players']) {
+        var side = (player == game['player']) ? 0 : 1;
+        var p = game['players'][player];
+
+        for (var i = 0; i < DIGEST_PLAYER_FIELDS.length; i ++) {
+            add([DIGEST_PLAYER, side, i, parseInt(p[DIGEST_PLAYER_FIELDS[i]])]);
+        }
+
+        // nodes are numbered row by row, same as d_board/topology.py
+        var index = 0;
+        for (var row = 0; row < 3; row ++) {
+            for (var x = -row; x < row + 1; x ++) {
+                var node = get_node(game, player, row, x);
+                if (node && DIGEST_NODE_TYPES[node['type']]) {
+                    add([DIGEST_NODE, side, index,
+                        DIGEST_NODE_TYPES[node['type']],
+                        parseInt(node['pk']),
+                        parseInt(node['damage'] || 0),
+                        parseInt(node['attack_delay'] || 0),
+                        parseInt(node['fields']['rubble_duration'])]);
+                }
+                index ++;
+            }
+        }
+    }
+
+    return hex32(hi) + hex32(lo);
+}
@@ -100,14 +100,208 @@ function end_player_turn_consumable_resources(game, player) {
                 return;
             }
 
-            //do AI turn 
-            do_turn(game, opponent_name, turn_data['ai_turn']);
-            do_player_turn_consumable_resources(game, player_name, turn_data['player_draw']);
+            // the server might still be working out the AI's turn, in
+            // which case ask for it until it's done
+            if (turn_data['pending']) {
+                poll_ai_turn(game, turn_data['base_version'], AI_TURN_POLL_DELAY);
+            }
+            else {
+                do_ai_turn(game, turn_data);
+            }
         }
     ); 
     $("textarea[name='player_turn']").val("");
 }
 
+// how long (in ms) to wait before asking for the AI's turn again, at
+// first and at most. the wait doubles each time it's still pending
+var AI_TURN_POLL_DELAY = 250;
+var AI_TURN_POLL_MAX_DELAY = 4000;
+
+// see d_game/background.py
+function poll_ai_turn(game, base_version, delay) {
+
+    // the AI's turn got lost on the way, so just fetch the game as it
+    // is now, new cards and all
+    function lost() {
+        resync(game, function() {
+            do_player_turn_consumable_resources(game, player_name, []);
+        });
+    }
+
+    setTimeout(function() {
+        $.ajax({ url: "/playing/ai_turn/",
+            data: { 'base_version': base_version },
+            success: function(data) {
+                try {
+                    turn_data = eval('(' + data + ')');
+                } catch (error) {
+                    lost();
+                    return;
+                }
+
+                if (turn_data['pending']) {
+                    poll_ai_turn(game, base_version, Math.min(delay * 2, AI_TURN_POLL_MAX_DELAY));
+                }
+                else if (turn_data['resync']) {
+                    lost();
+                }
+                else {
+                    do_ai_turn(game, turn_data);
+                }
+            },
+            error: lost
+        });
+    }, delay);
+}
+
+function do_ai_turn(game, turn_data) {
+
+    if (game_digest(game) != turn_data['digest_before_ai']) {
+        $(".debug").text("out of sync before ai turn\n" + $(".debug").text());
+    }
+
+    //do AI turn 
+    do_turn(game, opponent_name, turn_data['ai_turn']);
+
+    // the server's word is final, so patch up anything our
+    // copy of the turn got wrong. if we've missed an update
+    // the deltas won't line up, and if we still don't agree
+    // afterwards something's badly off, so fetch everything
+    if (game['version'] == turn_data['base_version']) {
+        apply_deltas(game, turn_data['deltas']);
+        game['version'] = turn_data['version'];
+    }
+
+    if (game['version'] == turn_data['version'] && game_digest(game) == turn_data['digest_after_ai']) {
+        do_player_turn_consumable_resources(game, player_name, turn_data['player_draw']);
+    }
+    else {
+        resync(game, function() {
+            // the server's hand already has the new cards in it
+            var hand = get_player(game, player_name)['hand'];
+            hand.splice(hand.length - turn_data['player_draw'].length, turn_data['player_draw'].length);
+            do_player_turn_consumable_resources(game, player_name, turn_data['player_draw']);
+        });
+    }
+}
+
+// see d_game/delta.py for the format
+var DELTA_PLAYER = 'pl';
+var DELTA_NODE = 'no';
+var DELTA_HAND = 'ha';
+var DELTA_LIBRARY = 'li';
+
+function apply_deltas(game, deltas) {
+
+    for (var i = 0; i < deltas.length; i ++) {
+        var delta = deltas[i];
+        var kind = delta[0];
+        var player = delta[1];
+
+        if (kind == DELTA_PLAYER) {
+            var field = delta[2];
+            var value = delta[3];
+            var old_value = get_player(game, player)[field];
+            get_player(game, player)[field] = value;
+
+            if (field == 'life' && old_value != value) {
+                qfx({
+                        'action': 'damage_player',
+                        'target': player,
+                        'delta': old_value - value
+                });
+            }
+        }
+
+        else if (kind == DELTA_NODE) {
+            var loc = delta[2].split('_');
+            apply_node(game, player, parseInt(loc[0]), parseInt(loc[1]), delta[3]);
+        }
+
+        else if (kind == DELTA_HAND) {
+            get_player(game, player)['hand'] = delta[2];
+        }
+
+        else if (kind == DELTA_LIBRARY) {
+            get_player(game, player)['library'] = delta[2];
+        }
+    }
+}
+
+function apply_node(game, player, row, x, server_node) {
+
+    var node = get_node(game, player, row, x);
+    var node_type = (node && node['type']) ? node['type'] : 'empty';
+    var server_type = (server_node && server_node['type']) ? server_node['type'] : 'empty';
+
+    if (node_type == 'empty' && server_type == 'empty') {
+        return;
+    }
+
+    if (server_type == 'empty') {
+        get_board(game, player)[row + "_" + x] = {};
+        qfx({
+                'action': (node_type == 'rubble' ? 'remove_rubble' : 'remove_unit'),
+                'target': { 'player': player, 'row': row, 'x': x }
+        });
+    }
+    else if (node_type != server_type || node['pk'] != server_node['pk']) {
+        set_node(game, player, row, x, server_node);
+    }
+    else {
+        // same unit, just bring its numbers up to date
+        var more_damage = server_node['damage'] - node['damage'];
+        node['damage'] = server_node['damage'];
+        node['attack_delay'] = server_node['attack_delay'];
+        node['fields'] = server_node['fields'];
+
+        if (more_damage > 0) {
+            qfx({
+                    'action': 'damage_unit',
+                    'target': node,
+                    'delta': more_damage
+            });
+        }
+        else if (more_damage < 0) {
+            qfx({
+                    'action': 'heal_unit',
+                    'target': node,
+                    'delta': -more_damage
+            });
+        }
+    }
+}
+
+function resync(game, callback) {
+
+    $.ajax({ url: "/playing/resync/",
+            success: function(data) {
+                var server_game = eval('(' + data + ')');
+
+                // treat the whole game as one big delta
+                var deltas = [];
+                for (var player in server_game['players']) {
+                    var p = server_game['players'][player];
+                    var fields = ['life', 'tech', 'current_tech', 'tech_ups_remaining_this_turn', 'num_to_draw'];
+                    for (var i = 0; i < fields.length; i ++) {
+                        deltas.push([DELTA_PLAYER, player, fields[i], p[fields[i]]]);
+                    }
+                    for (var key in p['board']) {
+                        deltas.push([DELTA_NODE, player, key, p['board'][key]]);
+                    }
+                    deltas.push([DELTA_HAND, player, p['hand']]);
+                    deltas.push([DELTA_LIBRARY, player, p['library']]);
+                }
+
+                apply_deltas(game, deltas);
+                game['version'] = server_game['version'];
+
+                callback();
+            }
+    });
+}
+
 function do_turn(game, player, moves) { 
 
     game['current_phase'] = 5; 
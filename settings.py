@@ -121,3 +121,65 @@ AUTHENTICATION_BACKENDS = (
 AUTH_PROFILE_MODULE = 'd_users.UserProfile'
 
 LOGIN_REDIRECT_URL = "/"
+
+# fraction of turns which get board snapshots in the match log (see
+# d_game.match_log). 1 logs every turn and 0 turns snapshots off.
+if on_production_server:
+    MATCH_LOG_SNAPSHOT_RATE = 0.1
+else:
+    MATCH_LOG_SNAPSHOT_RATE = 1.0
+
+# how long the AI gets to think, per match type (see d_game.search).
+# match types without a budget try every candidate turn, which is the
+# default for all of them. a budget turns on the beam search, e.g.
+# 'ai': { 'seconds': 3, 'nodes': 20000, 'beam': 64 }, where beam is how
+# many partial turns to keep at each depth (None for all of them). a
+# budget with 'engine': 'alphabeta' gets the two-ply search in
+# d_game.minimax instead, e.g. { 'engine': 'alphabeta', 'width': 8, 'seconds': 3 }.
+# puzzles are best left out, so they keep their one right answer
+AI_SEARCH_BUDGETS = {}
+
+# processes to score AI candidates on (see d_game.parallel). App Engine
+# can't start any, so it's off here; the simulator and benchmarks can
+# turn it on with --workers. with 2 or more, lists of at least
+# AI_PARALLEL_MIN_CANDIDATES go to the pool before anything else, and
+# the workers batch their chunks with numpy if they can
+AI_PARALLEL_WORKERS = 0
+AI_PARALLEL_MIN_CANDIDATES = 2000
+
+# candidates it takes before the AI scores them in one go with numpy
+# (see d_game.batch), if numpy is there at all and the pool hasn't
+# taken them. None never does.
+AI_BATCH_MIN_CANDIDATES = 200
+
+# match types whose AI decisions get remembered per position (see
+# d_game.decisions). only worth it where positions repeat.
+AI_DECISION_CACHE_TYPES = ('puzzle',)
+
+# where the AI's timers and counters go (see d_game.profiling): None,
+# 'logging', 'memory', 'cache' (shown at /admin/metrics/ai/) or the
+# path of a sink class. 'cache' costs a couple of memcache calls per
+# number per turn
+if on_production_server:
+    AI_PROFILE_SINK = None
+else:
+    AI_PROFILE_SINK = 'logging'
+
+# whether end_turn leaves the AI's turn to a task for the client to
+# collect from /playing/ai_turn/ (see d_game.background). the task goes
+# on App Engine's deferred queue, or AI_TASK_QUEUE = 'local' runs it
+# in-process when the client asks. the local queue is only in the
+# process that ran end_turn, so it needs a server with just the one
+# process (runserver, tests)
+AI_DEFERRED_TURNS = False
+AI_TASK_QUEUE = 'deferred'
+
+# heuristic weights fitted by manage.py fit_weights (see d_game.weights),
+# loaded when the AI starts up. the hand-picked ones are used if the
+# file isn't there
+AI_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'd_game', 'ai_weights.json')
+
+# how many versions apart games get written to the datastore as
+# snapshots, to restore from when memcache loses them (see
+# d_game.snapshots). 1 is every turn, 0 never
+GAME_SNAPSHOT_TURNS = 1
@@ -24,6 +24,7 @@ urlpatterns = patterns('',
     (r'^accounts/register/$', 'd_users.views.register'),
 
     (r'^admin/doc/', include('django.contrib.admindocs.urls')),
+    (r'^admin/metrics/ai/$', 'd_metrics.views.ai_metrics'),
     (r'^admin/metrics/', 'd_metrics.views.user_metrics'),
     (r'^admin/reset_card_images/', 'card_builder.views.reset_card_images'),
     (r'^admin/', include(admin.site.urls)),
@@ -39,6 +40,8 @@ urlpatterns = patterns('',
 
     ('^playing/first_turn/$', 'd_game.views.first_turn'),
     ('^playing/end_turn/$', 'd_game.views.end_turn'),
+    ('^playing/ai_turn/$', 'd_game.views.ai_turn'),
+    ('^playing/resync/$', 'd_game.views.resync'),
     ('^play/$', 'd_game.views.playing'),
 
     ('^puzzle/$', 'd_game.views.puzzle'),
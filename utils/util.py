@@ -1,26 +1,13 @@
 from random import choice
 import string
 
-import cPickle
-
-from django.core.cache import cache
-
-def deepish_copy(to_copy):
-
-    c = cache.get("%s" % to_copy)
-    if not c:
-        cache.set("%s" % to_copy, to_copy)
-        c = cache.get("%s" % to_copy)
-    return c 
-    
-    # surpringly, this is actually 1-3x faster than deepcopy.
-    # will obviously destroy everything if multiple threads
-    # are running, so probably not a good think to bake in
-    # cache.set("%s", to_copy)
-    # return cache.get("temp") 
-
-    # cpickle is not performing any faster than regular old deepcopy
-    # return cPickle.loads(cPickle.dumps(to_copy, -1))
+try:
+    from google.appengine.ext.db import run_in_transaction
+except ImportError:
+    # outside App Engine (tests, scripts) the datastore is local to
+    # the one process, so there's nobody to race with
+    def run_in_transaction(function, *args, **kwargs):
+        return function(*args, **kwargs)
 
 
 def one_level_deepcopy(to_copy):